@@ -0,0 +1,181 @@
+#-----------------------------------------------------------------------------
+# This file is part of the 'lcls2-pgp-pcie-apps'. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the 'lcls2-pgp-pcie-apps', including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+import asyncio
+import collections
+import pickle
+
+import zmq
+import zmq.asyncio
+
+class AsyncRootClient:
+    # asyncio client for the DevRoot ZmqServer request port (server port + 1),
+    # speaking the same pickled {'path', 'attr', 'args', 'kwargs'} requests
+    # as pyrogue's ZmqClient. The socket is a DEALER, so any number of
+    # requests can be in flight at once: the server answers them in order
+    # and each reply resolves the oldest pending future. One event loop can
+    # drive many nodes with one socket and no thread per node:
+    #
+    #   async with AsyncRootClient('node1', 9099) as a, AsyncRootClient('node2', 9099) as b:
+    #       await asyncio.gather(a.startRun(), b.startRun())
+    #
+    # Paths may be given with or without the leading root name. A request that
+    # raises on the server raises the same exception here. A timeout fails
+    # every pending request and closes the connection, since the replies
+    # could no longer be matched to their requests.
+    def __init__(self, addr='localhost', port=9099, root='DevRoot', timeout=60.0, context=None):
+        self.addr    = addr
+        self.port    = port
+        self.root    = root
+        self.timeout = timeout
+
+        self._ctx     = context or zmq.asyncio.Context.instance()
+        self._sock    = None
+        self._pending = collections.deque()
+        self._reader  = None
+        self._error   = None
+
+    @property
+    def address(self):
+        return f'{self.addr}:{self.port}'
+
+    async def connect(self):
+        if self._sock is not None:
+            return
+        self._sock = self._ctx.socket(zmq.DEALER)
+        self._sock.setsockopt(zmq.LINGER, 0)
+        self._sock.connect(f'tcp://{self.addr}:{self.port+1}')
+        self._error  = None
+        self._reader = asyncio.get_running_loop().create_task(self._readLoop())
+
+    async def close(self):
+        if self._sock is None:
+            return
+        self._fail(ConnectionError(f'{self.address}: connection closed'))
+        self._reader.cancel()
+        try:
+            await self._reader
+        except asyncio.CancelledError:
+            pass
+        self._sock.close()
+        self._sock   = None
+        self._reader = None
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    def _fail(self, exc):
+        self._error = exc
+        while self._pending:
+            future = self._pending.popleft()
+            if not future.done():
+                future.set_exception(exc)
+
+    async def _readLoop(self):
+        try:
+            while True:
+                # REP replies are [empty delimiter, pickled result]
+                msg  = await self._sock.recv_multipart()
+                resp = pickle.loads(msg[-1])
+
+                if not self._pending:
+                    continue
+                future = self._pending.popleft()
+                if future.done():
+                    continue
+                if isinstance(resp, Exception):
+                    future.set_exception(resp)
+                else:
+                    future.set_result(resp)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self._fail(e)
+
+    def _path(self, path):
+        return path if path.split('.', 1)[0] == self.root else f'{self.root}.{path}'
+
+    async def request(self, path, attr, *args, **kwargs):
+        # Generic remote call: getattr(root.getNode(path), attr)(*args, **kwargs)
+        if self._sock is None:
+            await self.connect()
+        if self._error is not None:
+            raise self._error
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append(future)
+        await self._sock.send_multipart([b'', pickle.dumps({
+            'path'   : self._path(path),
+            'attr'   : attr,
+            'args'   : args,
+            'kwargs' : kwargs,
+        })])
+
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), self.timeout)
+        except asyncio.TimeoutError:
+            err = TimeoutError(f'{self.address}: no reply to {path}.{attr} in {self.timeout} s')
+            future.cancel()
+            self._fail(err)
+            await self.close()
+            raise err from None
+
+    # Variables
+    async def get(self, path, read=True):
+        return await self.request(path, 'get', read=read)
+
+    async def getDisp(self, path, read=True):
+        return await self.request(path, 'getDisp', read=read)
+
+    async def value(self, path):
+        # Shadow value, no bus transaction
+        return await self.request(path, 'value')
+
+    async def set(self, path, value, write=True):
+        return await self.request(path, 'set', value, write=write)
+
+    async def setDisp(self, path, value, write=True):
+        return await self.request(path, 'setDisp', value, write=write)
+
+    async def getMany(self, paths, read=True):
+        # All reads in flight at once, returns {path: value}
+        values = await asyncio.gather(*[self.get(p, read=read) for p in paths])
+        return dict(zip(paths, values))
+
+    async def setMany(self, values, write=True):
+        # values = {path: value}, all writes in flight at once
+        await asyncio.gather(*[self.set(p, v, write=write) for p, v in values.items()])
+
+    # Commands
+    async def exec(self, path, arg=None):
+        if arg is None:
+            return await self.request(path, '__call__')
+        return await self.request(path, '__call__', arg)
+
+    async def startRun(self):
+        return await self.exec('StartRun')
+
+    async def stopRun(self):
+        return await self.exec('StopRun')
+
+    async def countReset(self):
+        return await self.exec('CountReset')
+
+    async def loadConfig(self, yamlFile):
+        return await self.exec('LoadConfig', yamlFile)
+
+    async def loadConfigDiff(self, yamlFile):
+        return await self.exec('LoadConfigDiff', yamlFile)
+
+    async def runState(self):
+        return await self.value('RunState')
@@ -0,0 +1,99 @@
+#-----------------------------------------------------------------------------
+# This file is part of the 'lcls2-pgp-pcie-apps'. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the 'lcls2-pgp-pcie-apps', including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+import struct
+
+import numpy as np
+
+# AXI stream batcher version 1 super-frame format (surf AxiStreamBatcher, rogue SplitterV1):
+#
+#   Header (padded to the AXI width):
+#     [3:0]   = version (0x1)
+#     [7:4]   = AXI width code, width = 2**(code+1) bytes
+#     [31:16] = sequence count
+#
+#   Each sub-frame is its payload padded to the tail size, followed by a tail
+#   (max(8, AXI width) bytes):
+#     [31:0]  = sub-frame size in bytes
+#     [39:32] = TDEST
+#     [47:40] = first TUSER
+#     [55:48] = last TUSER
+BATCHER_V1_VERSION = 0x1
+
+def batcherV1Sizes(widthBytes):
+    code = int(widthBytes).bit_length() - 2
+    if code < 0 or (2 ** (code + 1)) != widthBytes:
+        raise ValueError(f'Invalid batcher AXI width: {widthBytes} bytes')
+    return code, widthBytes, max(8, widthBytes)
+
+def _asBytes(data):
+    if isinstance(data, np.ndarray):
+        return np.ascontiguousarray(data).view(np.uint8).reshape(-1)
+    return np.frombuffer(data, dtype=np.uint8)
+
+def packSuperFrame(subFrames, sequence=0, widthBytes=16):
+    # subFrames: iterable of (data, dest, firstUser, lastUser) where data is bytes or a uint8 array
+    code, headerSize, tailSize = batcherV1Sizes(widthBytes)
+
+    subFrames = [(_asBytes(data), dest, fUser, lUser) for data, dest, fUser, lUser in subFrames]
+
+    total = headerSize + sum(-(-data.size // tailSize) * tailSize + tailSize for data, _, _, _ in subFrames)
+    buff  = np.zeros(total, dtype=np.uint8)
+
+    buff[0] = BATCHER_V1_VERSION | (code << 4)
+    buff[2] = sequence & 0xFF
+    buff[3] = (sequence >> 8) & 0xFF
+
+    pos = headerSize
+    for data, dest, fUser, lUser in subFrames:
+        buff[pos:pos+data.size] = data
+        pos += -(-data.size // tailSize) * tailSize
+
+        buff[pos:pos+4] = np.frombuffer(int(data.size).to_bytes(4, 'little'), dtype=np.uint8)
+        buff[pos+4] = dest  & 0xFF
+        buff[pos+5] = fUser & 0xFF
+        buff[pos+6] = lUser & 0xFF
+        pos += tailSize
+
+    return buff
+
+# One row per sub-frame of a parsed super-frame
+BATCHER_V1_TABLE_DTYPE = np.dtype([
+    ('offset',    '<u4'), # Byte offset of the sub-frame payload in the super-frame
+    ('size',      '<u4'), # Sub-frame payload size in bytes
+    ('dest',      'u1'),  # TDEST (channel)
+    ('firstUser', 'u1'),
+    ('lastUser',  'u1'),
+])
+
+def parseSuperFrame(buff):
+    # Walks the tails from the end of the super-frame, like SplitterV1, and
+    # returns the sub-frame table in arrival order. Nothing is copied.
+    buff = _asBytes(buff)
+
+    if buff.size == 0 or (buff[0] & 0xF) != BATCHER_V1_VERSION:
+        raise ValueError('Not a batcher v1 super-frame')
+
+    _, headerSize, tailSize = batcherV1Sizes(2 ** (((int(buff[0]) >> 4) & 0xF) + 1))
+
+    rows = []
+    pos  = buff.size
+    while pos > headerSize:
+        tail = pos - tailSize
+        size, dest, fUser, lUser = struct.unpack_from('<IBBB', buff, tail)
+        start = tail - (-(-size // tailSize) * tailSize)
+
+        if start < headerSize:
+            raise ValueError(f'Corrupted batcher v1 tail at byte {tail}')
+
+        rows.append((start, size, dest, fUser, lUser))
+        pos = start
+
+    rows.reverse()
+    return np.array(rows, dtype=BATCHER_V1_TABLE_DTYPE)
@@ -0,0 +1,192 @@
+#-----------------------------------------------------------------------------
+# This file is part of the 'lcls2-pgp-pcie-apps'. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the 'lcls2-pgp-pcie-apps', including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+import bisect
+import collections
+import contextlib
+import threading
+import time
+
+import pyrogue as pr
+import rogue
+
+from lcls2_pgp_pcie_apps._RegisterMap import absAddress
+
+rim = rogue.interfaces.memory
+
+# Transaction types that carry data towards the hardware
+_WRITE_TYPES = (rim.Write, rim.Post)
+
+class _Forward(rim.Master):
+    # Re-issues a transaction on the downstream memory map
+    def __init__(self, memBase):
+        rim.Master.__init__(self)
+        self._setSlave(memBase)
+
+    def forward(self, address, data, size, tranType):
+        tid = self._reqTransaction(address, data, size, 0, tranType)
+        self._waitTransaction(tid)
+        err = self._getError()
+        if err:
+            self._clearError()
+        return err
+
+class BusProfiler(rim.Slave):
+    # Memory slave placed between the device tree and the PCIe memory map.
+    # Every transaction is forwarded and timed, then accounted against the
+    # current phase of the calling thread (see phase()) and the address.
+    # Threads without a phase are accounted under their thread name, which
+    # separates the pyrogue poll thread from everything else.
+    #
+    # Transactions are forwarded synchronously, so requests that pyrogue
+    # would have had in flight together are serialized while profiling.
+    def __init__(self, memBase, minAccess=4, maxAccess=4096, logDepth=0):
+        rim.Slave.__init__(self, minAccess, maxAccess)
+
+        self._memBase = memBase
+        self._lock    = threading.Lock()
+        self._local   = threading.local()
+        self._stats   = collections.defaultdict(lambda: [0, 0, 0, 0, 0.0, 0.0]) # Count, Bytes, Reads, Writes, Time, MaxTime
+        self._log     = collections.deque(maxlen=logDepth) if logDepth else None
+        self._map     = None
+
+        self.enable = True
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        # Nested phases are joined with ';' (flame graph stack order)
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        stack.append(name)
+        try:
+            yield
+        finally:
+            stack.pop()
+
+    def _phase(self):
+        stack = getattr(self._local, 'stack', None)
+        return ';'.join(stack) if stack else threading.current_thread().name
+
+    def _forwarder(self):
+        # One downstream master per thread so the error state is never shared
+        fwd = getattr(self._local, 'fwd', None)
+        if fwd is None:
+            fwd = self._local.fwd = _Forward(self._memBase)
+        return fwd
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            if self._log is not None:
+                self._log.clear()
+
+    def _doTransaction(self, transaction):
+        with transaction.lock():
+            address  = transaction.address()
+            size     = transaction.size()
+            tranType = transaction.type()
+            data     = bytearray(size)
+            write    = tranType in _WRITE_TYPES
+
+            if write:
+                transaction.getData(data, 0)
+
+            t0  = time.perf_counter()
+            err = self._forwarder().forward(address, data, size, tranType)
+            dt  = time.perf_counter() - t0
+
+            if err:
+                transaction.error(err)
+            else:
+                if not write:
+                    transaction.setData(data, 0)
+                transaction.done()
+
+        if not self.enable:
+            return
+
+        phase = self._phase()
+        with self._lock:
+            s = self._stats[(phase, address)]
+            s[0] += 1
+            s[1] += size
+            s[2] += not write
+            s[3] += write
+            s[4] += dt
+            s[5]  = max(s[5], dt)
+            if self._log is not None:
+                self._log.append((time.time(), phase, address, size, tranType, dt))
+
+    def buildMap(self, root):
+        # Sorted (address, device path) of every remote variable, used to
+        # attribute a transaction address to the device that owns it
+        entries = set()
+        for var in root.variableList:
+            if isinstance(var, pr.RemoteVariable):
+                entries.add((absAddress(var), var.parent.path.split('.', 1)[-1]))
+        entries = sorted(entries)
+        self._map = ([a for a, _ in entries], [p for _, p in entries])
+
+    def _device(self, address):
+        if self._map is None:
+            return f'0x{address:08x}'
+        i = bisect.bisect_right(self._map[0], address) - 1
+        return self._map[1][i] if i >= 0 else f'0x{address:08x}'
+
+    def aggregate(self):
+        # {(phase, devicePath): [Count, Bytes, Reads, Writes, Time, MaxTime]}
+        with self._lock:
+            stats = list(self._stats.items())
+
+        ret = collections.defaultdict(lambda: [0, 0, 0, 0, 0.0, 0.0])
+        for (phase, address), s in stats:
+            r = ret[(phase, self._device(address))]
+            for i in range(5):
+                r[i] += s[i]
+            r[5] = max(r[5], s[5])
+        return ret
+
+    def transactions(self):
+        # Raw (time, phase, address, size, type, latency) log, empty unless logDepth was set
+        with self._lock:
+            return list(self._log) if self._log is not None else []
+
+    def report(self, top=40):
+        agg = self.aggregate()
+
+        byPhase = collections.defaultdict(lambda: [0, 0.0])
+        for (phase, _), s in agg.items():
+            byPhase[phase][0] += s[0]
+            byPhase[phase][1] += s[4]
+
+        lines = [f'{"Phase":<40} {"Trans":>9} {"Time ms":>10}']
+        for phase, (count, t) in sorted(byPhase.items(), key=lambda x: -x[1][1]):
+            lines.append(f'{phase:<40} {count:>9} {1000.0*t:>10.2f}')
+
+        lines.append('')
+        lines.append(f'{"Phase":<24} {"Device":<48} {"Trans":>8} {"Reads":>8} {"Writes":>8} {"Bytes":>10} {"Time ms":>9} {"Mean us":>8} {"Max us":>8}')
+        rows = sorted(agg.items(), key=lambda x: -x[1][4])[:top]
+        for (phase, dev), (count, nbytes, reads, writes, t, tmax) in rows:
+            lines.append(f'{phase[-24:]:<24} {dev[-48:]:<48} {count:>8} {reads:>8} {writes:>8} {nbytes:>10} '
+                         f'{1000.0*t:>9.2f} {1e6*t/count:>8.1f} {1e6*tmax:>8.1f}')
+
+        return '\n'.join(lines)
+
+    def folded(self):
+        # Flame graph folded stacks: phase;...;Device;SubDevice <microseconds>
+        lines = []
+        for (phase, dev), s in sorted(self.aggregate().items()):
+            stack = phase.split(';') + [p for p in dev.split('.') if p]
+            lines.append(f'{";".join(stack)} {int(round(1e6*s[4]))}')
+        return '\n'.join(lines) + '\n'
+
+    def dump(self, fileName):
+        with open(fileName, 'w') as f:
+            f.write(self.folded())
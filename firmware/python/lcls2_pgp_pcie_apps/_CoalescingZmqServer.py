@@ -0,0 +1,93 @@
+#-----------------------------------------------------------------------------
+# This file is part of the 'lcls2-pgp-pcie-apps'. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the 'lcls2-pgp-pcie-apps', including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+import pickle
+import threading
+
+import pyrogue as pr
+
+class CoalescingZmqServer(pr.interfaces.ZmqServer):
+    # ZmqServer that publishes on a fixed window instead of on every root
+    # update cycle. Updates of the same variable within a window are merged
+    # (last value wins) and the whole window goes out as one message, so a
+    # counter polled at 10 Hz costs one entry per window per client. With
+    # subtrees set only variables below those paths are published, which
+    # lets a client attach to one lane or device instead of the whole root.
+    # The request/response side is unchanged.
+    def __init__(self, *, root, addr, port, window=0.1, subtrees=None, **kwargs):
+        self._window       = window
+        self._prefixes     = None if subtrees is None else tuple(self._prefix(root, s) for s in subtrees)
+        self._pending      = {}
+        self._windowLock   = threading.Lock()
+        self._windowStop   = threading.Event()
+        self._windowThread = None
+        self._counts       = {'Updates': 0, 'Published': 0, 'Messages': 0}
+
+        super().__init__(root=root, addr=addr, port=port, **kwargs)
+
+    @staticmethod
+    def _prefix(root, path):
+        # Accept paths with or without the root name
+        if path != root.name and not path.startswith(root.name + '.'):
+            path = f'{root.name}.{path}'
+        return path
+
+    def _matches(self, path):
+        if self._prefixes is None:
+            return True
+        return any(path == p or path.startswith(p + '.') or path.startswith(p + '[') for p in self._prefixes)
+
+    def counters(self):
+        with self._windowLock:
+            return dict(self._counts)
+
+    def _varUpdate(self, path, value):
+        if not self._matches(path):
+            return
+
+        with self._windowLock:
+            self._pending[path] = value
+            self._counts['Updates'] += 1
+
+    def _varDone(self):
+        # Publishing is driven by the window timer
+        pass
+
+    def _flush(self):
+        with self._windowLock:
+            if not self._pending:
+                return
+            pending, self._pending = self._pending, {}
+            self._counts['Published'] += len(pending)
+            self._counts['Messages']  += 1
+
+        self._publish(pickle.dumps(pending))
+
+    def _run(self):
+        while not self._windowStop.wait(self._window):
+            self._flush()
+        self._flush()
+
+    def _start(self):
+        if hasattr(super(), '_start'):
+            super()._start()
+
+        if self._windowThread is None:
+            self._windowStop.clear()
+            self._windowThread = threading.Thread(target=self._run, name='CoalescingZmqServer', daemon=True)
+            self._windowThread.start()
+
+    def _stop(self):
+        if self._windowThread is not None:
+            self._windowStop.set()
+            self._windowThread.join()
+            self._windowThread = None
+
+        if hasattr(super(), '_stop'):
+            super()._stop()
@@ -0,0 +1,131 @@
+#-----------------------------------------------------------------------------
+# This file is part of the 'lcls2-pgp-pcie-apps'. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the 'lcls2-pgp-pcie-apps', including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+import fnmatch
+
+import pyrogue as pr
+
+from lcls2_pgp_pcie_apps._RegisterMap   import fieldOf, toNative, RawAccess
+from lcls2_pgp_pcie_apps._SnapshotCache import SnapshotCache
+
+# Bump when the write list format or the selection rules change, so stale cached lists are not reused
+CONFIG_COMPILER_VERSION = 2
+
+# Strobe/latch fields (by name): they read back as 0 or stale, so comparing
+# against the hardware would skip writes LoadConfig always does
+STROBE_VARIABLES = ['*Reset', '*Rst', '*Wr', '*Reload', '*Clear', '*Clr', 'RxDown']
+
+class ConfigCompiler:
+    # Turns a LoadConfig YAML file into a flat, ordered write list:
+    #   ['reg', path, address, value, mask]  for single-word unsigned/bool/enum registers
+    #   ['var', path, dispValue]             for everything else (setDisp fallback),
+    #                                        including WO and STROBE_VARIABLES, always written
+    # The list is cached on disk per firmware build and YAML content. load()
+    # reads back only the affected words and writes only those that differ.
+    def __init__(self, root, device, cacheDir=None, excGroups=('NoConfig',)):
+        self.root      = root
+        self.device    = device
+        self.excGroups = list(excGroups)
+
+        self._cache = SnapshotCache(cacheDir=cacheDir, prefix='config')
+
+    def _key(self, yamlFile):
+        axiVersion = self.root.DevPcie.AxiPcieCore.AxiVersion
+        return self._cache.key(
+            buildStamp = f'{axiVersion.BuildStamp.get()}:{axiVersion.GitHash.get()}',
+            files      = [yamlFile],
+            numVars    = len(self.root.variableList),
+            version    = CONFIG_COMPILER_VERSION,
+        )
+
+    def compile(self, yamlFile, useCache=True):
+        key = self._key(yamlFile) if useCache else None
+
+        if key is not None:
+            entries = self._cache.load(key)
+            if entries is not None:
+                return entries
+
+        entries = []
+        data    = pr.yamlToData(fName=yamlFile)
+
+        for rootName, value in data.items():
+            if rootName == self.root.name and isinstance(value, dict):
+                self._walk(self.root, value, entries)
+
+        if key is not None:
+            self._cache.save(key, entries)
+
+        return entries
+
+    def _walk(self, node, d, entries):
+        for key, value in d.items():
+            for child in node.nodeMatch(key):
+                if isinstance(child, pr.Device):
+                    if isinstance(value, dict):
+                        self._walk(child, value, entries)
+                    continue
+
+                if child.mode not in ('RW', 'WO') or any(child.inGroup(g) for g in self.excGroups):
+                    continue
+
+                path   = child.path
+                field  = fieldOf(child)
+                strobe = child.mode == 'WO' or any(fnmatch.fnmatchcase(child.name, p) for p in STROBE_VARIABLES)
+
+                if field is None or strobe or isinstance(value, (list, dict)):
+                    entries.append(['var', path, value])
+                else:
+                    raw = int(child.parseDisp(str(value)))
+                    entries.append(['reg', path, field.address, (raw << field.shift) & field.mask, field.mask])
+
+    def load(self, yamlFile, useCache=True):
+        entries = self.compile(yamlFile, useCache)
+        raw     = RawAccess(self.device)
+
+        # Current hardware value of every word the file touches, one read per contiguous run
+        hw      = raw.readSpans([e[2] for e in entries if e[0] == 'reg'])
+        pending = dict(hw)
+        dirty   = []
+        stats   = {'Registers': 0, 'Writes': 0, 'Fallback': 0}
+
+        def flush():
+            for addr in dirty:
+                if pending[addr] != hw[addr]:
+                    raw.write(addr, pending[addr])
+                    hw[addr] = pending[addr]
+                    stats['Writes'] += 1
+            dirty.clear()
+
+        for entry in entries:
+            if entry[0] == 'reg':
+                _, path, addr, value, mask = entry
+                pending[addr] = (pending[addr] & ~mask) | value
+                if addr not in dirty:
+                    dirty.append(addr)
+                stats['Registers'] += 1
+
+            # Keep the YAML ordering between register writes and fallback variables
+            else:
+                flush()
+                self.root.getNode(entry[1]).setDisp(entry[2])
+                stats['Fallback'] += 1
+
+        flush()
+
+        # Bring the shadow values in line with what is now in the hardware
+        for entry in entries:
+            if entry[0] == 'reg':
+                _, path, addr, value, mask = entry
+                var   = self.root.getNode(path)
+                field = fieldOf(var)
+                var.set(toNative(var, (hw[addr] & mask) >> field.shift), write=False)
+
+        stats['Reads'] = raw.reads
+        return stats
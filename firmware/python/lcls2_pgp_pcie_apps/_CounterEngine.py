@@ -0,0 +1,247 @@
+#-----------------------------------------------------------------------------
+# This file is part of the 'lcls2-pgp-pcie-apps'. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the 'lcls2-pgp-pcie-apps', including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+import contextlib
+import fnmatch
+import threading
+import time
+
+import numpy as np
+
+from lcls2_pgp_pcie_apps._RegisterMap import fieldOf, wordSpans, RawAccess
+
+# Device paths (below the root) whose counters are tracked
+DEFAULT_COUNTER_DEVICES = [
+    '*.Hsio.*Pgp*',
+    '*.EventBuilder',
+    '*.TriggerEventBuffer*',
+    '*.TimingRx.TimingFrameRx',
+]
+
+# RO variable names that are free running counters
+DEFAULT_COUNTER_NAMES = ['*Cnt', '*Cnt[[]*', '*Count', '*Count[[]*', '*Counter', '*Counter[[]*']
+
+# Devices whose counters narrower than 32 bits saturate instead of wrapping
+# (SURF SyncStatusVector status/error counts). Once pinned at their max they
+# never move again, so no rate can be derived from them: they are skipped.
+DEFAULT_SATURATING_DEVICES = ['*.Hsio.*Pgp*']
+
+class CounterEngine:
+    # Tracks the hardware counters without ever resetting them. Every period
+    # all selected counter registers are read raw (one block read per
+    # contiguous run) into a numpy array. The difference from the previous
+    # sample, masked to each counter's bit width, extends every counter to
+    # 64 bits across wraparounds, as long as no counter wraps twice within
+    # a period. A ring of these extended counts gives:
+    #   rates(window)  : counts/s over the last window seconds (default: last period)
+    #   sinceMark()    : counts since the last mark(), e.g. the run start
+    # so StartRun can mark() instead of CountReset(), keeping the history
+    # and taking the reset writes out of the transition.
+    def __init__(self,
+                 root,
+                 device      = None,   # Device the counters are under, default = root.DevPcie
+                 period      = 1.0,    # Seconds between samples
+                 historySize = 3600,   # Samples kept
+                 devices     = None,   # default = DEFAULT_COUNTER_DEVICES
+                 names       = None,   # default = DEFAULT_COUNTER_NAMES
+                 saturating  = None):  # default = DEFAULT_SATURATING_DEVICES
+        self.root        = root
+        self.device      = root.DevPcie if device is None else device
+        self.period      = period
+        self.historySize = historySize
+        self.devices     = list(DEFAULT_COUNTER_DEVICES if devices is None else devices)
+        self.names       = list(DEFAULT_COUNTER_NAMES if names is None else names)
+        self.saturating  = list(DEFAULT_SATURATING_DEVICES if saturating is None else saturating)
+
+        self.paths    = None
+        self._raw     = None
+        self._spans   = None
+        self._wordIdx = None
+        self._shift   = None
+        self._width   = None
+        self._numWord = 0
+
+        self._lock   = threading.Lock()
+        self._sample = threading.RLock() # Keeps the samples in bus read order, re-entered by nested cleared()
+        self._stopEv = threading.Event()
+        self._thread = None
+        self._last   = None
+        self._ext    = None
+        self._mark   = None
+        self._time   = np.zeros(historySize, dtype=np.float64)
+        self._hist   = None
+        self._count  = 0
+
+    def _select(self):
+        ret       = []
+        notPlain  = 0
+        saturated = 0
+        for var in self.device.variableList:
+            if var.mode != 'RO' or not any(fnmatch.fnmatchcase(var.name, p) for p in self.names):
+                continue
+
+            devPath = var.parent.path.split('.', 1)[1] if '.' in var.parent.path else var.parent.path
+            if not any(fnmatch.fnmatchcase(devPath, p) for p in self.devices):
+                continue
+
+            # Wider than 32 bits, signed, ...: not a single register field
+            field = fieldOf(var)
+            if field is None:
+                notPlain += 1
+                continue
+
+            if field.bitSize < 32 and any(fnmatch.fnmatchcase(devPath, p) for p in self.saturating):
+                saturated += 1
+                continue
+
+            ret.append((var.path.split('.', 1)[1], field))
+
+        if notPlain or saturated:
+            print(f'CounterEngine: tracking {len(ret)} counters, skipped {notPlain} not single-word unsigned '
+                  f'and {saturated} saturating')
+        return ret
+
+    def _setup(self):
+        counters   = self._select()
+        self.paths = [path for path, _ in counters]
+        self._raw  = RawAccess(self.device)
+
+        # Position of every register word in the flat array of one sample
+        self._spans = wordSpans([f.address for _, f in counters])
+        wordPos     = {}
+        for addr, numWords in self._spans:
+            for i in range(numWords):
+                wordPos[addr + 4*i] = len(wordPos)
+
+        self._wordIdx = np.array([wordPos[f.address] for _, f in counters], dtype=np.int64)
+        self._shift   = np.array([f.shift for _, f in counters], dtype=np.uint64)
+        self._width   = np.array([(1 << f.bitSize) - 1 for _, f in counters], dtype=np.uint64)
+        self._numWord = len(wordPos)
+        self._hist    = np.zeros((self.historySize, len(counters)), dtype=np.uint64)
+
+    def _read(self):
+        words = np.zeros(self._numWord, dtype=np.uint64)
+        pos   = 0
+        for addr, numWords in self._spans:
+            words[pos:pos+numWords] = self._raw.read(addr, numWords)
+            pos += numWords
+        return (words[self._wordIdx] >> self._shift) & self._width
+
+    def sample(self, mark=False):
+        with self._sample:
+            if self.paths is None:
+                self._setup()
+
+            tNow = time.monotonic()
+            raw  = self._read()
+
+            with self._lock:
+                if self._ext is None:
+                    self._ext  = np.zeros(len(raw), dtype=np.uint64)
+                    self._mark = self._ext.copy()
+                elif self._last is not None:
+                    # uint64 subtraction wraps, the width mask folds it back to the counter size
+                    self._ext += (raw - self._last) & self._width
+                self._last = raw
+
+                row = self._count % self.historySize
+                self._time[row] = tNow
+                self._hist[row] = self._ext
+                self._count += 1
+
+                if mark:
+                    self._mark = self._ext.copy()
+
+    @contextlib.contextmanager
+    def cleared(self):
+        # Wraps a counter clear (CountReset(), reload): sampling is held off
+        # and the next sample becomes the new baseline instead of counting
+        # the drop to zero as a wraparound
+        with self._sample:
+            yield
+            with self._lock:
+                self._last = None
+
+    def resync(self):
+        with self.cleared():
+            pass
+
+    def mark(self):
+        # Take a fresh sample and start counting sinceMark() from it
+        self.sample(mark=True)
+
+    def history(self):
+        # (time, counts) in time order: (N,), (N, counters) extended counts since start
+        with self._lock:
+            if self._hist is None:
+                return np.zeros(0), np.zeros((0, 0), dtype=np.uint64)
+            count = self._count
+            n     = min(count, self.historySize)
+            idx   = np.arange(count - n, count) % self.historySize
+            return self._time[idx].copy(), self._hist[idx].copy()
+
+    def counts(self):
+        with self._lock:
+            if self._ext is None:
+                return {}
+            return dict(zip(self.paths, self._ext.tolist()))
+
+    def sinceMark(self):
+        with self._lock:
+            if self._ext is None:
+                return {}
+            return dict(zip(self.paths, (self._ext - self._mark).tolist()))
+
+    def rates(self, window=None):
+        # {path: counts/s} over the last window seconds, None = last two samples
+        t, hist = self.history()
+        if len(t) < 2:
+            return {}
+
+        last  = len(t) - 1
+        first = last - 1 if window is None else max(0, int(np.searchsorted(t, t[last] - window)))
+        if first == last:
+            first = last - 1
+
+        rate = (hist[last] - hist[first]).astype(np.float64) / (t[last] - t[first])
+        return dict(zip(self.paths, rate.tolist()))
+
+    def _run(self):
+        while not self._stopEv.is_set():
+            try:
+                self.sample()
+            except Exception as e:
+                print(f'CounterEngine: sample failed: {e}')
+            self._stopEv.wait(self.period)
+
+    def _start(self):
+        if self._thread is not None:
+            return
+
+        self._stopEv.clear()
+        self._thread = threading.Thread(target=self._run, name='CounterEngine', daemon=True)
+        self._thread.start()
+
+    def _stop(self):
+        if self._thread is None:
+            return
+
+        self._stopEv.set()
+        self._thread.join()
+        self._thread = None
+
+    @staticmethod
+    def formatTable(rates, sinceMark, nonZero=True):
+        lines = [f'{"Counter":<72} {"Rate/s":>14} {"Since mark":>14}']
+        for path, count in sinceMark.items():
+            rate = rates.get(path, 0.0)
+            if nonZero and count == 0 and rate == 0.0:
+                continue
+            lines.append(f'{path:<72} {rate:>14.1f} {count:>14}')
+        return '\n'.join(lines)
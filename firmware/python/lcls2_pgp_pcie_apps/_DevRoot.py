@@ -8,6 +8,10 @@
 # copied, modified, propagated, or distributed except according to the terms
 # contained in the LICENSE.txt file.
 #-----------------------------------------------------------------------------
+import time
+import secrets
+import contextlib
+
 import pyrogue as pr
 import rogue
 import click
@@ -19,12 +23,38 @@ import lcls2_pgp_fw_lib.shared as shared
 import l2si_core               as l2si
 import surf.protocols.batcher  as batcher
 
+from lcls2_pgp_pcie_apps._SnapshotCache  import SnapshotCache
+from lcls2_pgp_pcie_apps._ConfigCompiler import ConfigCompiler
+from lcls2_pgp_pcie_apps._PollScheduler  import PollScheduler
+from lcls2_pgp_pcie_apps._CoalescingZmqServer import CoalescingZmqServer
+from lcls2_pgp_pcie_apps._BusProfiler    import BusProfiler
+from lcls2_pgp_pcie_apps._RegisterEmulator import RegisterEmulator
+from lcls2_pgp_pcie_apps._DmaFifoSampler import DmaFifoSampler
+from lcls2_pgp_pcie_apps._CounterEngine  import CounterEngine
+
 rogue.Version.minVersion('6.4.0')
 
+# Registers re-read at fast start to confirm the hardware still holds the cached configuration
+FAST_START_SENTINELS = [
+    'DevPcie.Hsio.TimingRx.TimingFrameRx.ClkSel',
+    'DevPcie.Hsio.TimingRx.TimingFrameRx.ModeSel',
+    'DevPcie.Application.AppLane[0].VcDataTap',
+    'DevPcie.Application.AppLane[0].EventBuilder.Bypass',
+    'DevPcie.Application.AppLane[0].EventBuilder.Timeout',
+    'DevPcie.Application.AppLane[3].VcDataTap',
+]
+
+# Reload detection: the configuration registers above can come back from a
+# reprogram or power cycle at reset values that equal the cached ones, so a
+# random token is written to the ScratchPad when the snapshot is saved, and
+# the uptime counter must not have gone backwards since
+FAST_START_TOKEN  = 'DevPcie.AxiPcieCore.AxiVersion.ScratchPad'
+FAST_START_UPTIME = 'DevPcie.AxiPcieCore.AxiVersion.UpTimeCnt'
+
 class DevRoot(shared.Root):
 
     def __init__(self,
-                 dev            = '/dev/datadev_0',# path to PCIe device
+                 dev            = '/dev/datadev_0',# path to PCIe device, 'sim' = firmware simulation, 'emu' = in-process register emulator
                  enLclsI        = True,
                  enLclsII       = False,
                  yamlFileLclsI  = "config/defaults_LCLS-I.yml",
@@ -38,8 +68,30 @@ class DevRoot(shared.Root):
                  pcieBoardType  = None,
                  useDdr         = False,
                  zmqSrvEn       = True,
+                 zmqAddr        = '127.0.0.1', # ZMQ server interface, '*' = all (remote run control, e.g. AsyncRootClient)
+                 zmqPort        = 0,     # ZMQ server base port, 0 = first free port from 9099
+                 fastStart      = False, # Skip the read-backs and YAML load when a cached snapshot matches the hardware
+                 cacheDir       = None,  # Snapshot cache directory, None = ~/.cache/lcls2_pgp_pcie_apps
+                 diffConfig     = False, # Load the YAML through the compiled write list, writing only registers that differ
+                 pollScheduler  = False, # Poll with the tiered PollScheduler instead of the pyrogue poll thread
+                 pollMaxRate    = 1000,  # PollScheduler bus transactions per second
+                 minimalTree    = False, # Only build the timing tree used by startupMode (overrides enLclsI/enLclsII)
+                 numLanes       = 4,     # Number of application lanes to build
+                 zmqWindow      = None,  # Seconds of variable updates merged per ZMQ publish, None = publish every update cycle
+                 zmqSubtrees    = None,  # Extra ZMQ servers each publishing only one subtree (paths below the root)
+                 busProfile     = False, # Time every register transaction per device and startup phase
+                 fifoSampleRate = None,  # DDR DMA FIFO fill level sampling rate in Hz (useDdr only), None = off
+                 fifoDepth      = None,  # DDR DMA FIFO depth in frames for the near-full statistics, None = not computed
+                 counterEngine  = False, # Track the counters without resetting them, StartRun marks instead of CountReset
+                 counterPeriod  = 1.0,   # CounterEngine seconds between samples
                  **kwargs):
 
+        # The device tree is frozen once the root starts, so unused subtrees
+        # can't be added on first access later: skip them at construction
+        if minimalTree:
+            enLclsI  = not startupMode
+            enLclsII = startupMode
+
         # Set local variables
         self.dev            = dev
         self.startupMode    = startupMode
@@ -47,20 +99,40 @@ class DevRoot(shared.Root):
         self.dataVc         = dataVc
         self.yamlFileLclsI  = yamlFileLclsI
         self.yamlFileLclsII = yamlFileLclsII
+        self.fastStart      = fastStart
+        self.diffConfig     = diffConfig
+        self._fullInitRead  = initRead
+        self._snapshots     = SnapshotCache(cacheDir=cacheDir, prefix='faststart')
 
         # Pass custom value to parent via super function
+        # Fast start does its own read after checking the snapshot cache
         super().__init__(
             dev         = dev,
             pgp4        = pgp4,
-            pollEn      = pollEn,
-            initRead    = initRead,
+            pollEn      = pollEn and not pollScheduler,
+            initRead    = initRead and not fastStart,
             **kwargs)
 
         # Add ZMQ server
+        self.zmqSubtreeServers = {}
         if zmqSrvEn:
-            self.zmqServer = pr.interfaces.ZmqServer(root=self, addr='127.0.0.1', port=0)
+            if zmqWindow is None:
+                self.zmqServer = pr.interfaces.ZmqServer(root=self, addr=zmqAddr, port=zmqPort)
+            else:
+                self.zmqServer = CoalescingZmqServer(root=self, addr=zmqAddr, port=zmqPort, window=zmqWindow)
             self.addInterface(self.zmqServer)
 
+            # Per subtree servers, so a client can attach to one lane or device only
+            for path in (zmqSubtrees or []):
+                self.zmqSubtreeServers[path] = CoalescingZmqServer(
+                    root     = self,
+                    addr     = zmqAddr,
+                    port     = 0,
+                    window   = 0.1 if zmqWindow is None else zmqWindow,
+                    subtrees = [path],
+                )
+                self.addInterface(self.zmqSubtreeServers[path])
+
         # Check for simulation
         if dev == 'sim':
             # Set the timeout
@@ -74,21 +146,80 @@ class DevRoot(shared.Root):
         self.RemoteVariableDump.hidden = False
 
         # Create memory interface
-        self.memMap = axipcie.createAxiPcieMemMap(dev, 'localhost', 8000)
+        if dev == 'emu':
+            self.memMap = RegisterEmulator()
+        else:
+            self.memMap = axipcie.createAxiPcieMemMap(dev, 'localhost', 8000)
         self.memMap.setName('PCIe_Bar0')
 
+        # Optional transaction profiler between the device tree and the memory map
+        self.busProfiler = BusProfiler(self.memMap) if busProfile else None
+
         # Instantiate the top level Device and pass it the memory map
         self.add(pcieApp.PcieFpga(
             name      = 'DevPcie',
-            memBase   = self.memMap,
+            memBase   = self.memMap if self.busProfiler is None else self.busProfiler,
             pgp4      = pgp4,
             enLclsI   = enLclsI,
             enLclsII  = enLclsII,
             useDdr    = useDdr,
             boardType = pcieBoardType,
+            numLanes  = numLanes,
             expand    = True,
         ))
 
+        # Emulated registers take their defaults and behavior from the tree
+        if dev == 'emu':
+            self.memMap.configure(self)
+
+        if self.busProfiler is not None:
+            self.busProfiler.buildMap(self)
+
+            @self.command(description='Prints the register transaction profile per phase and device')
+            def BusProfileReport():
+                print(self.busProfiler.report())
+
+            @self.command(value='', description='Writes the register transaction profile as flame graph folded stacks')
+            def BusProfileDump(arg):
+                self.busProfiler.dump(arg)
+
+            @self.command(description='Clears the register transaction profile')
+            def BusProfileReset():
+                self.busProfiler.reset()
+
+        # High rate DDR FIFO occupancy sampling
+        self.fifoSampler = None
+        if useDdr and fifoSampleRate:
+            self.fifoSampler = DmaFifoSampler(root=self, rate=fifoSampleRate, depth=fifoDepth)
+            self.addInterface(self.fifoSampler)
+
+            @self.command(description='Prints the DDR DMA FIFO occupancy statistics')
+            def DmaFifoReport():
+                print(f'Sampling at {self.fifoSampler.sampleRate():.1f} Hz')
+                print(DmaFifoSampler.formatTable(self.fifoSampler.stats()))
+
+        # Free running counter deltas/rates, replaces CountReset at run start
+        self.counterEngine = None
+        if counterEngine:
+            self.counterEngine = CounterEngine(root=self, device=self.DevPcie, period=counterPeriod)
+            self.addInterface(self.counterEngine)
+
+            @self.command(description='Prints the counter rates and the counts since the run start')
+            def CounterReport():
+                print(CounterEngine.formatTable(self.counterEngine.rates(), self.counterEngine.sinceMark()))
+
+        # Tiered polling with a bus transaction budget
+        if pollEn and pollScheduler:
+            self.pollScheduler = PollScheduler(root=self, device=self.DevPcie, maxRate=pollMaxRate)
+            self.addInterface(self.pollScheduler)
+
+        # Compiled YAML loader, writes only the registers that differ from the hardware
+        self._configCompiler = ConfigCompiler(root=self, device=self.DevPcie, cacheDir=cacheDir)
+
+        @self.command(value='', description='Loads a YAML configuration file, only writing the registers that differ from the hardware')
+        def LoadConfigDiff(arg):
+            self.loadConfigDiff(arg)
+
         self.add(pr.LocalVariable(
             name        = 'RunState',
             description = 'Run state status, which is controlled by the StopRun() and StartRun() commands',
@@ -96,49 +227,129 @@ class DevRoot(shared.Root):
             value       = False,
         ))
 
+        self.add(pr.LocalVariable(
+            name        = 'StopRunTime',
+            description = 'Duration of the last StopRun() transition',
+            mode        = 'RO',
+            units       = 'ms',
+            disp        = '{:.3f}',
+            value       = 0.0,
+        ))
+
+        self.add(pr.LocalVariable(
+            name        = 'StartRunTime',
+            description = 'Duration of the last StartRun() transition',
+            mode        = 'RO',
+            units       = 'ms',
+            disp        = '{:.3f}',
+            value       = 0.0,
+        ))
+
+        # Run control device handles, looked up once (see _runDevices())
+        self._eventBuilders = None
+        self._triggers      = None
+
         @self.command(description  = 'Stops the triggers and blows off data in the pipeline')
         def StopRun():
-            print ('ClinkDev.StopRun() executed')
+            with self._phase('runControl'):
+                t0 = time.perf_counter()
+                eventBuilder, trigger = self._runDevices()
 
-            # Get devices
-            eventBuilder = self.find(typ=batcher.AxiStreamBatcherEventBuilder)
-            trigger      = self.find(typ=l2si.TriggerEventBuffer)
+                # Turn off the triggering
+                self._writeVariables([devPtr.MasterEnable for devPtr in trigger], False)
 
-            # Turn off the triggering
-            for devPtr in trigger:
-                devPtr.MasterEnable.set(False)
+                # Flush the downstream data/trigger pipelines
+                self._writeVariables([devPtr.Blowoff for devPtr in eventBuilder], True)
 
-            # Flush the downstream data/trigger pipelines
-            for devPtr in eventBuilder:
-                devPtr.Blowoff.set(True)
+                # Update the run state status variable
+                self.RunState.set(False)
 
-            # Update the run state status variable
-            self.RunState.set(False)
+                self.StopRunTime.set(1000.0*(time.perf_counter()-t0))
+                print(f'ClinkDev.StopRun() executed in {self.StopRunTime.value():.3f} ms')
 
         @self.command(description  = 'starts the triggers and allow steams to flow to DMA engine')
         def StartRun():
-            print ('ClinkDev.StartRun() executed')
-
-            # Get devices
-            eventBuilder = self.find(typ=batcher.AxiStreamBatcherEventBuilder)
-            trigger      = self.find(typ=l2si.TriggerEventBuffer)
+            with self._phase('runControl'):
+                t0 = time.perf_counter()
+                eventBuilder, trigger = self._runDevices()
 
-            # Reset all counters
-            self.CountReset()
-
-            # Arm for data/trigger stream
-            for devPtr in eventBuilder:
-                devPtr.Blowoff.set(False)
-                devPtr.SoftRst()
+                # Reset all counters, or only mark the run start when the counter engine tracks them
+                if self.counterEngine is None:
+                    self.CountReset()
+                else:
+                    self.counterEngine.mark()
+                t1 = time.perf_counter()
+
+                # Arm for data/trigger stream
+                self._writeVariables([devPtr.Blowoff for devPtr in eventBuilder], False)
+                for devPtr in eventBuilder:
+                    devPtr.SoftRst()
+
+                # Turn on the triggering
+                self._writeVariables([devPtr.MasterEnable for devPtr in trigger], True)
+
+                # Update the run state status variable
+                self.RunState.set(True)
+
+                t2 = time.perf_counter()
+                self.StartRunTime.set(1000.0*(t2-t0))
+                print(f'ClinkDev.StartRun() executed in {self.StartRunTime.value():.3f} ms '
+                      f'(counters {1000.0*(t1-t0):.3f} ms, arming {1000.0*(t2-t1):.3f} ms)')
+
+    def countReset(self):
+        # A manual CountReset() must not look like every tracked counter wrapping
+        if self.counterEngine is None:
+            return super().countReset()
+        with self.counterEngine.cleared():
+            super().countReset()
+
+    def _phase(self, name):
+        # Bus profiler phase marker, a no-op when not profiling
+        if self.busProfiler is None:
+            return contextlib.nullcontext()
+        return self.busProfiler.phase(name)
+
+    def _runDevices(self):
+        # The tree is fixed once the root is built, so the run control
+        # devices only need to be found once instead of on every transition
+        if self._eventBuilders is None:
+            self._eventBuilders = self.find(typ=batcher.AxiStreamBatcherEventBuilder)
+            self._triggers      = self.find(typ=l2si.TriggerEventBuffer)
+        return self._eventBuilders, self._triggers
+
+    def _writeVariables(self, variables, value):
+        # Update all the shadows first, then put every write in flight
+        # before waiting on any of them, instead of one round trip per lane
+        for var in variables:
+            var.set(value, write=False)
+        for var in variables:
+            pr.startTransaction(var._block, type=rogue.interfaces.memory.Write, forceWr=True, variable=var)
+        for var in variables:
+            pr.checkTransaction(var._block)
+
+        # Read-back check var.set() would have done (Blowoff, MasterEnable, ...)
+        verify = [var for var in variables if var._verify]
+        for var in verify:
+            pr.startTransaction(var._block, type=rogue.interfaces.memory.Verify, variable=var)
+        for var in verify:
+            pr.checkTransaction(var._block)
+
+    def _readVariables(self, variables):
+        # Same pattern for reads: one transaction per block, all in flight before the first check
+        blocks = list({id(var._block): var._block for var in variables}.values())
+        for block in blocks:
+            pr.startTransaction(block, type=rogue.interfaces.memory.Read)
+        for block in blocks:
+            pr.checkTransaction(block)
 
-            # Turn on the triggering
-            for devPtr in trigger:
-                devPtr.MasterEnable.set(True)
+    def start(self, **kwargs):
+        with self._phase('start'):
+            self._startSequence(**kwargs)
 
-            # Update the run state status variable
-            self.RunState.set(True)
+    def _startSequence(self, **kwargs):
+        # Look up the run control devices before anything can issue a transition
+        self._runDevices()
 
-    def start(self, **kwargs):
         super().start(**kwargs)
 
         # Hide all the "enable" variables
@@ -149,6 +360,23 @@ class DevRoot(shared.Root):
         # Check if not simulation
         if (self.dev != 'sim'):
 
+            # Restore from the snapshot when the hardware still matches it
+            if self.fastStart:
+                t0  = time.monotonic()
+                key = self._fastStartKey()
+                if self._fastStartRestore(key):
+                    print(f'Fast start from cached snapshot {key} in {time.monotonic()-t0:.3f} s')
+
+                    # No LoadConfig on this path, so run its post-configuration
+                    # hook here: a restart mid-run must not leave the triggers armed
+                    self.initialize()
+                    return
+                print(f'No valid snapshot for {key}, doing a full start')
+
+                # Read skipped by the parent start
+                if self._fullInitRead:
+                    self.ReadAll()
+
             # Useful pointer
             timingRx = self.DevPcie.Hsio.TimingRx
 
@@ -184,18 +412,125 @@ class DevRoot(shared.Root):
             for yamlFile in defaultFile:
                 if yamlFile is not None:
                     print(f'Loading {yamlFile} Configuration File...')
-                    self.LoadConfig(yamlFile)
+                    with self._phase('LoadConfig'):
+                        if self.diffConfig:
+                            self.loadConfigDiff(yamlFile)
+                        else:
+                            self.LoadConfig(yamlFile)
 
             # Set the VC data tap
             appLane = self.find(typ=shared.AppLane)
             for devPtr in appLane:
                 devPtr.VcDataTap.set(self.dataVc)
 
+            # Save the configured state for the next fast start
+            if self.fastStart:
+                self._fastStartSave(key)
+
+    def loadConfigDiff(self, yamlFile):
+        stats = self._configCompiler.load(yamlFile)
+        print(f'{yamlFile}: {stats["Registers"]} registers, {stats["Reads"]} read transactions, '
+              f'{stats["Writes"]} writes, {stats["Fallback"]} variables through LoadConfig path')
+
+        # Same post-configuration hook as LoadConfig
+        initAfterConfig = self.getNode(f'{self.name}.InitAfterConfig')
+        if initAfterConfig is None or initAfterConfig.value():
+            self.initialize()
+
+        return stats
+
+    def _fastStartKey(self):
+        axiVersion = self.DevPcie.AxiPcieCore.AxiVersion
+        yamlFile   = self.yamlFileLclsII if self.startupMode else self.yamlFileLclsI
+
+        return self._snapshots.key(
+            buildStamp     = f'{axiVersion.BuildStamp.get()}:{axiVersion.GitHash.get()}',
+            files          = [yamlFile],
+            startupMode    = self.startupMode,
+            standAloneMode = self.standAloneMode,
+            dataVc         = self.dataVc,
+        )
+
+    def _fastStartSentinels(self):
+        nodes = {}
+        for path in FAST_START_SENTINELS:
+            node = self.getNode(f'{self.name}.{path}')
+            if node is not None:
+                nodes[path] = node
+        return nodes
+
+    def _fastStartRestore(self, key):
+        snapshot = self._snapshots.load(key)
+        if snapshot is None:
+            return False
+
+        def reject(reason):
+            print(f'Fast start snapshot rejected: {reason}')
+            self._snapshots.remove(key)
+            return False
+
+        # Only the sentinels touch the bus
+        token = self.getNode(f'{self.name}.{FAST_START_TOKEN}')
+        if token is None or token.get() != snapshot.get('token'):
+            return reject(f'{FAST_START_TOKEN} does not hold the snapshot token (FPGA reloaded?)')
+
+        upTime = self.getNode(f'{self.name}.{FAST_START_UPTIME}')
+        if upTime is not None and upTime.get() < snapshot.get('upTime', 0):
+            return reject(f'{FAST_START_UPTIME} went backwards (FPGA reloaded?)')
+
+        for path, node in self._fastStartSentinels().items():
+            if path not in snapshot['sentinels'] or node.getDisp() != snapshot['sentinels'][path]:
+                return reject(f'sentinel mismatch: {path}')
+
+        # Load the configuration shadows without writing them to the hardware
+        for path, value in snapshot['values'].items():
+            node = self.getNode(f'{self.name}.{path}')
+            if node is not None:
+                node.setDisp(value, write=False)
+
+        # Status is never cached: read it
+        self._readVariables([var for var in self.variableList
+                             if isinstance(var, pr.RemoteVariable) and not isinstance(var, pr.BaseCommand) and var.mode == 'RO'])
+
+        return True
+
+    def _fastStartSave(self, key):
+        values = {}
+        for var in self.variableList:
+            if isinstance(var, pr.RemoteVariable) and not isinstance(var, pr.BaseCommand) and var.mode == 'RW':
+                values[var.path.split('.', 1)[1]] = var.valueDisp()
+
+        # Fresh token for this configuration, the snapshot is only valid while
+        # the FPGA still holds it. Without one a reload can't be detected: no snapshot.
+        token = self.getNode(f'{self.name}.{FAST_START_TOKEN}')
+        if token is None:
+            return
+        value = secrets.randbits(32)
+        token.set(value)
+        values.pop(FAST_START_TOKEN, None)
+
+        upTime = self.getNode(f'{self.name}.{FAST_START_UPTIME}')
+
+        self._snapshots.save(key, {
+            'token'     : value,
+            'upTime'    : 0 if upTime is None else upTime.get(),
+            'sentinels' : {path: node.getDisp() for path, node in self._fastStartSentinels().items()},
+            'values'    : values,
+        })
+
     # Function calls after loading YAML configuration
     def initialize(self):
-        super().initialize()
+        with self._phase('initialize'):
+            super().initialize()
 
-        # Check if not simulation
-        if (self.dev != 'sim'):
-            self.StopRun()
-            self.CountReset()
+            # Check if not simulation
+            if (self.dev != 'sim'):
+                self.StopRun()
+
+                # One reset per configuration (only StartRun skips it with the counter
+                # engine), so saturating status counters do not stay pinned at their max
+                if self.counterEngine is None:
+                    self.CountReset()
+                else:
+                    with self.counterEngine.cleared():
+                        self.CountReset()
@@ -0,0 +1,255 @@
+#-----------------------------------------------------------------------------
+# This file is part of the 'lcls2-pgp-pcie-apps'. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the 'lcls2-pgp-pcie-apps', including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+import multiprocessing
+import pickle
+import time
+import concurrent.futures
+
+import pyrogue as pr
+
+from lcls2_pgp_pcie_apps._DevRoot import DevRoot
+
+def _cardProcess(rootClass, kwargs, conn):
+    # Card process: builds, starts and stops one root on request from the
+    # group, which drives everything else through the root's ZMQ server
+    root = None
+    while True:
+        cmd, args = conn.recv()
+        try:
+            if cmd == 'build':
+                root = rootClass(**kwargs)
+                ret  = None
+            elif cmd == 'start':
+                root.start(**args)
+                ret = root.zmqServer.address
+            elif cmd == 'stop':
+                root.stop()
+                ret = None
+            else:
+                conn.send(('ok', None))
+                return
+        except Exception as e:
+            # The group re-raises it, so it must survive the pipe
+            try:
+                pickle.dumps(e)
+            except Exception:
+                e = RuntimeError(f'{type(e).__name__}: {e}')
+            conn.send(('error', e))
+            continue
+        conn.send(('ok', ret))
+
+class _CardProcess:
+    # Group side of one card process
+    def __init__(self, ctx, rootClass, kwargs):
+        self.conn, child = ctx.Pipe()
+        self.proc        = ctx.Process(target=_cardProcess, args=(rootClass, kwargs, child), daemon=True)
+        self.proc.start()
+        child.close()
+        self.client = None
+
+    def request(self, cmd, args=None):
+        self.conn.send((cmd, args))
+        try:
+            status, ret = self.conn.recv()
+        except EOFError:
+            raise RuntimeError(f'card process exited with code {self.proc.exitcode}') from None
+        if status == 'error':
+            raise ret
+        return ret
+
+    def close(self):
+        if self.client is not None:
+            self.client.stop()
+            self.client = None
+        if self.proc.is_alive():
+            try:
+                self.request('exit')
+            except (OSError, RuntimeError):
+                pass
+            self.proc.join(5.0)
+            if self.proc.is_alive():
+                self.proc.terminate()
+                self.proc.join()
+        self.conn.close()
+
+class DevRootGroup:
+    # One DevRoot per PCIe card in the node, built, started and driven
+    # concurrently so node bring-up and run transitions take as long as the
+    # slowest card instead of the sum of all cards.
+    #
+    # By default every root runs in its own process: building the tree and
+    # the YAML parsing/setDisp() of LoadConfig are pure Python and hold the
+    # GIL, so roots on threads of one process would still take about the sum
+    # of all cards for those steps. The group then drives each card through
+    # its ZMQ server: roots[dev] is a pyrogue VirtualClient root, so
+    # transitions and group.call() work the same in both modes.
+    # processes=False keeps the roots on threads of this process, directly
+    # reachable, which only parallelizes the register transactions.
+    #
+    # Every fan-out records the per-card duration in timings[dev][step] (s).
+    # When a card fails the others still finish, then a RuntimeError names
+    # the failed cards, chained to the first error.
+    def __init__(self,
+                 devs,              # ['/dev/datadev_0', '/dev/datadev_1', ...]
+                 cardArgs  = None,  # {dev: {DevRoot kwargs}} per card overrides
+                 rootClass = DevRoot,
+                 processes = True,  # One process per card, False = threads of this process
+                 **kwargs):         # DevRoot kwargs shared by all cards
+        self.devs      = list(devs)
+        self.rootClass = rootClass
+        self.processes = processes
+        self.roots     = {}
+        self.addresses = {}
+        self.started   = set()
+        self.timings   = {dev: {} for dev in self.devs}
+
+        self._kwargs   = {dev: {**kwargs, **(cardArgs or {}).get(dev, {}), 'dev': dev} for dev in self.devs}
+        self._cards    = {}
+        self._pool     = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, len(self.devs)), thread_name_prefix='DevRootGroup')
+
+        # The card processes are driven over ZMQ: every root needs its server
+        if processes:
+            for args in self._kwargs.values():
+                args['zmqSrvEn'] = True
+
+    def _fanOut(self, step, fn, devs=None):
+        devs    = self.devs if devs is None else devs
+        results = {}
+        errors  = {}
+
+        def timed(dev):
+            t0 = time.perf_counter()
+            try:
+                return fn(dev)
+            finally:
+                self.timings[dev][step] = time.perf_counter() - t0
+
+        t0      = time.perf_counter()
+        futures = {self._pool.submit(timed, dev): dev for dev in devs}
+        for future in concurrent.futures.as_completed(futures):
+            dev = futures[future]
+            try:
+                results[dev] = future.result()
+            except Exception as e:
+                errors[dev] = e
+        self.timings.setdefault('Node', {})[step] = time.perf_counter() - t0
+
+        if errors:
+            first = next(iter(errors.values()))
+            raise RuntimeError(f'{step} failed on {", ".join(sorted(errors))}: {first}') from first
+        return results
+
+    def build(self):
+        if self.processes:
+            # Spawn, not fork: rogue threads and the DMA driver handles don't survive a fork
+            ctx = multiprocessing.get_context('spawn')
+
+            def construct(dev):
+                if dev not in self._cards:
+                    self._cards[dev] = _CardProcess(ctx, self.rootClass, self._kwargs[dev])
+                self._cards[dev].request('build')
+                self.roots[dev] = None
+        else:
+            def construct(dev):
+                self.roots[dev] = self.rootClass(**self._kwargs[dev])
+
+        self._fanOut('Construct', construct, [dev for dev in self.devs if dev not in self.roots])
+
+    def start(self, **kwargs):
+        def startOne(dev):
+            if self.processes:
+                card = self._cards[dev]
+                self.addresses[dev] = card.request('start', kwargs)
+                self.started.add(dev)
+
+                addr, port  = self.addresses[dev].rsplit(':', 1)
+                card.client = pr.interfaces.VirtualClient(addr=addr, port=int(port))
+                self.roots[dev] = card.client.root
+            else:
+                self.roots[dev].start(**kwargs)
+                self.started.add(dev)
+
+                server = getattr(self.roots[dev], 'zmqServer', None)
+                self.addresses[dev] = None if server is None else server.address
+
+        # __exit__ never runs when __enter__ raises: stop the cards that
+        # did start and the pool here, or their threads keep the process alive
+        try:
+            if len(self.roots) != len(self.devs):
+                self.build()
+            self._fanOut('Start', startOne, [dev for dev in self.devs if dev not in self.started])
+        except Exception:
+            try:
+                self.stop()
+            finally:
+                self.close()
+            raise
+
+    def stop(self):
+        def stopOne(dev):
+            if self.processes:
+                card = self._cards[dev]
+                if card.client is not None:
+                    card.client.stop()
+                    card.client = None
+                card.request('stop')
+            else:
+                self.roots[dev].stop()
+            self.started.discard(dev)
+
+        self._fanOut('Stop', stopOne, [dev for dev in self.devs if dev in self.started])
+
+    def close(self):
+        for card in self._cards.values():
+            card.close()
+        self._cards.clear()
+        self._pool.shutdown()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            self.stop()
+        finally:
+            self.close()
+
+    def StartRun(self):
+        self._fanOut('StartRun', lambda dev: self.roots[dev].StartRun())
+
+    def StopRun(self):
+        self._fanOut('StopRun', lambda dev: self.roots[dev].StopRun())
+
+    def CountReset(self):
+        self._fanOut('CountReset', lambda dev: self.roots[dev].CountReset())
+
+    def LoadConfig(self, yamlFile):
+        # Same file on every card, or {dev: yamlFile}
+        files = yamlFile if isinstance(yamlFile, dict) else {dev: yamlFile for dev in self.devs}
+        self._fanOut('LoadConfig', lambda dev: self.roots[dev].LoadConfig(files[dev]), list(files))
+
+    def call(self, step, fn):
+        # fn(root) on every card, returns {dev: result}
+        return self._fanOut(step, lambda dev: fn(self.roots[dev]))
+
+    def runState(self):
+        return {dev: root.RunState.value() for dev, root in self.roots.items() if root is not None}
+
+    def formatTable(self):
+        steps = []
+        for t in self.timings.values():
+            steps += [s for s in t if s not in steps]
+
+        lines = [f'{"Card [s]":<18}' + ''.join(f' {s:>11}' for s in steps)]
+        for dev in self.devs + ['Node']:
+            t = self.timings.get(dev, {})
+            lines.append(f'{dev:<18}' + ''.join(f' {t[s]:>11.3f}' if s in t else f' {"-":>11}' for s in steps))
+        return '\n'.join(lines)
@@ -0,0 +1,225 @@
+#-----------------------------------------------------------------------------
+# This file is part of the 'lcls2-pgp-pcie-apps'. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the 'lcls2-pgp-pcie-apps', including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+import threading
+import time
+
+import numpy as np
+import surf.axi as axi
+
+from lcls2_pgp_pcie_apps._RegisterMap import fieldOf, wordSpans, RawAccess
+
+# AxiStreamDmaV2Fifo register holding the number of frames in the DDR buffer
+DEFAULT_FILL_VAR = 'FrameCnt'
+
+class DmaFifoSampler:
+    # Samples the fill level of the DDR DMA FIFOs (AxiStreamDmaV2Fifo) on a
+    # dedicated thread at up to kHz rates, reading only the fill/status
+    # registers (one block read per contiguous run, usually one per lane).
+    # Samples go into a ring buffer; stats() reduces it per lane to:
+    #   Peak      : highest fill seen (and PeakFrac of the depth)
+    #   NearFull  : seconds spent at or above nearFull*depth
+    #   DrainRate : mean rate the fill level falls while it is falling (entries/s)
+    #   FillRate  : mean rate it rises while it is rising (entries/s)
+    # A FIFO that sits near full with a low drain rate means the host is not
+    # reading fast enough. A FIFO that stays empty while frames go missing
+    # points at the link side instead.
+    def __init__(self,
+                 root,
+                 rate        = 1000.0, # Samples per second
+                 ringSize    = 65536,  # Samples kept per lane
+                 fillVar     = DEFAULT_FILL_VAR,
+                 statusVars  = (),     # Extra registers sampled alongside the fill level
+                 depth       = None,   # FIFO depth in frames, None = no Peak%/NearFull
+                 nearFull    = 0.9):
+        self.root       = root
+        self.rate       = rate
+        self.ringSize   = ringSize
+        self.fillVar    = fillVar
+        self.statusVars = list(statusVars)
+        self.depth      = depth
+        self.nearFull   = nearFull
+
+        self._lanes  = None
+        self._lock   = threading.Lock()
+        self._stopEv = threading.Event()
+        self._thread = None
+        self._time   = np.zeros(ringSize, dtype=np.float64)
+        self._fill   = None
+        self._status = None
+        self._count  = 0
+        self._late   = 0
+
+    def _setup(self):
+        self._lanes = []
+        for dev in self.root.find(typ=axi.AxiStreamDmaV2Fifo):
+            # A lane sampled without its fill level would read as "no backpressure": refuse it
+            fill = dev.nodes.get(self.fillVar)
+            if fill is None or fieldOf(fill) is None:
+                available = ', '.join(n for n, v in dev.nodes.items() if fieldOf(v) is not None)
+                raise ValueError(f'DmaFifoSampler: {dev.path} has no single-word register {self.fillVar} '
+                                 f'to sample the fill level from (has: {available})')
+
+            status = []
+            for name in self.statusVars:
+                var = dev.nodes.get(name)
+                if var is None or fieldOf(var) is None:
+                    raise ValueError(f'DmaFifoSampler: {dev.path} has no single-word register {name}')
+                status.append(var)
+
+            fields = [fieldOf(v) for v in [fill] + status]
+
+            self._lanes.append({
+                'name'   : dev.name,
+                'raw'    : RawAccess(dev),
+                'depth'  : self.depth,
+                'fields' : fields,
+                'spans'  : wordSpans([f.address for f in fields]),
+                'status' : [v.name for v in status],
+            })
+
+        if self.depth is None:
+            print('DmaFifoSampler: no FIFO depth given, Peak% and NearFull are not computed')
+
+        numLanes     = len(self._lanes)
+        numStatus    = max([len(l['status']) for l in self._lanes], default=0)
+        self._fill   = np.zeros((self.ringSize, numLanes), dtype=np.uint32)
+        self._status = np.zeros((self.ringSize, numLanes, numStatus), dtype=np.uint32)
+
+    def _sample(self):
+        tNow   = time.monotonic()
+        values = []
+
+        for l in self._lanes:
+            words = {}
+            for addr, numWords in l['spans']:
+                for i, w in enumerate(l['raw'].read(addr, numWords)):
+                    words[addr + 4*i] = w
+            values.append([(words[f.address] & f.mask) >> f.shift for f in l['fields']])
+
+        with self._lock:
+            row = self._count % self.ringSize
+            for lane, v in enumerate(values):
+                self._fill[row, lane] = v[0]
+                self._status[row, lane, :len(v)-1] = v[1:]
+            self._time[row] = tNow
+            self._count += 1
+
+    def _run(self):
+        period = 1.0 / self.rate
+        due    = time.monotonic()
+
+        while not self._stopEv.is_set():
+            try:
+                self._sample()
+            except Exception as e:
+                print(f'DmaFifoSampler: sample failed: {e}')
+                if self._stopEv.wait(1.0):
+                    break
+
+            # Fixed schedule, a late sample is counted instead of bunching up the next ones
+            due += period
+            wait = due - time.monotonic()
+            if wait > 0:
+                self._stopEv.wait(wait)
+            else:
+                self._late += 1
+                due = time.monotonic()
+
+    def _start(self):
+        if self._thread is not None:
+            return
+
+        self._setup()
+        if not self._lanes:
+            return
+
+        self._stopEv.clear()
+        self._thread = threading.Thread(target=self._run, name='DmaFifoSampler', daemon=True)
+        self._thread.start()
+
+    def _stop(self):
+        if self._thread is None:
+            return
+
+        self._stopEv.set()
+        self._thread.join()
+        self._thread = None
+
+    def reset(self):
+        with self._lock:
+            self._count = 0
+            self._late  = 0
+
+    def samples(self):
+        # (time, fill, status) in time order: (N,), (N, lanes), (N, lanes, statusVars)
+        with self._lock:
+            count = self._count
+            n     = min(count, self.ringSize)
+            idx   = (np.arange(count - n, count) % self.ringSize) if n else np.zeros(0, dtype=np.int64)
+            return self._time[idx].copy(), self._fill[idx].copy(), self._status[idx].copy()
+
+    def stats(self):
+        if not self._lanes:
+            return {}
+
+        t, fill, status = self.samples()
+        ret = {}
+
+        for lane, l in enumerate(self._lanes):
+            f     = fill[:, lane].astype(np.int64)
+            depth = l['depth']
+            s     = {
+                'Samples'   : len(f),
+                'Depth'     : depth,
+                'Fill'      : int(f[-1]) if len(f) else 0,
+                'Peak'      : int(f.max()) if len(f) else 0,
+                'PeakFrac'  : None,
+                'NearFull'  : 0.0,
+                'DrainRate' : 0.0,
+                'FillRate'  : 0.0,
+            }
+
+            if len(f) > 1:
+                dt = np.diff(t)
+                df = np.diff(f)
+
+                if depth:
+                    s['PeakFrac'] = s['Peak'] / depth
+                    s['NearFull'] = float(dt[f[:-1] >= self.nearFull * depth].sum())
+
+                down = df < 0
+                up   = df > 0
+                if down.any():
+                    s['DrainRate'] = float(-df[down].sum() / dt[down].sum())
+                if up.any():
+                    s['FillRate']  = float(df[up].sum() / dt[up].sum())
+
+            for i, name in enumerate(l['status']):
+                s[name] = int(status[-1, lane, i]) if len(f) else 0
+
+            ret[l['name']] = s
+
+        return ret
+
+    def sampleRate(self):
+        # Achieved rate over the samples in the ring
+        t, _, _ = self.samples()
+        if len(t) < 2 or t[-1] == t[0]:
+            return 0.0
+        return (len(t) - 1) / (t[-1] - t[0])
+
+    @staticmethod
+    def formatTable(stats):
+        lines = [f'{"Lane":<14} {"Fill":>8} {"Peak":>8} {"Peak%":>7} {"NearFull s":>11} {"Drain/s":>12} {"Fill/s":>12}']
+        for name, s in stats.items():
+            frac = f'{100.0*s["PeakFrac"]:.1f}' if s['PeakFrac'] is not None else '-'
+            lines.append(f'{name:<14} {s["Fill"]:>8} {s["Peak"]:>8} {frac:>7} {s["NearFull"]:>11.3f} '
+                         f'{s["DrainRate"]:>12.1f} {s["FillRate"]:>12.1f}')
+        return '\n'.join(lines)
@@ -0,0 +1,162 @@
+#-----------------------------------------------------------------------------
+# This file is part of the 'lcls2-pgp-pcie-apps'. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the 'lcls2-pgp-pcie-apps', including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+import threading
+
+import numpy as np
+import rogue
+
+from lcls2_pgp_pcie_apps._BatcherV1           import parseSuperFrame
+from lcls2_pgp_pcie_apps._PulseIdEventBuilder import PULSE_ID_MASK
+
+# Raw event header words as they sit in the trigger/transition sub-frames
+EVENT_HEADER_RAW_DTYPE = np.dtype([
+    ('pulseIdCtl',  '<u8'), # [55:0] = pulseId, [63:56] = control (transition ID)
+    ('timeStamp',   '<u8'), # [31:0] = nanoseconds, [63:32] = seconds
+    ('partitions',  '<u4'), # Readout group/environment word
+    ('countVer',    '<u4'), # [23:0] = event counter, [31:24] = header version
+    ('triggerInfo', '<u8'), # Trigger (L0/L1) information
+])
+EVENT_HEADER_SIZE = EVENT_HEADER_RAW_DTYPE.itemsize
+
+# Decoded event header columns. The header carries no event codes: the
+# LCLS-I event code mask stays in the timing frame and never reaches the
+# trigger/transition sub-frames. What selected the event is given instead
+# by 'partitions' (the readout groups it was triggered for) and 'control'
+# (transition ID, 12 = L1Accept), with the trigger word in 'triggerInfo'.
+EVENT_HEADER_DTYPE = np.dtype([
+    ('channel',     'u1'),
+    ('pulseId',     '<u8'),
+    ('control',     'u1'),
+    ('timeStamp',   '<u8'),
+    ('seconds',     '<u4'),
+    ('nanoseconds', '<u4'),
+    ('partitions',  '<u4'),
+    ('count',       '<u4'),
+    ('version',     'u1'),
+    ('triggerInfo', '<u8'),
+])
+
+def packEventHeader(pulseId, timeStamp, partitions=0x1, count=0, version=0, control=0, triggerInfo=0):
+    hdr = np.zeros(1, dtype=EVENT_HEADER_RAW_DTYPE)
+    hdr['pulseIdCtl']  = (pulseId & PULSE_ID_MASK) | ((control & 0xFF) << 56)
+    hdr['timeStamp']   = timeStamp
+    hdr['partitions']  = partitions
+    hdr['countVer']    = (count & 0xFF_FFFF) | ((version & 0xFF) << 24)
+    hdr['triggerInfo'] = triggerInfo
+    return hdr.view(np.uint8)
+
+def decodeEventHeaders(raw, channel=0):
+    # raw: EVENT_HEADER_RAW_DTYPE array (or bytes holding whole headers back to back)
+    if not isinstance(raw, np.ndarray) or raw.dtype != EVENT_HEADER_RAW_DTYPE:
+        raw = np.frombuffer(raw, dtype=EVENT_HEADER_RAW_DTYPE)
+
+    ret = np.empty(raw.size, dtype=EVENT_HEADER_DTYPE)
+    ret['channel']     = channel
+    ret['pulseId']     = raw['pulseIdCtl'] & np.uint64(PULSE_ID_MASK)
+    ret['control']     = raw['pulseIdCtl'] >> np.uint64(56)
+    ret['timeStamp']   = raw['timeStamp']
+    ret['seconds']     = raw['timeStamp'] >> np.uint64(32)
+    ret['nanoseconds'] = raw['timeStamp'] & np.uint64(0xFFFF_FFFF)
+    ret['partitions']  = raw['partitions']
+    ret['count']       = raw['countVer'] & np.uint32(0xFF_FFFF)
+    ret['version']     = raw['countVer'] >> np.uint32(24)
+    ret['triggerInfo'] = raw['triggerInfo']
+    return ret
+
+def decodeEventHeaderFrames(frames):
+    # Many rogue header frames -> one structured array. Only the header bytes
+    # of each frame are copied, short frames are zero padded.
+    buff     = np.zeros((len(frames), EVENT_HEADER_SIZE), dtype=np.uint8)
+    channels = np.empty(len(frames), dtype=np.uint8)
+
+    for i, frame in enumerate(frames):
+        size = min(frame.getPayload(), EVENT_HEADER_SIZE)
+        buff[i, :size] = frame.getNumpy(0, size)
+        channels[i]    = frame.getChannel()
+
+    ret = decodeEventHeaders(buff.reshape(-1).view(EVENT_HEADER_RAW_DTYPE))
+    ret['channel'] = channels
+    return ret
+
+def decodeSuperFrameHeaders(buff, channels=(0, 1), table=None):
+    # All the trigger/transition headers of one batcher v1 super-frame, gathered
+    # with a single fancy index instead of one Frame per sub-frame
+    buff = np.asarray(buff, dtype=np.uint8).reshape(-1)
+    if table is None:
+        table = parseSuperFrame(buff)
+
+    table = table[np.isin(table['dest'], channels)]
+
+    idx   = table['offset'].astype(np.intp)[:, None] + np.arange(EVENT_HEADER_SIZE)
+    valid = np.arange(EVENT_HEADER_SIZE) < table['size'][:, None]
+    hdrs  = np.where(valid, buff[np.minimum(idx, buff.size - 1)], 0).astype(np.uint8)
+
+    ret = decodeEventHeaders(hdrs.reshape(-1).view(EVENT_HEADER_RAW_DTYPE))
+    ret['channel'] = table['dest']
+    return ret
+
+class EventHeaderBlockDecoder(rogue.interfaces.stream.Slave):
+    # Copies the header bytes of each trigger/transition frame into a block
+    # and hands the decoded EVENT_HEADER_DTYPE array of the whole block to the
+    # handlers once blockSize headers have been collected (or on flush()).
+    def __init__(self, blockSize=1024, channels=(0, 1)):
+        rogue.interfaces.stream.Slave.__init__(self)
+
+        # Set local variables
+        self.blockSize = blockSize
+        self.channels  = set(channels)
+
+        self._lock     = threading.Lock()
+        self._handlers = []
+        self._buff     = np.zeros((blockSize, EVENT_HEADER_SIZE), dtype=np.uint8)
+        self._chan     = np.zeros(blockSize, dtype=np.uint8)
+        self._count    = 0
+
+    def addBlockHandler(self, func):
+        # func(headers) with headers an EVENT_HEADER_DTYPE array
+        self._handlers.append(func)
+
+    def flush(self):
+        with self._lock:
+            block = self._decode()
+        if block is not None:
+            for func in self._handlers:
+                func(block)
+
+    def _decode(self):
+        if self._count == 0:
+            return None
+
+        ret = decodeEventHeaders(self._buff[:self._count].reshape(-1).view(EVENT_HEADER_RAW_DTYPE))
+        ret['channel'] = self._chan[:self._count]
+
+        self._buff[:self._count] = 0
+        self._count = 0
+        return ret
+
+    def _acceptFrame(self, frame):
+        channel = frame.getChannel()
+        if channel not in self.channels:
+            return
+
+        size  = min(frame.getPayload(), EVENT_HEADER_SIZE)
+        block = None
+
+        with self._lock:
+            self._buff[self._count, :size] = frame.getNumpy(0, size)
+            self._chan[self._count] = channel
+            self._count += 1
+
+            if self._count == self.blockSize:
+                block = self._decode()
+
+        if block is not None:
+            for func in self._handlers:
+                func(block)
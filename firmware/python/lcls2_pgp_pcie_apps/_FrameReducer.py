@@ -0,0 +1,289 @@
+#-----------------------------------------------------------------------------
+# This file is part of the 'lcls2-pgp-pcie-apps'. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the 'lcls2-pgp-pcie-apps', including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+import multiprocessing as mp
+import queue
+import threading
+import time
+
+import numpy as np
+import rogue
+
+def _newPartial(shape, numRois):
+    rows, cols = shape
+    return {
+        'shape'     : shape,
+        'frames'    : 0,
+        'sum'       : np.zeros(shape, dtype=np.float64),
+        'sumSq'     : np.zeros(shape, dtype=np.float64),
+        'roiSum'    : np.zeros(numRois, dtype=np.float64),
+        'roiSumSq'  : np.zeros(numRois, dtype=np.float64),
+        'profX'     : np.zeros(cols, dtype=np.float64),
+        'profY'     : np.zeros(rows, dtype=np.float64),
+        'saturated' : 0,  # Saturated pixels
+        'satFrames' : 0,  # Frames with at least one saturated pixel
+    }
+
+def _reduceWorker(tasks, results, width, dtype, rois, saturation, mergeInterval):
+    partial  = None
+    lastSend = time.monotonic()
+
+    def send():
+        nonlocal partial, lastSend
+        if partial is not None and partial['frames'] > 0:
+            results.put(partial)
+            partial = _newPartial(partial['shape'], len(rois))
+        lastSend = time.monotonic()
+
+    while True:
+        try:
+            data = tasks.get(timeout=mergeInterval)
+        except queue.Empty:
+            send()
+            continue
+
+        # Shutdown sentinel
+        if data is None:
+            send()
+            break
+
+        img = np.frombuffer(data, dtype=dtype)
+        img = img[:img.size - img.size % width].reshape(-1, width)
+
+        # A camera reconfiguration changes the image size, restart the accumulation
+        if partial is None or partial['shape'] != img.shape:
+            send()
+            partial = _newPartial(img.shape, len(rois))
+
+        f = img.astype(np.float64)
+        partial['frames'] += 1
+        partial['sum']    += f
+        partial['sumSq']  += f * f
+        partial['profX']  += f.sum(axis=0)
+        partial['profY']  += f.sum(axis=1)
+
+        for i, (r0, r1, c0, c1) in enumerate(rois):
+            s = f[r0:r1, c0:c1].sum()
+            partial['roiSum'][i]   += s
+            partial['roiSumSq'][i] += s * s
+
+        if saturation is not None:
+            sat = int(np.count_nonzero(img >= saturation))
+            partial['saturated'] += sat
+            partial['satFrames'] += sat > 0
+
+        if time.monotonic() - lastSend >= mergeInterval:
+            send()
+
+class FrameReducer(rogue.interfaces.stream.Slave):
+    # Online camera reduction off the DMA path. Frames on the camera channel
+    # (optionally only every decimate-th one) are copied once and handed to
+    # a pool of worker processes through a bounded queue. When the queue is
+    # full the frame is dropped and counted, the receive thread never waits.
+    # Workers accumulate vectorized reductions and send partial sums back
+    # every mergeInterval, which are merged here into:
+    #   mean/variance image, x/y projected profiles, ROI sum mean/std
+    #   and saturated pixel/frame counts
+    # results() returns the merge of the last window, totals() everything
+    # since start (or reset()).
+    def __init__(self,
+                 width,                   # Pixels per image row
+                 dtype         = '<u2',
+                 channel       = 2,       # Raw camera data channel
+                 rois          = (),      # [(row0, row1, col0, col1)]
+                 saturation    = None,    # Pixel value counted as saturated
+                 decimate      = 1,       # Reduce every Nth frame
+                 numWorkers    = 2,
+                 queueDepth    = 64,      # Frames waiting for a worker before frames are dropped
+                 mergeInterval = 1.0):    # Seconds between worker partial results
+        rogue.interfaces.stream.Slave.__init__(self)
+
+        # Set local variables
+        self.width         = width
+        self.dtype         = np.dtype(dtype)
+        self.channel       = channel
+        self.rois          = [tuple(int(v) for v in roi) for roi in rois]
+        self.saturation    = saturation
+        self.decimate      = max(1, int(decimate))
+        self.numWorkers    = numWorkers
+        self.queueDepth    = queueDepth
+        self.mergeInterval = mergeInterval
+
+        # Spawn (not fork) so the workers never inherit rogue threads from this process
+        self._ctx     = mp.get_context('spawn')
+        self._tasks   = None
+        self._results = None
+        self._workers = []
+        self._merger  = None
+        self._lock    = threading.Lock()
+        self._window  = None
+        self._total   = None
+        self._seen    = 0
+        self._sent    = 0
+        self._dropped = 0
+
+    @property
+    def counters(self):
+        return {'Frames': self._seen, 'Reduced': self._sent, 'Dropped': self._dropped}
+
+    def _submit(self, tasks, data):
+        self._seen += 1
+        if (self._seen - 1) % self.decimate != 0:
+            return
+
+        try:
+            tasks.put_nowait(data)
+            self._sent += 1
+        except queue.Full:
+            self._dropped += 1
+
+    def _acceptFrame(self, frame):
+        tasks = self._tasks
+        if tasks is None or frame.getChannel() != self.channel or frame.getError():
+            return
+        # One copy, straight out of the frame buffer
+        data = bytearray(frame.getPayload())
+        frame.read(data, 0)
+        self._submit(tasks, data)
+
+    def acceptBatch(self, buff, table):
+        # SuperFrameUnbatcher batch handler
+        tasks = self._tasks
+        if tasks is None:
+            return
+        for i in np.flatnonzero(table['dest'] == self.channel):
+            off = int(table['offset'][i])
+            self._submit(tasks, buff[off:off+int(table['size'][i])].tobytes())
+
+    @staticmethod
+    def _merge(into, partial):
+        if into is None or into['shape'] != partial['shape']:
+            return {k: (v.copy() if isinstance(v, np.ndarray) else v) for k, v in partial.items()}
+        for k, v in partial.items():
+            if k != 'shape':
+                into[k] += v
+        return into
+
+    def _mergeLoop(self):
+        window    = None
+        windowEnd = time.monotonic() + self.mergeInterval
+
+        while True:
+            try:
+                partial = self._results.get(timeout=self.mergeInterval)
+            except queue.Empty:
+                partial = None
+            except (EOFError, OSError):
+                break
+
+            if partial is not None:
+                if isinstance(partial, str):
+                    break
+                window = self._merge(window, partial)
+                with self._lock:
+                    self._total = self._merge(self._total, partial)
+
+            if time.monotonic() >= windowEnd:
+                with self._lock:
+                    self._window = window
+                window    = None
+                windowEnd = time.monotonic() + self.mergeInterval
+
+    @staticmethod
+    def _reduce(acc):
+        if acc is None or acc['frames'] == 0:
+            return None
+
+        n    = acc['frames']
+        mean = acc['sum'] / n
+        return {
+            'Frames'    : n,
+            'Mean'      : mean,
+            'Variance'  : np.maximum(acc['sumSq'] / n - mean * mean, 0.0),
+            'ProfileX'  : acc['profX'] / n,
+            'ProfileY'  : acc['profY'] / n,
+            'RoiMean'   : acc['roiSum'] / n,
+            'RoiStd'    : np.sqrt(np.maximum(acc['roiSumSq'] / n - (acc['roiSum'] / n)**2, 0.0)),
+            'Saturated' : acc['saturated'],
+            'SatFrames' : acc['satFrames'],
+        }
+
+    def results(self):
+        with self._lock:
+            return self._reduce(self._window)
+
+    def totals(self):
+        with self._lock:
+            return self._reduce(self._total)
+
+    def reset(self):
+        with self._lock:
+            self._window = None
+            self._total  = None
+
+    def _start(self):
+        if self._workers:
+            return
+
+        self._tasks   = self._ctx.Queue(maxsize=self.queueDepth)
+        self._results = self._ctx.Queue()
+
+        for i in range(self.numWorkers):
+            worker = self._ctx.Process(
+                name   = f'FrameReducer[{i}]',
+                target = _reduceWorker,
+                args   = (self._tasks, self._results, self.width, self.dtype.str, self.rois, self.saturation, self.mergeInterval),
+                daemon = True,
+            )
+            worker.start()
+            self._workers.append(worker)
+
+        self._merger = threading.Thread(target=self._mergeLoop, name='FrameReducerMerge', daemon=True)
+        self._merger.start()
+
+    def _stop(self, timeout=5.0):
+        if not self._workers:
+            return
+
+        # A dead worker can leave the queue full: give up on the sentinels
+        # after the timeout and terminate whatever is still running
+        tasks, self._tasks = self._tasks, None
+        for _ in self._workers:
+            try:
+                tasks.put(None, timeout=timeout)
+            except queue.Full:
+                break
+
+        for worker in self._workers:
+            worker.join(timeout)
+            if worker.is_alive():
+                worker.terminate()
+        self._workers = []
+
+        # Workers flushed their last partials before exiting
+        self._results.put('stop')
+        self._merger.join()
+        self._merger = None
+
+    def __enter__(self):
+        self._start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._stop()
+
+    @staticmethod
+    def formatSummary(name, counters, res):
+        line = f'{name}: {counters["Frames"]} frames, {counters["Reduced"]} reduced, {counters["Dropped"]} dropped'
+        if res is None:
+            return line
+        line += f', window {res["Frames"]} frames, mean {res["Mean"].mean():.2f}, saturated {res["Saturated"]} px in {res["SatFrames"]} frames'
+        for i, (m, s) in enumerate(zip(res['RoiMean'], res['RoiStd'])):
+            line += f', ROI[{i}] {m:.1f}+/-{s:.1f}'
+        return line
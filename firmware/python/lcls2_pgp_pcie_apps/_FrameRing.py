@@ -0,0 +1,333 @@
+#-----------------------------------------------------------------------------
+# This file is part of the 'lcls2-pgp-pcie-apps'. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the 'lcls2-pgp-pcie-apps', including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+import contextlib
+import fcntl
+import os
+import tempfile
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+import rogue
+
+FRAME_RING_MAGIC   = 0x4C43_4C53_5249_4E47 # 'LCLSRING'
+FRAME_RING_VERSION = 1
+
+# Ring header, followed by the reader table, the slot table and the slot data
+_HEADER_DTYPE = np.dtype([
+    ('magic',      '<u8'),
+    ('version',    '<u4'),
+    ('numSlots',   '<u4'),
+    ('slotSize',   '<u4'),
+    ('maxReaders', '<u4'),
+    ('writeSeq',   '<u8'), # Sequence number of the last published frame, 0 = none yet
+    ('oversize',   '<u8'), # Frames larger than slotSize, not published
+])
+
+READER_DTYPE = np.dtype([
+    ('pid',    '<u8'), # 0 = free entry
+    ('cursor', '<u8'), # Sequence number of the last frame consumed
+    ('drops',  '<u8'), # Frames overwritten before the reader got to them
+])
+
+SLOT_DTYPE = np.dtype([
+    ('seq',     '<u8'), # 2*frameSeq when valid, odd while the writer fills it
+    ('size',    '<u4'),
+    ('channel', 'u1'),
+    ('error',   'u1'),
+    ('flags',   '<u2'),
+])
+
+def _lockPath(name):
+    return os.path.join(tempfile.gettempdir(), f'{name}.lock')
+
+@contextlib.contextmanager
+def _readerTableLock(name):
+    # Serializes reader attach/detach between processes
+    with open(_lockPath(name), 'a+') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def _alive(pid):
+    # Readers killed before close() leave their entry behind
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+# Rings created by writers in this process
+_created = set()
+
+class _RingMap:
+    # numpy views of one ring's shared memory
+    def __init__(self, name, create=False, numSlots=0, slotSize=0, maxReaders=0):
+        if create:
+            size = (_HEADER_DTYPE.itemsize + maxReaders * READER_DTYPE.itemsize +
+                    numSlots * SLOT_DTYPE.itemsize + numSlots * slotSize)
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+            _created.add(name)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+
+            # Attaching registers the segment with this process's resource
+            # tracker, which would unlink the writer's ring when a reader exits.
+            # A writer in this process shares the registration: keep it for its unlink().
+            if name not in _created:
+                resource_tracker.unregister(self.shm._name, 'shared_memory')
+
+        buf         = self.shm.buf
+        self.header = np.ndarray((), dtype=_HEADER_DTYPE, buffer=buf, offset=0)
+
+        if create:
+            self.header['magic']      = FRAME_RING_MAGIC
+            self.header['version']    = FRAME_RING_VERSION
+            self.header['numSlots']   = numSlots
+            self.header['slotSize']   = slotSize
+            self.header['maxReaders'] = maxReaders
+            self.header['writeSeq']   = 0
+            self.header['oversize']   = 0
+        elif int(self.header['magic']) != FRAME_RING_MAGIC or int(self.header['version']) != FRAME_RING_VERSION:
+            self.close()
+            raise ValueError(f'{name} is not a version {FRAME_RING_VERSION} frame ring')
+
+        self.numSlots   = int(self.header['numSlots'])
+        self.slotSize   = int(self.header['slotSize'])
+        self.maxReaders = int(self.header['maxReaders'])
+
+        offset       = _HEADER_DTYPE.itemsize
+        self.readers = np.ndarray((self.maxReaders,), dtype=READER_DTYPE, buffer=buf, offset=offset)
+        offset      += self.maxReaders * READER_DTYPE.itemsize
+        self.slots   = np.ndarray((self.numSlots,), dtype=SLOT_DTYPE, buffer=buf, offset=offset)
+        offset      += self.numSlots * SLOT_DTYPE.itemsize
+        self.data    = np.ndarray((self.numSlots, self.slotSize), dtype=np.uint8, buffer=buf, offset=offset)
+
+        if create:
+            self.readers[:] = 0
+            self.slots[:]   = 0
+
+    def close(self):
+        # Drop the numpy views before releasing the mapping
+        self.header  = None
+        self.readers = None
+        self.slots   = None
+        self.data    = None
+
+        # RingFrame views still held by the caller keep the mapping alive until they are freed
+        with contextlib.suppress(BufferError):
+            self.shm.close()
+
+class FrameRingWriter(rogue.interfaces.stream.Slave):
+    # Publishes every received frame into a shared-memory ring of fixed size
+    # slots. The writer never waits on readers: each slot carries the
+    # sequence number of the frame in it (odd while being written), so a
+    # reader that falls more than numSlots behind simply finds its frames
+    # overwritten and counts them as drops. Any number of local processes can
+    # attach a FrameRingReader by name and map the frames without copying.
+    def __init__(self, name, numSlots=1024, slotSize=1 << 20, maxReaders=16):
+        rogue.interfaces.stream.Slave.__init__(self)
+
+        self.name = name
+        self._map = _RingMap(name, create=True, numSlots=numSlots, slotSize=slotSize, maxReaders=maxReaders)
+        self._seq = 0
+
+    @property
+    def frameCount(self):
+        return self._seq
+
+    def _publish(self, size, fill, channel, error, flags):
+        m = self._map
+        if size > m.slotSize:
+            m.header['oversize'] += 1
+            return
+
+        seq  = self._seq + 1
+        idx  = seq % m.numSlots
+        slot = m.slots[idx]
+
+        # Odd sequence: readers of the previous frame in this slot see it is gone
+        slot['seq'] = 2*seq - 1
+        fill(m.data[idx, :size])
+        slot['size']    = size
+        slot['channel'] = channel
+        slot['error']   = error
+        slot['flags']   = flags
+        slot['seq']     = 2*seq
+
+        m.header['writeSeq'] = seq
+        self._seq = seq
+
+    def _acceptFrame(self, frame):
+        if self._map is None:
+            return
+        self._publish(frame.getPayload(), lambda buf: frame.read(buf, 0),
+                      frame.getChannel(), frame.getError(), frame.getFlags())
+
+    def acceptBatch(self, buff, table):
+        # SuperFrameUnbatcher batch handler
+        if self._map is None:
+            return
+        for off, size, dest, firstUser, lastUser in table.tolist():
+            self._publish(size, lambda buf: buf.__setitem__(slice(None), buff[off:off+size]),
+                          dest, 0, (lastUser << 8) | firstUser)
+
+    def readerStats(self):
+        # {pid: {'Lag': frames behind the writer, 'Drops': frames lost}}
+        m   = self._map
+        ret = {}
+        with _readerTableLock(self.name):
+            for r in m.readers:
+                if r['pid'] != 0 and _alive(int(r['pid'])):
+                    ret[int(r['pid'])] = {'Lag': self._seq - int(r['cursor']), 'Drops': int(r['drops'])}
+        return ret
+
+    def oversize(self):
+        return int(self._map.header['oversize'])
+
+    def close(self):
+        if self._map is None:
+            return
+        m, self._map = self._map, None
+        m.close()
+        with contextlib.suppress(FileNotFoundError):
+            m.shm.unlink()
+        _created.discard(self.name)
+        with contextlib.suppress(OSError):
+            os.remove(_lockPath(self.name))
+
+    def _start(self):
+        pass
+
+    def _stop(self):
+        self.close()
+
+    @staticmethod
+    def formatTable(writers):
+        lines = [f'{"Ring":<24} {"Frames":>12} {"Oversize":>9} {"Reader":>8} {"Lag":>8} {"Drops":>12}']
+        for w in writers:
+            if w._map is None:
+                continue
+            readers = w.readerStats() or {'-': {'Lag': '-', 'Drops': '-'}}
+            for pid, r in readers.items():
+                lines.append(f'{w.name:<24} {w.frameCount:>12} {w.oversize():>9} {pid:>8} {r["Lag"]:>8} {r["Drops"]:>12}')
+        return '\n'.join(lines)
+
+class FrameRingReader:
+    # Attaches to a FrameRingWriter ring by name. next() returns a zero-copy
+    # RingFrame for the next unread frame. The view stays valid until the
+    # writer comes back around to its slot, so check frame.valid() after
+    # using it (or copy first) when the reader may lag by numSlots frames.
+    def __init__(self, name, pollInterval=0.0002):
+        self.name         = name
+        self.pollInterval = pollInterval
+        self._map         = _RingMap(name)
+
+        # Start at the current write position
+        with _readerTableLock(name):
+            for entry in self._map.readers:
+                if entry['pid'] != 0 and not _alive(int(entry['pid'])):
+                    entry['pid'] = 0
+
+            free = np.flatnonzero(self._map.readers['pid'] == 0)
+            if free.size == 0:
+                self._map.close()
+                raise RuntimeError(f'{name}: all {self._map.maxReaders} reader entries in use')
+            self._index = int(free[0])
+            entry = self._map.readers[self._index]
+            entry['cursor'] = self._map.header['writeSeq']
+            entry['drops']  = 0
+            entry['pid']    = os.getpid()
+
+    @property
+    def _entry(self):
+        return self._map.readers[self._index]
+
+    @property
+    def lag(self):
+        return int(self._map.header['writeSeq']) - int(self._entry['cursor'])
+
+    @property
+    def drops(self):
+        return int(self._entry['drops'])
+
+    def next(self, timeout=None):
+        m     = self._map
+        entry = self._entry
+        end   = None if timeout is None else time.monotonic() + timeout
+
+        while True:
+            writeSeq = int(m.header['writeSeq'])
+            cursor   = int(entry['cursor'])
+
+            if writeSeq > cursor:
+                # Skip what the writer has already overwritten
+                oldest = writeSeq - m.numSlots + 1
+                if cursor + 1 < oldest:
+                    entry['drops'] += oldest - cursor - 1
+                    cursor = oldest - 1
+
+                seq  = cursor + 1
+                slot = m.slots[seq % m.numSlots]
+                meta = slot.copy()
+                entry['cursor'] = seq
+
+                if int(meta['seq']) != 2*seq:
+                    # Overwritten between the checks above and here
+                    entry['drops'] += 1
+                    continue
+
+                return RingFrame(self, seq, m.data[seq % m.numSlots, :int(meta['size'])],
+                                 int(meta['channel']), int(meta['error']), int(meta['flags']))
+
+            if end is not None and time.monotonic() >= end:
+                return None
+            time.sleep(self.pollInterval)
+
+    def __iter__(self):
+        while True:
+            yield self.next()
+
+    def _valid(self, seq):
+        return int(self._map.slots[seq % self._map.numSlots]['seq']) == 2*seq
+
+    def close(self):
+        with _readerTableLock(self.name):
+            self._entry['pid'] = 0
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+class RingFrame:
+    # One frame in a ring slot: data is a uint8 view of the shared memory
+    def __init__(self, reader, seq, data, channel, error, flags):
+        self._reader = reader
+        self.seq     = seq
+        self.data    = data
+        self.channel = channel
+        self.error   = error
+        self.flags   = flags
+
+    def valid(self):
+        # False once the writer has reused the slot
+        return self._reader._valid(self.seq)
+
+    def copy(self):
+        # Detached copy of the payload, None if the slot was already reused
+        data = self.data.copy()
+        return data if self.valid() else None
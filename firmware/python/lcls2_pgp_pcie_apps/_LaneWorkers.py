@@ -0,0 +1,136 @@
+#-----------------------------------------------------------------------------
+# This file is part of the 'lcls2-pgp-pcie-apps'. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the 'lcls2-pgp-pcie-apps', including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+import multiprocessing as mp
+from multiprocessing import shared_memory
+
+import numpy as np
+import rogue
+
+from lcls2_pgp_pcie_apps._StreamStats import StreamStats, STATS_FIELDS, STATS_CHANNELS
+
+class CounterBlock:
+    # Shared memory block holding one StreamStats.snapshot() array behind a
+    # sequence word. The writer makes the sequence odd while updating so the
+    # reader can retry instead of taking a lock across processes.
+    def __init__(self, name=None, create=False, shape=(STATS_CHANNELS, len(STATS_FIELDS))):
+        nbytes = 8 * (1 + int(np.prod(shape)))
+
+        self.shm    = shared_memory.SharedMemory(name=name, create=create, size=nbytes)
+        self.name   = self.shm.name
+        self._owner = create
+        self._seq   = np.ndarray((1,), dtype=np.uint64, buffer=self.shm.buf, offset=0)
+        self._data  = np.ndarray(shape, dtype=np.uint64, buffer=self.shm.buf, offset=8)
+
+        if create:
+            self._seq[0]  = 0
+            self._data[:] = 0
+
+    def write(self, values):
+        self._seq[0] += 1
+        self._data[:] = values
+        self._seq[0] += 1
+
+    def read(self, out=None, retries=100):
+        if out is None:
+            out = np.empty_like(self._data)
+
+        for _ in range(retries):
+            seq = int(self._seq[0])
+            if seq & 0x1 == 0:
+                out[:] = self._data
+                if int(self._seq[0]) == seq:
+                    return out
+
+        # Writer kept the block busy, return the last (possibly torn) copy
+        out[:] = self._data
+        return out
+
+    def close(self):
+        # Drop the numpy views before releasing the mapping
+        self._seq  = None
+        self._data = None
+        self.shm.close()
+        if self._owner:
+            self.shm.unlink()
+
+def _laneWorker(dev, lane, dataVc, blockName, stopEvent, publishPeriod):
+    block = CounterBlock(name=blockName)
+
+    # Each lane gets its own DMA channel, unbatcher and counters in its own interpreter
+    dmaStream = rogue.hardware.axi.AxiStreamDma(dev, (0x100*lane)+dataVc, 1)
+    unbatcher = rogue.protocols.batcher.SplitterV1()
+    stats     = StreamStats(name=f'Lane[{lane}]')
+    dmaStream >> unbatcher >> stats
+
+    scratch = np.zeros((stats.numChannels, len(STATS_FIELDS)), dtype=np.uint64)
+
+    try:
+        while not stopEvent.wait(publishPeriod):
+            block.write(stats.snapshot(scratch))
+        block.write(stats.snapshot(scratch))
+    finally:
+        block.close()
+
+class LaneWorkerPool:
+    def __init__(self,
+                 dev           = '/dev/datadev_0',
+                 lanes         = range(4),
+                 dataVc        = 1,
+                 publishPeriod = 0.1): # seconds between counter publications from each worker
+
+        # Set local variables
+        self.dev           = dev
+        self.lanes         = list(lanes)
+        self.dataVc        = dataVc
+        self.publishPeriod = publishPeriod
+
+        # Spawn (not fork) so the workers never inherit rogue threads from this process
+        self._ctx     = mp.get_context('spawn')
+        self._stop    = self._ctx.Event()
+        self._blocks  = {}
+        self._workers = {}
+
+    def start(self):
+        for lane in self.lanes:
+            self._blocks[lane]  = CounterBlock(create=True)
+            self._workers[lane] = self._ctx.Process(
+                name   = f'LaneWorker[{lane}]',
+                target = _laneWorker,
+                args   = (self.dev, lane, self.dataVc, self._blocks[lane].name, self._stop, self.publishPeriod),
+                daemon = True,
+            )
+            self._workers[lane].start()
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+
+        for worker in self._workers.values():
+            worker.join(timeout)
+            if worker.is_alive():
+                worker.terminate()
+
+        for block in self._blocks.values():
+            block.close()
+
+        self._workers = {}
+        self._blocks  = {}
+
+    def snapshot(self, lane):
+        return self._blocks[lane].read()
+
+    def alive(self):
+        return {lane: worker.is_alive() for lane, worker in self._workers.items()}
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
@@ -0,0 +1,265 @@
+#-----------------------------------------------------------------------------
+# This file is part of the 'lcls2-pgp-pcie-apps'. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the 'lcls2-pgp-pcie-apps', including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+import fnmatch
+import http.server
+import json
+import logging
+import logging.handlers
+import re
+import threading
+import time
+
+import numpy as np
+import pyrogue as pr
+
+from lcls2_pgp_pcie_apps._RegisterMap import fieldOf, wordSpans, RawAccess
+
+# (metric group, device path pattern below the root). Every RO numeric
+# variable directly in a matching device is exported.
+DEFAULT_METRIC_GROUPS = [
+    ('pgp',          '*.Hsio.*Pgp*'),
+    ('eventbuilder', '*.EventBuilder'),
+    ('trigger',      '*.TriggerEventBuffer*'),
+    ('timing',       '*.TimingRx.TimingFrameRx'),
+    ('dma',          '*.DmaBuffer*'),
+]
+
+class MetricsExporter:
+    # Headless counter export. Most of these counters have no pollInterval,
+    # so their shadows are never refreshed: every period the selected
+    # variables are read from the hardware instead, raw (one block read per
+    # contiguous run, as the CounterEngine does) for plain register fields
+    # and through pyrogue get() for the rest. The values are published as
+    # Prometheus text on http://addr:port/metrics and/or appended as one
+    # JSON line per snapshot to a size-rotated file.
+    def __init__(self,
+                 root,
+                 device      = None,        # Device the registers are under, default = root.DevPcie
+                 groups      = None,        # [(group, devicePattern)], default = DEFAULT_METRIC_GROUPS
+                 period      = 1.0,
+                 port        = None,        # HTTP port, None = no endpoint, 0 = any free port
+                 addr        = '127.0.0.1',
+                 fileName    = None,        # JSON lines file, None = no file
+                 maxBytes    = 10 << 20,
+                 backupCount = 5):
+        self.root        = root
+        self.device      = root.DevPcie if device is None else device
+        self.groups      = list(DEFAULT_METRIC_GROUPS if groups is None else groups)
+        self.period      = period
+        self.port        = port
+        self.addr        = addr
+        self.fileName    = fileName
+        self.maxBytes    = maxBytes
+        self.backupCount = backupCount
+
+        self._metrics = None
+        self._raw     = None
+        self._spans   = None
+        self._plain   = None
+        self._other   = None
+        self._text    = ''
+        self._lock    = threading.Lock()
+        self._stopEv  = threading.Event()
+        self._thread  = None
+        self._server  = None
+        self._logger  = None
+
+    @property
+    def address(self):
+        if self._server is None:
+            return None
+        return f'http://{self._server.server_address[0]}:{self._server.server_address[1]}/metrics'
+
+    @staticmethod
+    def _metricName(group, name):
+        return 'lcls2_' + group + '_' + re.sub(r'[^a-zA-Z0-9_]', '_', name)
+
+    def _select(self):
+        # [(metricName, labels, var)]
+        metrics = []
+        for dev in self.device.deviceList:
+            path = dev.path.split('.', 1)[1] if '.' in dev.path else dev.path
+
+            group = next((g for g, pattern in self.groups if fnmatch.fnmatchcase(path, pattern)), None)
+            if group is None:
+                continue
+
+            lane   = re.findall(r'\[(\d+)\]', path)
+            labels = {'device': path}
+            if lane:
+                labels['lane'] = lane[-1]
+
+            for var in dev.variables.values():
+                if var.mode != 'RO' or isinstance(var, pr.BaseCommand):
+                    continue
+                if not isinstance(var.value(), (int, float, bool)):
+                    continue
+                metrics.append((self._metricName(group, var.name), labels, var))
+
+        return metrics
+
+    def _setup(self):
+        self._metrics = self._select()
+        self._raw     = RawAccess(self.device)
+
+        # Plain register fields: (metric index, field), read raw. Everything
+        # else (multi-word, signed, link variables, ...) goes through get().
+        self._plain = []
+        self._other = []
+        for i, (_, _, var) in enumerate(self._metrics):
+            field = fieldOf(var)
+            if field is None:
+                self._other.append(i)
+            else:
+                self._plain.append((i, field))
+
+        self._spans = wordSpans([f.address for _, f in self._plain])
+
+    def _read(self):
+        # Fresh value of every selected variable, in _metrics order
+        values = [None] * len(self._metrics)
+
+        words = {}
+        for addr, numWords in self._spans:
+            for i, word in enumerate(self._raw.read(addr, numWords)):
+                words[addr + 4*i] = word
+
+        for i, field in self._plain:
+            values[i] = (words[field.address] & field.mask) >> field.shift
+
+        for i in self._other:
+            values[i] = self._metrics[i][2].get(read=True)
+
+        return values
+
+    def snapshot(self):
+        # [(metricName, labels, value)] read from the hardware
+        if self._metrics is None:
+            self._setup()
+        # Counters stay ints, a float would round them past 2**53
+        return [(name, labels, self._number(value)) for (name, labels, _), value in zip(self._metrics, self._read())]
+
+    @staticmethod
+    def _number(value):
+        return float(value) if isinstance(value, (float, np.floating)) else int(value)
+
+    @staticmethod
+    def formatPrometheus(samples, timestamp=None):
+        lines = []
+        seen  = set()
+        # All samples of a metric family must be contiguous: group them by name, keeping the device order within each
+        for name, labels, value in sorted(samples, key=lambda s: s[0]):
+            if name not in seen:
+                lines.append(f'# TYPE {name} gauge')
+                seen.add(name)
+            lbl = ','.join(f'{k}="{v}"' for k, v in labels.items())
+            # Full precision: {:g} keeps only 6 digits, which flattens rate()/increase() on counters
+            text = f'{value:d}' if isinstance(value, int) else repr(float(value))
+            lines.append(f'{name}{{{lbl}}} {text}')
+
+        if timestamp is not None:
+            lines.append('# TYPE lcls2_metrics_timestamp_seconds gauge')
+            lines.append(f'lcls2_metrics_timestamp_seconds {timestamp:.3f}')
+
+        return '\n'.join(lines) + '\n'
+
+    def _update(self):
+        now     = time.time()
+        samples = self.snapshot()
+        text    = self.formatPrometheus(samples, now)
+
+        with self._lock:
+            self._text = text
+
+        if self._logger is not None:
+            self._logger.info(json.dumps({
+                'time'    : now,
+                'metrics' : [{'name': n, **l, 'value': v} for n, l, v in samples],
+            }))
+
+    def _run(self):
+        while True:
+            try:
+                self._update()
+            except Exception as e:
+                print(f'MetricsExporter: snapshot failed: {e}')
+
+            if self._stopEv.wait(self.period):
+                break
+
+    def _makeHandler(self):
+        exporter = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+
+                with exporter._lock:
+                    body = exporter._text.encode()
+
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def _start(self):
+        if self._thread is not None:
+            return
+
+        if self.fileName is not None:
+            handler = logging.handlers.RotatingFileHandler(self.fileName, maxBytes=self.maxBytes, backupCount=self.backupCount)
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            self._logger = logging.getLogger(f'{__name__}.{id(self)}')
+            self._logger.propagate = False
+            self._logger.setLevel(logging.INFO)
+            self._logger.addHandler(handler)
+
+        if self.port is not None:
+            self._server = http.server.ThreadingHTTPServer((self.addr, self.port), self._makeHandler())
+            self._server.daemon_threads = True
+            threading.Thread(target=self._server.serve_forever, name='MetricsExporterHttp', daemon=True).start()
+
+        self._stopEv.clear()
+        self._thread = threading.Thread(target=self._run, name='MetricsExporter', daemon=True)
+        self._thread.start()
+
+    def _stop(self):
+        if self._thread is None:
+            return
+
+        self._stopEv.set()
+        self._thread.join()
+        self._thread = None
+
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+        if self._logger is not None:
+            for handler in list(self._logger.handlers):
+                handler.close()
+                self._logger.removeHandler(handler)
+            self._logger = None
+
+    def __enter__(self):
+        self._start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._stop()
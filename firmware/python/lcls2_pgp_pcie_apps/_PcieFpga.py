@@ -21,6 +21,7 @@ class PcieFpga(pr.Device):
                  enLclsII  = False,
                  useDdr    = False,
                  boardType = None,
+                 numLanes  = 4,     # Application/DDR lanes to build, the firmware always has 4
                  **kwargs):
         super().__init__(**kwargs)
 
@@ -33,7 +34,7 @@ class PcieFpga(pr.Device):
         ))
 
         if useDdr:
-            for i in range(4):
+            for i in range(numLanes):
                 self.add(axi.AxiStreamDmaV2Fifo(
                     name    = f'DmaBuffer[{i}]',
                     offset  = 0x0010_0000+i*0x100,
@@ -43,7 +44,7 @@ class PcieFpga(pr.Device):
         # Application layer
         self.add(shared.Application(
             offset   = 0x00C0_0000,
-            numLanes = 4,
+            numLanes = numLanes,
             expand   = False,
         ))
 
@@ -55,10 +56,5 @@ class PcieFpga(pr.Device):
             enLclsI    = enLclsI,
             enLclsII   = enLclsII,
             expand     = True,
-            laneConfig = {
-                0: 'TBD',
-                1: 'TBD',
-                2: 'TBD',
-                3: 'TBD',
-            },
+            laneConfig = {lane: 'TBD' for lane in range(numLanes)},
         ))
@@ -0,0 +1,249 @@
+#-----------------------------------------------------------------------------
+# This file is part of the 'lcls2-pgp-pcie-apps'. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the 'lcls2-pgp-pcie-apps', including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+import collections
+import fnmatch
+import threading
+import time
+
+import pyrogue as pr
+
+from lcls2_pgp_pcie_apps._RegisterMap import fieldOf, toNative, wordSpans, RawAccess
+
+# Tier name -> poll period in seconds, None = never polled
+DEFAULT_POLL_TIERS = collections.OrderedDict([
+    ('fast',   0.1),
+    ('status', 1.0),
+    ('slow',   10.0),
+    ('never',  None),
+])
+
+# (path pattern, tier) evaluated in order against the path below the root of
+# every polled variable, the first match wins, unmatched ones go to defaultTier.
+# Polled = pollInterval > 0 (what pyrogue polls) or matching the opt-in extra list.
+DEFAULT_POLL_RULES = [
+    ('*.AxiVersion.*',   'never'),
+    ('*Cnt*',            'fast'),
+    ('*Count*',          'fast'),
+    ('*Rate*',           'fast'),
+    ('*Link*',           'status'),
+    ('*Locked*',         'status'),
+    ('*.TimingRx.*',     'status'),
+]
+
+# Path patterns of variables pyrogue never polls (no pollInterval) that the
+# scheduler should poll anyway. Empty: every addition is new bus traffic.
+DEFAULT_POLL_EXTRA = []
+
+class _TokenBucket:
+    # Bus transaction budget shared by all the tiers
+    def __init__(self, rate, burst=None):
+        self.rate   = float(rate)
+        self.burst  = float(burst if burst is not None else max(1.0, rate/10.0))
+        self.tokens = self.burst
+        self.last   = time.monotonic()
+
+    def take(self, stopEvent):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+            self.last   = now
+
+            if self.tokens >= 1.0:
+                self.tokens -= 1.0
+                return True
+
+            if stopEvent.wait((1.0 - self.tokens) / self.rate):
+                return False
+
+class PollScheduler:
+    # Replacement for the pyrogue poll thread (use with pollEn=False). Each
+    # polled variable is assigned to a named tier by path pattern. On every
+    # tier period the single-word registers of the tier are read with one
+    # block transaction per contiguous run of addresses, anything else with
+    # a normal get(). All transactions draw from one budget of maxRate per
+    # second, a tier that cannot finish in its period is counted as overrun
+    # and simply starts again at its next period rather than queueing up.
+    def __init__(self,
+                 root,
+                 device      = None,  # Memory map hub for the block reads, default = root.DevPcie
+                 tiers       = None,  # {tier: period}, default = DEFAULT_POLL_TIERS
+                 rules       = None,  # [(pattern, tier)], default = DEFAULT_POLL_RULES
+                 extra       = None,  # Never-polled variable path patterns to poll too, default = DEFAULT_POLL_EXTRA
+                 defaultTier = 'slow',
+                 maxRate     = 1000,  # Bus transactions per second
+                 maxWords    = 64):   # Longest coalesced block read
+        self.root        = root
+        self.device      = device
+        self.tiers       = collections.OrderedDict(DEFAULT_POLL_TIERS if tiers is None else tiers)
+        self.rules       = list(DEFAULT_POLL_RULES if rules is None else rules)
+        self.extra       = list(DEFAULT_POLL_EXTRA if extra is None else extra)
+        self.defaultTier = defaultTier
+        self.maxRate     = maxRate
+        self.maxWords    = maxWords
+
+        self._plans     = None
+        self._stats     = {}
+        self._lock      = threading.Lock()
+        self._stopEvent = threading.Event()
+        self._thread    = None
+
+    def tierOf(self, var):
+        # Only what pyrogue would poll, plus the explicit opt-in list, the rules only pick the tier
+        path = var.path.split('.', 1)[1]
+        if not var.pollInterval and not any(fnmatch.fnmatchcase(path, p) for p in self.extra):
+            return None
+
+        for pattern, tier in self.rules:
+            if fnmatch.fnmatchcase(path, pattern):
+                return tier
+        return self.defaultTier
+
+    def _plan(self):
+        # tier -> (spans, {address: [(var, field)]}, fallback vars)
+        members = collections.defaultdict(list)
+        for var in self.root.variableList:
+            if not isinstance(var, pr.RemoteVariable) or isinstance(var, pr.BaseCommand):
+                continue
+            if var.mode == 'WO':
+                continue
+
+            tier = self.tierOf(var)
+            if tier is not None and self.tiers.get(tier) is not None:
+                members[tier].append(var)
+
+        plans = collections.OrderedDict()
+        for tier in self.tiers:
+            if tier not in members:
+                continue
+
+            fields   = collections.defaultdict(list)
+            fallback = []
+            for var in members[tier]:
+                field = fieldOf(var)
+                if field is None:
+                    fallback.append(var)
+                else:
+                    fields[field.address].append((var, field))
+
+            plans[tier] = (wordSpans(fields.keys(), self.maxWords), fields, fallback)
+
+        return plans
+
+    def plan(self):
+        # Per tier summary of what one poll cycle costs
+        if self._plans is None:
+            self._plans = self._plan()
+
+        ret = collections.OrderedDict()
+        for tier, (spans, fields, fallback) in self._plans.items():
+            ret[tier] = {
+                'Period'       : self.tiers[tier],
+                'Variables'    : sum(len(v) for v in fields.values()) + len(fallback),
+                'Transactions' : len(spans) + len(fallback),
+            }
+        return ret
+
+    def stats(self):
+        with self._lock:
+            return {tier: dict(s) for tier, s in self._stats.items()}
+
+    def _start(self):
+        if self._thread is not None:
+            return
+
+        if self.device is None:
+            self.device = self.root.DevPcie
+
+        self._plans = self._plan()
+        self._stats = {tier: {'Cycles': 0, 'Transactions': 0, 'Overruns': 0, 'Errors': 0, 'LastCycle': 0.0}
+                       for tier in self._plans}
+
+        self._stopEvent.clear()
+        self._thread = threading.Thread(target=self._run, name='PollScheduler', daemon=True)
+        self._thread.start()
+
+    def _stop(self):
+        if self._thread is None:
+            return
+
+        self._stopEvent.set()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        if not self._plans:
+            return
+
+        raw    = RawAccess(self.device)
+        bucket = _TokenBucket(self.maxRate)
+
+        now = time.monotonic()
+        due = {tier: now for tier in self._plans}
+
+        while not self._stopEvent.is_set():
+            tier = min(due, key=due.get)
+            if self._stopEvent.wait(max(0.0, due[tier] - time.monotonic())):
+                break
+
+            t0 = time.monotonic()
+            self._cycle(tier, raw, bucket)
+            t1 = time.monotonic()
+
+            period = self.tiers[tier]
+            with self._lock:
+                s = self._stats[tier]
+                s['Cycles']   += 1
+                s['LastCycle'] = t1 - t0
+                if t1 > due[tier] + period:
+                    s['Overruns'] += 1
+
+            # Never queue up missed periods
+            due[tier] = max(due[tier] + period, t1)
+
+    def _cycle(self, tier, raw, bucket):
+        spans, fields, fallback = self._plans[tier]
+        done = 0
+
+        try:
+            # set(write=False) notifies the listeners through the root update
+            # context: one group per cycle hands them the whole tier at once
+            with self.root.updateGroup():
+                for addr, numWords in spans:
+                    if not bucket.take(self._stopEvent):
+                        return
+
+                    for i, word in enumerate(raw.read(addr, numWords)):
+                        for var, field in fields.get(addr + 4*i, ()):
+                            var.set(toNative(var, (word & field.mask) >> field.shift), write=False)
+                    done += 1
+
+                for var in fallback:
+                    if not bucket.take(self._stopEvent):
+                        return
+                    var.get()
+                    done += 1
+
+        except Exception as e:
+            with self._lock:
+                self._stats[tier]['Errors'] += 1
+            print(f'PollScheduler: {tier} tier poll failed: {e}')
+
+        finally:
+            with self._lock:
+                self._stats[tier]['Transactions'] += done
+
+    @staticmethod
+    def formatTable(plan, stats=None):
+        lines = [f'{"Tier":<8} {"Period":>8} {"Vars":>6} {"Trans":>6} {"Cycles":>8} {"Overruns":>8}']
+        for tier, p in plan.items():
+            s = (stats or {}).get(tier, {})
+            lines.append(f'{tier:<8} {p["Period"]:>8.3f} {p["Variables"]:>6} {p["Transactions"]:>6} '
+                         f'{s.get("Cycles", 0):>8} {s.get("Overruns", 0):>8}')
+        return '\n'.join(lines)
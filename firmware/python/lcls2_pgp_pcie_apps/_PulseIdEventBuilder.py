@@ -0,0 +1,171 @@
+#-----------------------------------------------------------------------------
+# This file is part of the 'lcls2-pgp-pcie-apps'. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the 'lcls2-pgp-pcie-apps', including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+import collections
+import threading
+
+import rogue
+
+# The pulseId is the lower 56 bits of the first 64-bit word of the event header
+PULSE_ID_MASK = 0x00FF_FFFF_FFFF_FFFF
+
+def headerPulseId(frame):
+    return int.from_bytes(frame.getNumpy(0, 8).tobytes(), 'little') & PULSE_ID_MASK
+
+class PulseIdEventBuilder(rogue.interfaces.stream.Slave):
+    def __init__(self,
+                 name              = 'PulseIdEventBuilder',
+                 lane              = 0,
+                 depth             = 64,    # Max number of incomplete events held in the reorder buffer
+                 triggerChannel    = 0,     # XPM trigger message (header of a L1 event)
+                 transitionChannel = 1,     # XPM transition message (header only event)
+                 payloadChannel    = 2,     # PGP[lane].VC[VcDataTap] data
+                 payloadPulseId    = None): # Optional function(frame) returning the pulseId embedded in a payload
+        rogue.interfaces.stream.Slave.__init__(self)
+
+        # Set local variables
+        self.name              = name
+        self.lane              = lane
+        self.depth             = depth
+        self.triggerChannel    = triggerChannel
+        self.transitionChannel = transitionChannel
+        self.payloadChannel    = payloadChannel
+        self.payloadPulseId    = payloadPulseId
+
+        self._lock     = threading.Lock()
+        self._handlers = []
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            # pulseId -> [header, payloadFrame]
+            self._pending     = collections.OrderedDict()
+            self._lastEvicted = -1
+            self._counters    = {
+                'Events'         : 0,
+                'Transitions'    : 0,
+                'OrphanHeaders'  : 0,
+                'OrphanPayloads' : 0,
+                'LateArrivals'   : 0,
+            }
+
+    def addEventHandler(self, func):
+        # func(lane, pulseId, header, payload): header is a numpy copy of the
+        # event header, payload is the rogue Frame (only valid during the call)
+        # or None for transitions
+        self._handlers.append(func)
+
+    def counters(self):
+        with self._lock:
+            ret = dict(self._counters)
+            ret['Pending'] = len(self._pending)
+        return ret
+
+    def flush(self):
+        # Everything still incomplete at this point is an orphan
+        with self._lock:
+            while len(self._pending) > 0:
+                self._evictOldest()
+
+    def _emit(self, pulseId, header, payload):
+        for func in self._handlers:
+            func(self.lane, pulseId, header, payload)
+
+    def _evictOldest(self):
+        pulseId, (header, payload) = self._pending.popitem(last=False)
+        self._lastEvicted = max(self._lastEvicted, pulseId)
+
+        if header is None:
+            self._counters['OrphanPayloads'] += 1
+        else:
+            self._counters['OrphanHeaders'] += 1
+
+    def _insert(self, pulseId, header, payload):
+        self._pending[pulseId] = [header, payload]
+        while len(self._pending) > self.depth:
+            self._evictOldest()
+
+    def _acceptFrame(self, frame):
+        channel = frame.getChannel()
+
+        if channel == self.transitionChannel:
+            header  = frame.getNumpy(0, frame.getPayload())
+            pulseId = headerPulseId(frame)
+            with self._lock:
+                self._counters['Transitions'] += 1
+            self._emit(pulseId, header, None)
+
+        elif channel == self.triggerChannel:
+            header  = frame.getNumpy(0, frame.getPayload())
+            pulseId = headerPulseId(frame)
+            event   = None
+
+            with self._lock:
+                entry = self._pending.get(pulseId)
+
+                # Payload already waiting for this header
+                if entry is not None and entry[0] is None:
+                    del self._pending[pulseId]
+                    event = entry[1]
+                    self._counters['Events'] += 1
+
+                # Header for an event that has already been given up on
+                elif pulseId <= self._lastEvicted:
+                    self._counters['LateArrivals'] += 1
+
+                else:
+                    if entry is not None:
+                        self._counters['OrphanHeaders'] += 1
+                    self._insert(pulseId, header, None)
+
+            if event is not None:
+                self._emit(pulseId, header, event)
+
+        elif channel == self.payloadChannel:
+            header = None
+
+            with self._lock:
+                # Keyed by the pulseId carried in the payload
+                if self.payloadPulseId is not None:
+                    pulseId = self.payloadPulseId(frame)
+                    entry   = self._pending.get(pulseId)
+
+                    if entry is not None and entry[0] is not None and entry[1] is None:
+                        del self._pending[pulseId]
+                        header = entry[0]
+                        self._counters['Events'] += 1
+                    elif pulseId <= self._lastEvicted:
+                        self._counters['LateArrivals'] += 1
+                    else:
+                        if entry is not None:
+                            self._counters['OrphanPayloads'] += 1
+                        self._insert(pulseId, None, frame)
+
+                # The batcher places the header sub-frame ahead of its payload, so
+                # without a pulseId in the payload it belongs to the newest open header
+                else:
+                    pulseId = next(reversed(self._pending), None)
+
+                    if pulseId is not None and self._pending[pulseId][0] is not None:
+                        header = self._pending.pop(pulseId)[0]
+                        self._counters['Events'] += 1
+                    else:
+                        self._counters['OrphanPayloads'] += 1
+
+            if header is not None:
+                self._emit(pulseId, header, frame)
+
+    @staticmethod
+    def formatTable(builders):
+        fields = ['Events', 'Transitions', 'OrphanHeaders', 'OrphanPayloads', 'LateArrivals', 'Pending']
+        lines  = [f"{'Lane':<6}" + ''.join(f'{f:>16}' for f in fields)]
+        for builder in builders:
+            c = builder.counters()
+            lines.append(f'{builder.lane:<6}' + ''.join(f'{c[f]:>16}' for f in fields))
+        return '\n'.join(lines)
@@ -0,0 +1,132 @@
+#-----------------------------------------------------------------------------
+# This file is part of the 'lcls2-pgp-pcie-apps'. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the 'lcls2-pgp-pcie-apps', including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+import fnmatch
+import threading
+
+import pyrogue as pr
+import rogue
+
+from lcls2_pgp_pcie_apps._RegisterMap import fieldOf
+
+rim = rogue.interfaces.memory
+
+# RO variables (by name) that count up by one on every read
+DEFAULT_COUNTER_PATTERNS = ['*Cnt', '*Cnt[[]*', '*Count', '*Counter', '*Counter[[]*']
+
+# RO status bits (by name) that read back as all ones, so links and clocks look healthy
+DEFAULT_STATUS_PATTERNS = ['*Locked*', '*LinkReady*', '*LinkUp*', '*RxPhyReady*', '*TxPhyReady*']
+
+class RegisterEmulator(rim.Slave):
+    # In-process register space standing in for the PCIe memory map, so the
+    # whole DevRoot start/LoadConfig/StartRun/StopRun path runs without
+    # hardware or a firmware simulation. configure(root) derives the
+    # register behavior from the device tree:
+    #   - every single-word field starts at its variable default
+    #   - RO fields ignore writes
+    #   - command bits clear themselves after each write
+    #   - RO counters increment on every read, status bits read as ones
+    # Everything else is plain 32-bit RAM, zero at power up.
+    def __init__(self, minAccess=4, maxAccess=4096, counterPatterns=None, statusPatterns=None):
+        rim.Slave.__init__(self, minAccess, maxAccess)
+
+        self.counterPatterns = DEFAULT_COUNTER_PATTERNS if counterPatterns is None else counterPatterns
+        self.statusPatterns  = DEFAULT_STATUS_PATTERNS  if statusPatterns  is None else statusPatterns
+
+        self._lock     = threading.Lock()
+        self._words    = {}  # address -> value
+        self._roMask   = {}  # address -> bits not writable
+        self._clrMask  = {}  # address -> self-clearing bits
+        self._counters = {}  # address -> [(shift, mask)]
+
+        self.reads  = 0
+        self.writes = 0
+
+    @staticmethod
+    def _match(name, patterns):
+        return any(fnmatch.fnmatchcase(name, p) for p in patterns)
+
+    def configure(self, root):
+        with self._lock:
+            for var in root.variableList:
+                field = fieldOf(var, commands=True)
+                if field is None:
+                    continue
+
+                addr = field.address
+
+                if isinstance(var, pr.BaseCommand):
+                    self._clrMask[addr] = self._clrMask.get(addr, 0) | field.mask
+                    continue
+
+                if var.mode == 'RO':
+                    self._roMask[addr] = self._roMask.get(addr, 0) | field.mask
+
+                    if self._match(var.name, self.counterPatterns):
+                        self._counters.setdefault(addr, []).append((field.shift, field.mask))
+                        continue
+
+                    if self._match(var.name, self.statusPatterns):
+                        self._words[addr] = self._words.get(addr, 0) | field.mask
+                        continue
+
+                default = getattr(var, '_default', None)
+                if isinstance(default, (bool, int)) and default:
+                    value = (int(default) << field.shift) & field.mask
+                    self._words[addr] = (self._words.get(addr, 0) & ~field.mask) | value
+
+    def peek(self, address):
+        with self._lock:
+            return self._words.get(address, 0)
+
+    def poke(self, address, value):
+        # Backdoor write, ignores RO and self-clearing bits
+        with self._lock:
+            self._words[address] = value & 0xFFFF_FFFF
+
+    def _read(self, address, size):
+        data = bytearray(size)
+        for off in range(0, size, 4):
+            addr  = address + off
+            value = self._words.get(addr, 0)
+
+            for shift, mask in self._counters.get(addr, ()):
+                value = (value & ~mask) | ((((value & mask) >> shift) + 1) << shift & mask)
+            if addr in self._counters:
+                self._words[addr] = value
+
+            data[off:off+4] = value.to_bytes(4, 'little')
+        return data
+
+    def _write(self, address, data):
+        for off in range(0, len(data), 4):
+            addr  = address + off
+            new   = int.from_bytes(data[off:off+4].ljust(4, b'\0'), 'little')
+            ro    = self._roMask.get(addr, 0)
+            value = (self._words.get(addr, 0) & ro) | (new & ~ro)
+            self._words[addr] = value & ~self._clrMask.get(addr, 0) & 0xFFFF_FFFF
+
+    def _doTransaction(self, transaction):
+        with transaction.lock():
+            address  = transaction.address()
+            size     = transaction.size()
+            tranType = transaction.type()
+
+            with self._lock:
+                if tranType in (rim.Write, rim.Post):
+                    data = bytearray(size)
+                    transaction.getData(data, 0)
+                    self._write(address, data)
+                    self.writes += 1
+                else:
+                    # Read and Verify
+                    transaction.setData(self._read(address, size), 0)
+                    self.reads += 1
+
+            transaction.done()
@@ -0,0 +1,98 @@
+#-----------------------------------------------------------------------------
+# This file is part of the 'lcls2-pgp-pcie-apps'. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the 'lcls2-pgp-pcie-apps', including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+import collections
+
+import pyrogue as pr
+
+# A variable that lives inside one 32-bit register word
+RegisterField = collections.namedtuple('RegisterField', ['address', 'shift', 'mask', 'bitSize'])
+
+def absAddress(node):
+    # Byte address of a node in the memory map: every Device above it is a hub adding its offset
+    addr = node.offset
+    dev  = node.parent
+    while dev is not None and isinstance(dev, pr.Device):
+        addr += dev.offset
+        dev = dev.parent
+    return addr
+
+def fieldOf(var, commands=False):
+    # RegisterField of a plain unsigned/bool/enum RemoteVariable, None for
+    # anything that needs the full pyrogue encode path (multi-word, signed,
+    # float, strings, commands unless asked for, ...)
+    if not isinstance(var, pr.RemoteVariable):
+        return None
+
+    if isinstance(var, pr.BaseCommand) and not commands:
+        return None
+
+    # Exact model types: subclasses (e.g. UIntReversed) encode differently
+    if type(getattr(var, '_base', None)) not in (pr.UInt, pr.Bool):
+        return None
+
+    bitOffset = var.bitOffset
+    bitSize   = var.bitSize
+    if isinstance(bitOffset, (list, tuple)):
+        if len(bitOffset) != 1:
+            return None
+        bitOffset, bitSize = bitOffset[0], bitSize[0]
+
+    shift = bitOffset % 32
+    if shift + bitSize > 32:
+        return None
+
+    return RegisterField(
+        address = absAddress(var) + 4 * (bitOffset // 32),
+        shift   = shift,
+        mask    = ((1 << bitSize) - 1) << shift,
+        bitSize = bitSize,
+    )
+
+def toNative(var, raw):
+    # Register field value -> value accepted by var.set()
+    return bool(raw) if isinstance(var._base, pr.Bool) else int(raw)
+
+def wordSpans(addresses, maxWords=256):
+    # Sorted 32-bit word addresses -> [(firstAddress, numWords)] of contiguous runs
+    spans = []
+    for addr in sorted(set(addresses)):
+        if spans and addr == spans[-1][0] + 4 * spans[-1][1] and spans[-1][1] < maxWords:
+            spans[-1][1] += 1
+        else:
+            spans.append([addr, 1])
+    return [(a, n) for a, n in spans]
+
+class RawAccess:
+    # Block transactions against the memory map below 'device', bypassing the
+    # per-variable block path. Addresses are absolute (absAddress()).
+    def __init__(self, device):
+        self.device = device
+        self.base   = absAddress(device)
+        self.reads  = 0
+        self.writes = 0
+
+    def read(self, address, numWords=1):
+        ret = self.device._rawRead(offset=address - self.base, numWords=numWords)
+        self.reads += 1
+        return ret if isinstance(ret, list) else [ret]
+
+    def readSpans(self, addresses, maxWords=256):
+        # {address: value} of every requested word, one transaction per contiguous run
+        ret = {}
+        for addr, numWords in wordSpans(addresses, maxWords):
+            for i, value in enumerate(self.read(addr, numWords)):
+                ret[addr + 4 * i] = value
+        return ret
+
+    def write(self, address, values):
+        if not isinstance(values, list):
+            values = [values]
+        self.device._rawWrite(offset=address - self.base, data=values)
+        self.writes += 1
@@ -0,0 +1,64 @@
+#-----------------------------------------------------------------------------
+# This file is part of the 'lcls2-pgp-pcie-apps'. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the 'lcls2-pgp-pcie-apps', including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+import hashlib
+import os
+
+import yaml
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'lcls2_pgp_pcie_apps')
+
+class SnapshotCache:
+    # On-disk YAML documents keyed by a hash of the firmware build, the
+    # configuration files and any other parameters the content depends on
+    def __init__(self, cacheDir=None, prefix='snapshot'):
+        self.cacheDir = DEFAULT_CACHE_DIR if cacheDir is None else cacheDir
+        self.prefix   = prefix
+
+    @staticmethod
+    def key(buildStamp, files=(), **params):
+        h = hashlib.sha256()
+        h.update(str(buildStamp).encode())
+
+        for fname in files:
+            if fname is None:
+                continue
+            h.update(os.path.realpath(fname).encode())
+            with open(fname, 'rb') as f:
+                h.update(f.read())
+
+        for k in sorted(params):
+            h.update(f'{k}={params[k]}'.encode())
+
+        return h.hexdigest()[:32]
+
+    def path(self, key):
+        return os.path.join(self.cacheDir, f'{self.prefix}_{key}.yml')
+
+    def load(self, key):
+        try:
+            with open(self.path(key), 'r') as f:
+                return yaml.safe_load(f)
+        except (OSError, yaml.YAMLError):
+            return None
+
+    def save(self, key, data):
+        os.makedirs(self.cacheDir, exist_ok=True)
+
+        # Write then rename so a crash never leaves a partial snapshot behind
+        tmp = self.path(key) + f'.{os.getpid()}.tmp'
+        with open(tmp, 'w') as f:
+            yaml.safe_dump(data, f, default_flow_style=False)
+        os.replace(tmp, self.path(key))
+
+    def remove(self, key):
+        try:
+            os.remove(self.path(key))
+        except OSError:
+            pass
@@ -0,0 +1,175 @@
+#-----------------------------------------------------------------------------
+# This file is part of the 'lcls2-pgp-pcie-apps'. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the 'lcls2-pgp-pcie-apps', including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+import rogue
+
+from lcls2_pgp_pcie_apps._PulseIdEventBuilder import PULSE_ID_MASK
+
+# One index record per recorded (unbatched) frame, stored in <fileName>.idx
+RECORD_INDEX_DTYPE = np.dtype([
+    ('offset',  '<u8'), # Byte offset of the frame in <fileName>.dat
+    ('size',    '<u4'), # Frame payload size in bytes
+    ('channel', 'u1'),  # Sub-frame TDEST
+    ('error',   'u1'),  # Frame error field
+    ('flags',   '<u2'), # Frame flags field
+    ('pulseId', '<u8'), # pulseId of the header, or of the latest header for payload frames
+    ('rxTime',  '<f8'), # Host receive time (seconds since epoch)
+])
+
+class StreamRecorder(rogue.interfaces.stream.Slave):
+    def __init__(self,
+                 fileName,
+                 headerChannels = (0, 1), # Channels carrying an event header (pulseId source)
+                 queueDepth     = 10000,  # Frames buffered before the receive path starts dropping
+                 bufferSize     = 4 << 20,
+                 batchSize      = 1024):  # Max frames written per background thread pass
+        rogue.interfaces.stream.Slave.__init__(self)
+
+        # Set local variables
+        self.fileName       = fileName
+        self.headerChannels = set(headerChannels)
+        self.bufferSize     = bufferSize
+        self.batchSize      = batchSize
+
+        self._queue      = queue.Queue(maxsize=queueDepth)
+        self._thread     = None
+        self._run        = False
+        self._pulseId    = 0
+        self._dropCount  = 0
+        self._frameCount = 0
+
+    @property
+    def dropCount(self):
+        return self._dropCount
+
+    @property
+    def frameCount(self):
+        return self._frameCount
+
+    def _start(self):
+        if self._thread is not None:
+            return
+
+        self._run    = True
+        self._thread = threading.Thread(target=self._writer, name=f'StreamRecorder[{self.fileName}]', daemon=True)
+        self._thread.start()
+
+    def _stop(self):
+        if self._thread is None:
+            return
+
+        self._run = False
+        self._thread.join()
+        self._thread = None
+
+    def _acceptFrame(self, frame):
+        rxTime  = time.time()
+        channel = frame.getChannel()
+        size    = frame.getPayload()
+        payload = frame.getNumpy(0, size)
+
+        if channel in self.headerChannels and size >= 8:
+            self._pulseId = int.from_bytes(payload[:8].tobytes(), 'little') & PULSE_ID_MASK
+
+        # Never block the DMA receive thread on the disk
+        try:
+            self._queue.put_nowait((payload, channel, frame.getError(), frame.getFlags(), self._pulseId, rxTime))
+        except queue.Full:
+            self._dropCount += 1
+
+    def _writer(self):
+        with open(self.fileName + '.dat', 'ab', buffering=self.bufferSize) as dataFile, \
+             open(self.fileName + '.idx', 'ab', buffering=0) as idxFile:
+
+            offset = dataFile.tell()
+            index  = np.zeros(self.batchSize, dtype=RECORD_INDEX_DTYPE)
+
+            while self._run or not self._queue.empty():
+                try:
+                    item = self._queue.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+
+                count = 0
+                while item is not None:
+                    payload, channel, error, flags, pulseId, rxTime = item
+                    dataFile.write(payload)
+                    index[count] = (offset, payload.size, channel, error, flags, pulseId, rxTime)
+                    offset += payload.size
+                    count  += 1
+
+                    if count == self.batchSize:
+                        break
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        item = None
+
+                # Data goes out before the index so an index record never points past the data file
+                dataFile.flush()
+                idxFile.write(index[:count].tobytes())
+                self._frameCount += count
+
+class StreamReader:
+    def __init__(self, fileName):
+        self.fileName = fileName
+
+        # Memory map both files, nothing is read until it is touched
+        self.index = self._map(fileName + '.idx', RECORD_INDEX_DTYPE)
+        self.data  = self._map(fileName + '.dat', np.uint8)
+
+        self._sorted = None
+
+    @staticmethod
+    def _map(path, dtype):
+        dtype = np.dtype(dtype)
+        count = os.path.getsize(path) // dtype.itemsize
+        if count == 0:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode='r', shape=(count,))
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, n):
+        # Zero-copy view of frame n
+        rec = self.index[n]
+        return self.data[int(rec['offset']):int(rec['offset'])+int(rec['size'])]
+
+    def record(self, n):
+        return self.index[n], self[n]
+
+    def channel(self, channel):
+        # Index positions of all the frames of one channel
+        return np.flatnonzero(self.index['channel'] == channel)
+
+    def pulseIdRange(self, first, last, channel=None):
+        # Index positions with first <= pulseId <= last
+        pulseId = self.index['pulseId']
+
+        if self._sorted is None:
+            self._sorted = bool(np.all(pulseId[1:] >= pulseId[:-1]))
+
+        if self._sorted:
+            lo  = np.searchsorted(pulseId, first, side='left')
+            hi  = np.searchsorted(pulseId, last,  side='right')
+            pos = np.arange(lo, hi)
+        else:
+            pos = np.flatnonzero((pulseId >= first) & (pulseId <= last))
+
+        if channel is not None:
+            pos = pos[self.index['channel'][pos] == channel]
+
+        return pos
@@ -0,0 +1,168 @@
+#-----------------------------------------------------------------------------
+# This file is part of the 'lcls2-pgp-pcie-apps'. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the 'lcls2-pgp-pcie-apps', including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+import threading
+import time
+
+import numpy as np
+import rogue
+
+from lcls2_pgp_pcie_apps._BatcherV1 import packSuperFrame
+
+class ReaderEvents:
+    # Re-iterable (data, channel, timestamp) source built from a StreamReader.
+    # With batch=True the frames sharing a pulseId are packed back into one
+    # batcher super-frame, which is what the DMA lane delivers to SplitterV1.
+    def __init__(self, reader, batch=True, widthBytes=16):
+        self.reader     = reader
+        self.batch      = batch
+        self.widthBytes = widthBytes
+
+    def __iter__(self):
+        index = self.reader.index
+
+        if not self.batch:
+            for n in range(len(index)):
+                yield self.reader[n], int(index['channel'][n]), float(index['rxTime'][n])
+            return
+
+        # Group consecutive records with the same pulseId
+        if len(index) == 0:
+            return
+        bounds = np.flatnonzero(np.diff(index['pulseId'].astype(np.int64)) != 0) + 1
+        starts = np.concatenate(([0], bounds))
+        ends   = np.concatenate((bounds, [len(index)]))
+
+        for seq, (first, last) in enumerate(zip(starts, ends)):
+            subFrames = [(self.reader[n],
+                          int(index['channel'][n]),
+                          int(index['flags'][n]) & 0xFF,
+                          (int(index['flags'][n]) >> 8) & 0xFF) for n in range(first, last)]
+            yield packSuperFrame(subFrames, seq, self.widthBytes), 0, float(index['rxTime'][first])
+
+class StreamReplay(rogue.interfaces.stream.Master):
+    def __init__(self,
+                 events,             # Re-iterable of (data, channel, timestamp)
+                 rate       = 'max', # 'max' = as fast as possible, 'original' = recorded timestamps, or a fixed rate in Hz
+                 loops      = 1,     # Number of passes over events, 0 = forever
+                 maxSamples = 1 << 20):
+        rogue.interfaces.stream.Master.__init__(self)
+
+        if not (rate in ('max', 'original') or float(rate) > 0):
+            raise ValueError(f'Invalid replay rate: {rate}')
+
+        # Set local variables
+        self.events = events
+        self.rate   = rate
+        self.loops  = loops
+
+        self._thread    = None
+        self._run       = False
+        self._done      = threading.Event()
+        self._latency   = np.zeros(maxSamples, dtype=np.float64)
+        self._frames    = 0
+        self._bytes     = 0
+        self._startTime = None
+        self._stopTime  = None
+
+        # Start of the _sendFrame() in progress, for consumers timing their own deliveries
+        self.sendTime = 0.0
+
+    def _start(self):
+        if self._thread is not None:
+            return
+
+        self._run = True
+        self._done.clear()
+        self._thread = threading.Thread(target=self._replay, name='StreamReplay', daemon=True)
+        self._thread.start()
+
+    def _stop(self):
+        if self._thread is None:
+            return
+
+        self._run = False
+        self._thread.join()
+        self._thread = None
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    def _send(self, data, channel):
+        frame = self._reqFrame(data.size, True)
+        frame.write(data, 0)
+        frame.setChannel(channel)
+
+        # _sendFrame() runs the whole downstream chain in this thread, so its
+        # duration is the host-side pipeline latency for this frame
+        t0 = time.perf_counter()
+        self.sendTime = t0
+        self._sendFrame(frame)
+        dt = time.perf_counter() - t0
+
+        if self._frames < self._latency.size:
+            self._latency[self._frames] = dt
+        self._frames += 1
+        self._bytes  += data.size
+
+    def _replay(self):
+        self._frames    = 0
+        self._bytes     = 0
+        self._startTime = time.perf_counter()
+
+        period = None if self.rate in ('max', 'original') else 1.0 / float(self.rate)
+        loop   = 0
+
+        try:
+            while self._run and (self.loops == 0 or loop < self.loops):
+                base     = None
+                nextTime = time.perf_counter()
+
+                for data, channel, timestamp in self.events:
+                    if not self._run:
+                        break
+
+                    # Pace the frames
+                    if self.rate == 'original':
+                        if base is None:
+                            base = (time.perf_counter(), timestamp)
+                        nextTime = base[0] + (timestamp - base[1])
+                    elif period is not None:
+                        nextTime += period
+
+                    if self.rate != 'max':
+                        delay = nextTime - time.perf_counter()
+                        if delay > 0:
+                            time.sleep(delay)
+
+                    self._send(np.ascontiguousarray(data, dtype=np.uint8), channel)
+
+                loop += 1
+
+        finally:
+            self._stopTime = time.perf_counter()
+            self._done.set()
+
+    def stats(self):
+        stop    = self._stopTime if self._done.is_set() else time.perf_counter()
+        elapsed = 0.0 if self._startTime is None else (stop - self._startTime)
+        latency = self._latency[:min(self._frames, self._latency.size)]
+
+        ret = {
+            'Frames'    : self._frames,
+            'Bytes'     : self._bytes,
+            'Elapsed'   : elapsed,
+            'FrameRate' : (self._frames / elapsed) if elapsed > 0 else 0.0,
+            'ByteRate'  : (self._bytes / elapsed) if elapsed > 0 else 0.0,
+        }
+
+        for p in (50, 90, 99, 99.9):
+            ret[f'LatencyP{p}'] = float(np.percentile(latency, p)) if latency.size > 0 else 0.0
+
+        return ret
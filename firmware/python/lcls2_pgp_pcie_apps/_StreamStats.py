@@ -0,0 +1,167 @@
+#-----------------------------------------------------------------------------
+# This file is part of the 'lcls2-pgp-pcie-apps'. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the 'lcls2-pgp-pcie-apps', including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+import threading
+import time
+
+import numpy as np
+import rogue
+
+# Column layout of a per-channel counter row
+STATS_FIELDS = ['Frames', 'Bytes', 'MinSize', 'MaxSize', 'Errors', 'Flags']
+STATS_FRAMES  = 0
+STATS_BYTES   = 1
+STATS_MINSIZE = 2
+STATS_MAXSIZE = 3
+STATS_ERRORS  = 4
+STATS_FLAGS   = 5
+
+# Channel is the 8-bit TDEST of the (sub)frame
+STATS_CHANNELS = 256
+
+class StreamStats(rogue.interfaces.stream.Slave):
+    def __init__(self, name='StreamStats', numChannels=STATS_CHANNELS):
+        rogue.interfaces.stream.Slave.__init__(self)
+
+        # Set local variables
+        self.name        = name
+        self.numChannels = numChannels
+        self._lock       = threading.Lock()
+        self._rows       = [None for _ in range(numChannels)]
+
+    def reset(self):
+        with self._lock:
+            self._rows = [None for _ in range(self.numChannels)]
+
+    def _acceptFrame(self, frame):
+        # Only the frame metadata is touched, the payload is never copied
+        channel = frame.getChannel()
+        size    = frame.getPayload()
+        error   = frame.getError()
+        flags   = frame.getFlags()
+
+        if channel >= self.numChannels:
+            return
+
+        with self._lock:
+            row = self._rows[channel]
+            if row is None:
+                self._rows[channel] = [1, size, size, size, int(error != 0), int(flags != 0)]
+            else:
+                row[STATS_FRAMES] += 1
+                row[STATS_BYTES]  += size
+                if size < row[STATS_MINSIZE]:
+                    row[STATS_MINSIZE] = size
+                if size > row[STATS_MAXSIZE]:
+                    row[STATS_MAXSIZE] = size
+                if error != 0:
+                    row[STATS_ERRORS] += 1
+                if flags != 0:
+                    row[STATS_FLAGS] += 1
+
+    def acceptBatch(self, buff, table):
+        # SuperFrameUnbatcher batch handler: same counters from the sub-frame
+        # table of a whole super-frame, one update per channel present
+        if table.size == 0:
+            return
+
+        dest  = table['dest']
+        size  = table['size']
+        flags = (table['firstUser'] != 0) | (table['lastUser'] != 0)
+
+        with self._lock:
+            for channel in np.unique(dest):
+                mask  = dest == channel
+                sizes = size[mask]
+                row   = self._rows[channel]
+                if row is None:
+                    row = self._rows[channel] = [0, 0, int(sizes.min()), int(sizes.max()), 0, 0]
+
+                row[STATS_FRAMES] += int(sizes.size)
+                row[STATS_BYTES]  += int(sizes.sum())
+                row[STATS_MINSIZE] = min(row[STATS_MINSIZE], int(sizes.min()))
+                row[STATS_MAXSIZE] = max(row[STATS_MAXSIZE], int(sizes.max()))
+                row[STATS_FLAGS]  += int(flags[mask].sum())
+
+    def snapshot(self, out=None):
+        # Returns a (numChannels, len(STATS_FIELDS)) uint64 array of the running totals
+        if out is None:
+            out = np.zeros((self.numChannels, len(STATS_FIELDS)), dtype=np.uint64)
+        else:
+            out[:] = 0
+
+        with self._lock:
+            for channel, row in enumerate(self._rows):
+                if row is not None:
+                    out[channel] = row
+
+        return out
+
+class StatsReporter:
+    def __init__(self, sources=None):
+        # sources: ordered dict of label -> callable returning a StreamStats.snapshot() array
+        self._sources  = {} if sources is None else dict(sources)
+        self._prev     = {}
+        self._prevTime = None
+
+    def addSource(self, label, source):
+        self._sources[label] = source
+
+    def update(self):
+        now = time.monotonic()
+        dt  = None if self._prevTime is None else (now - self._prevTime)
+        rows = []
+
+        for label, source in self._sources.items():
+            cur  = np.asarray(source(), dtype=np.uint64)
+            prev = self._prev.get(label)
+            self._prev[label] = cur.copy()
+
+            for channel in np.flatnonzero(cur[:, STATS_FRAMES]):
+                frames = int(cur[channel, STATS_FRAMES])
+                nbytes = int(cur[channel, STATS_BYTES])
+
+                # Interval deltas, zero on the first pass
+                if prev is None or dt is None or dt <= 0:
+                    dFrames, dBytes, rate = 0, 0, 0.0
+                else:
+                    dFrames = frames - int(prev[channel, STATS_FRAMES])
+                    dBytes  = nbytes - int(prev[channel, STATS_BYTES])
+                    rate    = 1.0 / dt
+
+                rows.append({
+                    'Source'   : label,
+                    'Channel'  : int(channel),
+                    'Frames'   : frames,
+                    'FrameRate': dFrames * rate,
+                    'ByteRate' : dBytes * rate,
+                    'MinSize'  : int(cur[channel, STATS_MINSIZE]),
+                    'MaxSize'  : int(cur[channel, STATS_MAXSIZE]),
+                    'MeanSize' : (dBytes / dFrames) if dFrames > 0 else (nbytes / frames),
+                    'Errors'   : int(cur[channel, STATS_ERRORS]),
+                    'Flags'    : int(cur[channel, STATS_FLAGS]),
+                })
+
+        self._prevTime = now
+        return rows
+
+    @staticmethod
+    def formatTable(rows):
+        lines = [f"{'Source':<12} {'Ch':>3} {'Frames':>12} {'Frames/s':>12} {'MB/s':>10} "
+                 f"{'MinSize':>9} {'MaxSize':>9} {'MeanSize':>10} {'Errors':>8} {'Flags':>8}"]
+        for r in rows:
+            lines.append(
+                f"{r['Source']:<12} {r['Channel']:>3} {r['Frames']:>12} {r['FrameRate']:>12.1f} "
+                f"{r['ByteRate']/1.0e6:>10.3f} {r['MinSize']:>9} {r['MaxSize']:>9} "
+                f"{r['MeanSize']:>10.1f} {r['Errors']:>8} {r['Flags']:>8}")
+        return '\n'.join(lines)
+
+    def report(self):
+        print(self.formatTable(self.update()))
+        print()
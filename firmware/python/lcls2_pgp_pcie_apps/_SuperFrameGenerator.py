@@ -0,0 +1,108 @@
+#-----------------------------------------------------------------------------
+# This file is part of the 'lcls2-pgp-pcie-apps'. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the 'lcls2-pgp-pcie-apps', including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+import numpy as np
+
+from lcls2_pgp_pcie_apps._BatcherV1   import packSuperFrame
+from lcls2_pgp_pcie_apps._EventHeader import packEventHeader
+
+# LCLS-II base rate: 1300 MHz / 1400
+LCLS2_PULSE_PERIOD_NS = 1400.0 / 1.3
+
+class SuperFrameGenerator:
+    # Re-iterable (data, channel, timestamp) source of synthetic batcher v1
+    # super-frames, usable as the events of a StreamReplay. Each event is a
+    # trigger header sub-frame (channel 0) followed by numChannels camera
+    # payload sub-frames (channels 2, 3, ...). Every transitionEvery events a
+    # header only transition (channel 1) is inserted instead.
+    def __init__(self,
+                 count           = 10000, # Number of super-frames
+                 payloadSize     = 4096,  # Camera payload bytes, int or (min, max)
+                 eventsPerBatch  = 1,     # Events packed in each super-frame
+                 numChannels     = 1,     # Camera payload sub-frames per event
+                 pulseIdStart    = 0,
+                 pulseIdStep     = 1,     # pulseId cadence, e.g. 929 for 1 kHz at the LCLS-II base rate
+                 transitionEvery = 0,     # 0 = no transitions
+                 widthBytes      = 16,
+                 numPayloads     = 64,    # Distinct pre-generated payloads
+                 seed            = 0):
+
+        # Set local variables
+        self.count           = count
+        self.payloadSize     = payloadSize
+        self.eventsPerBatch  = eventsPerBatch
+        self.numChannels     = numChannels
+        self.pulseIdStart    = pulseIdStart
+        self.pulseIdStep     = pulseIdStep
+        self.transitionEvery = transitionEvery
+        self.widthBytes      = widthBytes
+        self.numPayloads     = numPayloads
+        self.seed            = seed
+
+        self._frames = None
+
+    @property
+    def subFramesPerBatch(self):
+        return self.eventsPerBatch * (1 + self.numChannels)
+
+    def _payloads(self, rng):
+        if isinstance(self.payloadSize, int):
+            sizes = np.full(self.numPayloads, self.payloadSize)
+        else:
+            sizes = rng.integers(self.payloadSize[0], self.payloadSize[1] + 1, self.numPayloads)
+
+        # 12-bit camera pixels: pedestal, noise and a gaussian spot
+        ret = []
+        for size in sizes:
+            npix   = max(1, int(size) // 2)
+            x      = np.arange(npix)
+            center = rng.uniform(0, npix)
+            spot   = 3000.0 * np.exp(-0.5 * ((x - center) / max(1.0, npix / 32.0)) ** 2)
+            pixels = np.clip(100.0 + rng.normal(0, 8.0, npix) + spot, 0, 4095).astype('<u2')
+            ret.append(pixels.view(np.uint8)[:int(size)])
+        return ret
+
+    def _build(self):
+        rng      = np.random.default_rng(self.seed)
+        payloads = self._payloads(rng)
+        frames   = []
+        event    = 0
+
+        for seq in range(self.count):
+            subFrames = []
+
+            for _ in range(self.eventsPerBatch):
+                pulseId   = self.pulseIdStart + event * self.pulseIdStep
+                timeNs    = int(pulseId * LCLS2_PULSE_PERIOD_NS)
+                timeStamp = ((timeNs // 1_000_000_000) << 32) | (timeNs % 1_000_000_000)
+
+                if self.transitionEvery > 0 and (event % self.transitionEvery) == (self.transitionEvery - 1):
+                    # Transition ID in the header control byte: Configure = 2, L1Accept = 12
+                    subFrames.append((packEventHeader(pulseId, timeStamp, count=event, control=2), 1, 0x2, 0x0))
+                else:
+                    subFrames.append((packEventHeader(pulseId, timeStamp, count=event, control=12), 0, 0x2, 0x0))
+                    for ch in range(self.numChannels):
+                        subFrames.append((payloads[(event + ch) % len(payloads)], 2 + ch, 0x2, 0x0))
+
+                event += 1
+
+            # Super-frame timestamp (seconds) follows the pulseId of its first event
+            timestamp = (event - self.eventsPerBatch) * self.pulseIdStep * LCLS2_PULSE_PERIOD_NS * 1.0e-9
+            frames.append((packSuperFrame(subFrames, seq, self.widthBytes), 0, timestamp))
+
+        return frames
+
+    def __iter__(self):
+        # Built once on first use so generation cost never shows up in a benchmark pass
+        if self._frames is None:
+            self._frames = self._build()
+        return iter(self._frames)
+
+    def __len__(self):
+        return self.count
@@ -0,0 +1,61 @@
+#-----------------------------------------------------------------------------
+# This file is part of the 'lcls2-pgp-pcie-apps'. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the 'lcls2-pgp-pcie-apps', including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+import rogue
+
+from lcls2_pgp_pcie_apps._BatcherV1 import parseSuperFrame
+
+def subFrameView(buff, table, i):
+    # Zero-copy view of sub-frame i of a parsed super-frame
+    return buff[int(table['offset'][i]):int(table['offset'][i])+int(table['size'][i])]
+
+class SuperFrameUnbatcher(rogue.interfaces.stream.Slave):
+    # Drop-in alternative to rogue.protocols.batcher.SplitterV1 for Python
+    # consumers. Instead of one Frame (and one C++ -> Python callback) per
+    # sub-frame, the super-frame is pulled into a single numpy buffer and the
+    # tails are parsed in one pass. Batch handlers are called once per
+    # super-frame with func(buff, table), where table is a
+    # BATCHER_V1_TABLE_DTYPE array of (offset, size, dest, firstUser, lastUser)
+    # and subFrameView(buff, table, i) gives the payload of sub-frame i.
+    def __init__(self):
+        rogue.interfaces.stream.Slave.__init__(self)
+
+        self._handlers   = []
+        self._frameCount = 0
+        self._errorCount = 0
+
+    @property
+    def frameCount(self):
+        return self._frameCount
+
+    @property
+    def errorCount(self):
+        return self._errorCount
+
+    def addBatchHandler(self, func):
+        self._handlers.append(func)
+
+    def _acceptFrame(self, frame):
+        # Errored super-frames are dropped, same as SplitterV1
+        if frame.getError() != 0:
+            self._errorCount += 1
+            return
+
+        buff = frame.getNumpy(0, frame.getPayload())
+
+        try:
+            table = parseSuperFrame(buff)
+        except ValueError:
+            self._errorCount += 1
+            return
+
+        self._frameCount += 1
+
+        for func in self._handlers:
+            func(buff, table)
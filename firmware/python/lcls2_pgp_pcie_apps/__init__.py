@@ -9,7 +9,51 @@
 # that would be a lot of work for the tid-air people - cpo.
 import sys
 import os
+import importlib
 sys.path.append(os.path.dirname(os.path.realpath(__file__)))
 
-from lcls2_pgp_pcie_apps._PcieFpga      import *
-from lcls2_pgp_pcie_apps._DevRoot       import *
+# Public names of each submodule. Submodules are only imported when one of
+# their names is first accessed (PEP 562), so tools that only need the
+# stream utilities never load axipcie, surf, l2si_core or lcls2_pgp_fw_lib.
+_SUBMODULES = {
+    '_PcieFpga'            : ['PcieFpga'],
+    '_DevRoot'             : ['FAST_START_SENTINELS', 'DevRoot'],
+    '_DevRootGroup'        : ['DevRootGroup'],
+    '_AsyncRootClient'     : ['AsyncRootClient'],
+    '_StreamStats'         : ['STATS_FIELDS', 'STATS_FRAMES', 'STATS_BYTES', 'STATS_MINSIZE', 'STATS_MAXSIZE', 'STATS_ERRORS', 'STATS_FLAGS', 'STATS_CHANNELS', 'StreamStats', 'StatsReporter'],
+    '_LaneWorkers'         : ['CounterBlock', 'LaneWorkerPool'],
+    '_PulseIdEventBuilder' : ['PULSE_ID_MASK', 'headerPulseId', 'PulseIdEventBuilder'],
+    '_StreamRecorder'      : ['RECORD_INDEX_DTYPE', 'StreamRecorder', 'StreamReader'],
+    '_BatcherV1'           : ['BATCHER_V1_VERSION', 'batcherV1Sizes', 'packSuperFrame', 'BATCHER_V1_TABLE_DTYPE', 'parseSuperFrame'],
+    '_StreamReplay'        : ['ReaderEvents', 'StreamReplay'],
+    '_EventHeader'         : ['EVENT_HEADER_RAW_DTYPE', 'EVENT_HEADER_SIZE', 'EVENT_HEADER_DTYPE', 'packEventHeader', 'decodeEventHeaders', 'decodeEventHeaderFrames', 'decodeSuperFrameHeaders', 'EventHeaderBlockDecoder'],
+    '_SuperFrameGenerator' : ['LCLS2_PULSE_PERIOD_NS', 'SuperFrameGenerator'],
+    '_SuperFrameUnbatcher' : ['subFrameView', 'SuperFrameUnbatcher'],
+    '_SnapshotCache'       : ['DEFAULT_CACHE_DIR', 'SnapshotCache'],
+    '_RegisterMap'         : ['RegisterField', 'absAddress', 'fieldOf', 'toNative', 'wordSpans', 'RawAccess'],
+    '_ConfigCompiler'      : ['ConfigCompiler'],
+    '_PollScheduler'       : ['DEFAULT_POLL_TIERS', 'DEFAULT_POLL_RULES', 'DEFAULT_POLL_EXTRA', 'PollScheduler'],
+    '_CoalescingZmqServer' : ['CoalescingZmqServer'],
+    '_MetricsExporter'     : ['DEFAULT_METRIC_GROUPS', 'MetricsExporter'],
+    '_BusProfiler'         : ['BusProfiler'],
+    '_RegisterEmulator'    : ['DEFAULT_COUNTER_PATTERNS', 'DEFAULT_STATUS_PATTERNS', 'RegisterEmulator'],
+    '_DmaFifoSampler'      : ['DEFAULT_FILL_VAR', 'DmaFifoSampler'],
+    '_CounterEngine'       : ['DEFAULT_COUNTER_DEVICES', 'DEFAULT_COUNTER_NAMES', 'DEFAULT_SATURATING_DEVICES', 'CounterEngine'],
+    '_FrameReducer'        : ['FrameReducer'],
+    '_FrameRing'           : ['FrameRingWriter', 'FrameRingReader', 'RingFrame'],
+}
+
+_LAZY_NAMES = {name: mod for mod, names in _SUBMODULES.items() for name in names}
+
+__all__ = list(_LAZY_NAMES)
+
+def __getattr__(name):
+    if name not in _LAZY_NAMES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    value = getattr(importlib.import_module(f'{__name__}.{_LAZY_NAMES[name]}'), name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_NAMES))
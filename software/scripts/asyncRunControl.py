@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+#-----------------------------------------------------------------------------
+# This file is part of the 'lcls2-pgp-pcie-apps'. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the 'lcls2-pgp-pcie-apps', including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+
+import setupLibPaths
+
+import time
+import asyncio
+import argparse
+
+import lcls2_pgp_pcie_apps
+
+#################################################################
+
+async def timed(name, coro):
+    t0 = time.perf_counter()
+    await coro
+    return name, 1000.0*(time.perf_counter()-t0)
+
+async def transition(clients, step, fn):
+    # Same transition on every node at once, then one line of per-node latencies
+    t0      = time.perf_counter()
+    results = await asyncio.gather(*[timed(c.address, fn(c)) for c in clients])
+    total   = 1000.0*(time.perf_counter()-t0)
+    print(f'{step:<12} {total:10.3f} ms  ' + '  '.join(f'{name} {ms:.3f}' for name, ms in results))
+
+async def main(args):
+    clients = []
+    for server in args.servers.split(','):
+        addr, port = server.rsplit(':', 1)
+        clients.append(lcls2_pgp_pcie_apps.AsyncRootClient(addr, int(port), timeout=args.timeout))
+
+    try:
+        await asyncio.gather(*[c.connect() for c in clients])
+
+        if args.yamlFile is not None:
+            await transition(clients, 'LoadConfig', lambda c: c.loadConfig(args.yamlFile))
+
+        for _ in range(args.transitions):
+            await transition(clients, 'StartRun', lambda c: c.startRun())
+            if args.paths:
+                await transition(clients, 'GetMany', lambda c: c.getMany(args.paths))
+            await transition(clients, 'StopRun', lambda c: c.stopRun())
+
+    finally:
+        await asyncio.gather(*[c.close() for c in clients])
+
+if __name__ == "__main__":
+
+    # Set the argument parser
+    parser = argparse.ArgumentParser(description='Drives the run transitions of many DevRoot ZMQ servers from one event loop')
+
+    parser.add_argument(
+        "--servers",
+        type     = str,
+        required = True,
+        help     = "Comma separated host:port of the DevRoot ZMQ servers (devGui.py --zmqAddr '*')",
+    )
+
+    parser.add_argument(
+        "--yamlFile",
+        type     = str,
+        required = False,
+        default  = None,
+        help     = "Load this YAML file (path on the server nodes) on every node first",
+    )
+
+    parser.add_argument(
+        "--transitions",
+        type     = int,
+        required = False,
+        default  = 1,
+        help     = "StartRun/StopRun pairs",
+    )
+
+    parser.add_argument(
+        "--paths",
+        type     = str,
+        nargs    = '*',
+        default  = [],
+        help     = "Variables read from every node while running (e.g. DevPcie.Hsio.TimingRx.TimingFrameRx.RxLinkUp)",
+    )
+
+    parser.add_argument(
+        "--timeout",
+        type     = float,
+        required = False,
+        default  = 60.0,
+        help     = "Seconds to wait for a node to reply",
+    )
+
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+#-----------------------------------------------------------------------------
+# This file is part of the 'lcls2-pgp-pcie-apps'. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the 'lcls2-pgp-pcie-apps', including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+#################################################################
+
+# Device libraries that only DevRoot/PcieFpga should pull in
+HEAVY_MODULES = ['axipcie', 'axi_pcie_core', 'surf', 'l2si_core', 'lcls2_pgp_fw_lib', 'LclsTimingCore', 'lcls_timing_core']
+
+SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
+
+def measure(statement):
+    # One fresh interpreter per sample, '-X importtime' reports the
+    # cumulative time of every module imported by the statement
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import setupLibPaths\n{statement}'],
+        cwd            = SCRIPT_DIR,
+        capture_output = True,
+        text           = True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f'{statement!r} failed:\n{proc.stderr}')
+
+    modules = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        modules[name.strip()] = int(cumulative) / 1000.0 # ms
+
+    return modules
+
+def runCase(statement, target, samples):
+    times   = []
+    modules = {}
+    for _ in range(samples):
+        modules = measure(statement)
+        times.append(modules.get(target, 0.0))
+
+    heavy = sorted({m.split('.')[0] for m in modules} & set(HEAVY_MODULES))
+
+    return {
+        'Statement' : statement,
+        'Median'    : statistics.median(times),
+        'Min'       : min(times),
+        'Modules'   : len(modules),
+        'Heavy'     : heavy,
+    }
+
+#################################################################
+
+if __name__ == "__main__":
+
+    # Set the argument parser
+    parser = argparse.ArgumentParser(description='Measures the import cost of the lcls2_pgp_pcie_apps package')
+
+    parser.add_argument(
+        "--samples",
+        type     = int,
+        required = False,
+        default  = 5,
+        help     = "Fresh interpreters per case, the median is reported",
+    )
+
+    parser.add_argument(
+        "--maxTime",
+        type     = float,
+        required = False,
+        default  = None,
+        help     = "Fail if the package import (first case) takes longer than this many ms",
+    )
+
+    parser.add_argument(
+        "--json",
+        type     = str,
+        required = False,
+        default  = None,
+        help     = "Also write the results to this JSON file",
+    )
+
+    # Get the arguments
+    args = parser.parse_args()
+
+    #################################################################
+
+    cases = [
+        ('import lcls2_pgp_pcie_apps',                                     'lcls2_pgp_pcie_apps'),
+        ('import lcls2_pgp_pcie_apps\nlcls2_pgp_pcie_apps.StreamStats',    'lcls2_pgp_pcie_apps._StreamStats'),
+        ('import lcls2_pgp_pcie_apps\nlcls2_pgp_pcie_apps.DevRoot',        'lcls2_pgp_pcie_apps._DevRoot'),
+    ]
+
+    results = [runCase(statement, target, args.samples) for statement, target in cases]
+
+    print(f'{"Case":<50} {"Median ms":>10} {"Min ms":>10} {"Modules":>8}  Device libraries')
+    for r in results:
+        name = r['Statement'].replace('\n', '; ')
+        print(f'{name:<50} {r["Median"]:>10.1f} {r["Min"]:>10.1f} {r["Modules"]:>8}  {",".join(r["Heavy"]) or "-"}')
+
+    if args.json is not None:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    # Regression checks: the bare package import must stay lazy and cheap
+    failed = False
+    if results[0]['Heavy']:
+        print(f'FAIL: importing the package loads {results[0]["Heavy"]}')
+        failed = True
+    if args.maxTime is not None and results[0]['Median'] > args.maxTime:
+        print(f'FAIL: package import {results[0]["Median"]:.1f} ms > {args.maxTime:.1f} ms')
+        failed = True
+
+    sys.exit(1 if failed else 0)
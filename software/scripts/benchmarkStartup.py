@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+#-----------------------------------------------------------------------------
+# This file is part of the 'lcls2-pgp-pcie-apps'. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the 'lcls2-pgp-pcie-apps', including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+
+import setupLibPaths
+
+import json
+import time
+import argparse
+
+import lcls2_pgp_pcie_apps
+
+#################################################################
+
+if __name__ == "__main__":
+
+    # Set the argument parser
+    parser = argparse.ArgumentParser(description='Times DevRoot construction, start and run transitions')
+
+    # Convert str to bool
+    argBool = lambda s: s.lower() in ['true', 't', 'yes', '1']
+
+    parser.add_argument(
+        "--dev",
+        type     = str,
+        required = False,
+        default  = 'emu',
+        help     = "path to device, default = in-process register emulator",
+    )
+
+    parser.add_argument(
+        "--startupMode",
+        type     = argBool,
+        required = False,
+        default  = False,
+        help     = "False = LCLS-I timing mode, True = LCLS-II timing mode",
+    )
+
+    parser.add_argument(
+        "--diffConfig",
+        type     = argBool,
+        required = False,
+        default  = False,
+        help     = "Load the YAML through the compiled write list",
+    )
+
+    parser.add_argument(
+        "--minimalTree",
+        type     = argBool,
+        required = False,
+        default  = False,
+        help     = "Only build the timing tree selected by --startupMode",
+    )
+
+    parser.add_argument(
+        "--transitions",
+        type     = int,
+        required = False,
+        default  = 10,
+        help     = "StartRun/StopRun pairs to time",
+    )
+
+    parser.add_argument(
+        "--json",
+        type     = str,
+        required = False,
+        default  = None,
+        help     = "Also write the results to this JSON file",
+    )
+
+    # Get the arguments
+    args = parser.parse_args()
+
+    #################################################################
+
+    results = {}
+
+    t0   = time.perf_counter()
+    root = lcls2_pgp_pcie_apps.DevRoot(
+        dev            = args.dev,
+        pollEn         = False,
+        zmqSrvEn       = False,
+        startupMode    = args.startupMode,
+        enLclsI        = True,
+        enLclsII       = True,
+        minimalTree    = args.minimalTree,
+        diffConfig     = args.diffConfig,
+        busProfile     = True,
+    )
+    results['Construct'] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    root.start()
+    results['Start'] = time.perf_counter() - t0
+
+    start = []
+    stop  = []
+    for _ in range(args.transitions):
+        root.StartRun()
+        start.append(root.StartRunTime.value())
+        root.StopRun()
+        stop.append(root.StopRunTime.value())
+
+    root.stop()
+
+    results['Variables']  = len(root.variableList)
+    results['StartRunMs'] = min(start) if start else None
+    results['StopRunMs']  = min(stop) if stop else None
+
+    print(root.busProfiler.report())
+    print()
+    for k, v in results.items():
+        print(f'{k:<12} {v}')
+
+    if args.json is not None:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
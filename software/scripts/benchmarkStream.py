@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+#-----------------------------------------------------------------------------
+# This file is part of the 'lcls2-pgp-pcie-apps'. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the 'lcls2-pgp-pcie-apps', including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+
+import setupLibPaths
+
+import sys
+import json
+import argparse
+import itertools
+import time
+import numpy as np
+import rogue
+
+import lcls2_pgp_pcie_apps
+
+from printEventStream import DataDebug
+
+#################################################################
+
+def makeConsumer(consumer):
+    # Batch consumers are fed by SuperFrameUnbatcher instead of SplitterV1
+    if consumer == 'batchDebug':
+        return DataDebug(name='DataDebug',enPrint=False)
+    elif consumer == 'batchStats':
+        return lcls2_pgp_pcie_apps.StreamStats()
+    elif consumer == 'debug':
+        return DataDebug(name='DataDebug',enPrint=False)
+    elif consumer == 'stats':
+        return lcls2_pgp_pcie_apps.StreamStats()
+    elif consumer == 'eventBuilder':
+        return lcls2_pgp_pcie_apps.PulseIdEventBuilder()
+    else:
+        raise ValueError(f'Invalid consumer type ({consumer})')
+
+class SubFrameLatency(rogue.interfaces.stream.Slave):
+    # Wraps the consumer and timestamps every sub-frame once the consumer
+    # is done with it. The replay runs the whole chain in its _sendFrame(),
+    # so the latency of a sub-frame is the time since its super-frame was
+    # sent. A batch consumer gets all the sub-frames of a super-frame in one
+    # call: they all share the time that call returns.
+    def __init__(self, replay, consumer, maxSamples=1 << 22):
+        rogue.interfaces.stream.Slave.__init__(self)
+        self.replay   = replay
+        self.consumer = consumer
+        self._latency = np.zeros(maxSamples, dtype=np.float64)
+        self._count   = 0
+
+    def _record(self, num):
+        dt  = time.perf_counter() - self.replay.sendTime
+        end = min(self._count + num, self._latency.size)
+        self._latency[self._count:end] = dt
+        self._count += num
+
+    def _acceptFrame(self, frame):
+        self.consumer._acceptFrame(frame)
+        self._record(1)
+
+    def acceptBatch(self, buff, table):
+        self.consumer.acceptBatch(buff, table)
+        self._record(len(table))
+
+    def percentile(self, p):
+        latency = self._latency[:min(self._count, self._latency.size)]
+        return float(np.percentile(latency, p)) if latency.size > 0 else 0.0
+
+def runCase(count, payloadSize, eventsPerBatch, numChannels, consumer, loops):
+
+    # Frames are generated before the timed replay starts
+    gen = lcls2_pgp_pcie_apps.SuperFrameGenerator(
+        count          = count,
+        payloadSize    = payloadSize,
+        eventsPerBatch = eventsPerBatch,
+        numChannels    = numChannels,
+    )
+    iter(gen)
+
+    # Replay >> unbatcher >> consumer, plus counters on the unbatched stream
+    replay = lcls2_pgp_pcie_apps.StreamReplay(gen, rate='max', loops=loops)
+    stats  = lcls2_pgp_pcie_apps.StreamStats()
+    timed  = SubFrameLatency(replay, makeConsumer(consumer))
+
+    if consumer.startswith('batch'):
+        unbatcher = lcls2_pgp_pcie_apps.SuperFrameUnbatcher()
+        unbatcher.addBatchHandler(timed.acceptBatch)
+        unbatcher.addBatchHandler(stats.acceptBatch)
+        replay >> unbatcher
+    else:
+        unbatcher = rogue.protocols.batcher.SplitterV1()
+        replay >> unbatcher >> timed
+        unbatcher >> stats
+
+    replay._start()
+    replay.wait()
+    replay._stop()
+
+    res       = replay.stats()
+    snap      = stats.snapshot()
+    subFrames = int(snap[:, lcls2_pgp_pcie_apps.STATS_FRAMES].sum())
+
+    return {
+        'PayloadSize'     : payloadSize,
+        'EventsPerBatch'  : eventsPerBatch,
+        'NumChannels'     : numChannels,
+        'Consumer'        : consumer,
+        'SuperFrames'     : res['Frames'],
+        'SubFrames'       : subFrames,
+        'SuperFrameRate'  : res['FrameRate'],
+        'SubFrameRate'    : (subFrames / res['Elapsed']) if res['Elapsed'] > 0 else 0.0,
+        'ByteRate'        : res['ByteRate'],
+        'LatencyP50'      : res['LatencyP50'],   # Per super-frame, whole downstream chain
+        'LatencyP99'      : res['LatencyP99'],
+        'LatencyP99.9'    : res['LatencyP99.9'],
+        'SubFrameP50'     : timed.percentile(50),  # Per sub-frame, delivery at the consumer
+        'SubFrameP99'     : timed.percentile(99),
+        'SubFrameP99.9'   : timed.percentile(99.9),
+    }
+
+def printTable(results):
+    # Latencies in us: super-frame (SF) through the whole chain, sub-frame (Sub) until the consumer is done with it
+    print(f"{'Payload':>8} {'Ev/Batch':>8} {'Ch':>3} {'Consumer':>12} {'SubFrames/s':>12} {'MB/s':>10} "
+          f"{'SF P50':>9} {'SF P99':>9} {'SF P99.9':>9} {'Sub P50':>9} {'Sub P99':>9} {'Sub P99.9':>9}")
+    for r in results:
+        print(f"{r['PayloadSize']:>8} {r['EventsPerBatch']:>8} {r['NumChannels']:>3} {r['Consumer']:>12} "
+              f"{r['SubFrameRate']:>12.0f} {r['ByteRate']/1.0e6:>10.1f} {r['LatencyP50']*1e6:>9.1f} "
+              f"{r['LatencyP99']*1e6:>9.1f} {r['LatencyP99.9']*1e6:>9.1f} {r['SubFrameP50']*1e6:>9.1f} "
+              f"{r['SubFrameP99']*1e6:>9.1f} {r['SubFrameP99.9']*1e6:>9.1f}")
+
+if __name__ == "__main__":
+
+#################################################################
+
+    # Set the argument parser
+    parser = argparse.ArgumentParser()
+
+    # Convert str to int list
+    argInts = lambda s: [int(x) for x in s.split(',')]
+
+    # Add arguments
+    parser.add_argument(
+        "--count",
+        type     = int,
+        required = False,
+        default  = 10000,
+        help     = "Number of super-frames per case",
+    )
+
+    parser.add_argument(
+        "--loops",
+        type     = int,
+        required = False,
+        default  = 1,
+        help     = "Number of passes over the generated super-frames per case",
+    )
+
+    parser.add_argument(
+        "--payloadSize",
+        type     = argInts,
+        required = False,
+        default  = [64, 1024, 16384],
+        help     = "Comma separated camera payload sizes in bytes",
+    )
+
+    parser.add_argument(
+        "--eventsPerBatch",
+        type     = argInts,
+        required = False,
+        default  = [1, 8, 32],
+        help     = "Comma separated number of events per super-frame",
+    )
+
+    parser.add_argument(
+        "--numChannels",
+        type     = argInts,
+        required = False,
+        default  = [1],
+        help     = "Comma separated number of camera payload channels per event",
+    )
+
+    parser.add_argument(
+        "--consumer",
+        type     = str,
+        required = False,
+        default  = 'debug,stats,batchDebug,batchStats',
+        help     = "Comma separated consumers: debug (DataDebug), stats (StreamStats), eventBuilder (PulseIdEventBuilder), "
+                   "batchDebug/batchStats (same consumers behind SuperFrameUnbatcher)",
+    )
+
+    parser.add_argument(
+        "--json",
+        type     = str,
+        required = False,
+        default  = None,
+        help     = "Write the results to this JSON file for comparison between versions",
+    )
+
+    # Get the arguments
+    args = parser.parse_args()
+
+    #################################################################
+
+    results = []
+    for payloadSize, eventsPerBatch, numChannels, consumer in itertools.product(
+            args.payloadSize, args.eventsPerBatch, args.numChannels, args.consumer.split(',')):
+        results.append(runCase(args.count, payloadSize, eventsPerBatch, numChannels, consumer, args.loops))
+
+    print(f'Rogue version: {rogue.Version.current()}, Python: {sys.version.split()[0]}')
+    printTable(results)
+
+    if args.json is not None:
+        with open(args.json, 'w') as f:
+            json.dump({
+                'RogueVersion' : rogue.Version.current(),
+                'Results'      : results,
+            }, f, indent=2)
+
+    #################################################################
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+#-----------------------------------------------------------------------------
+# This file is part of the 'lcls2-pgp-pcie-apps'. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the 'lcls2-pgp-pcie-apps', including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+
+import setupLibPaths
+
+import time
+import argparse
+
+import lcls2_pgp_pcie_apps
+
+#################################################################
+
+if __name__ == "__main__":
+
+    # Set the argument parser
+    parser = argparse.ArgumentParser(description='Starts one DevRoot per PCIe card concurrently and serves them headless')
+
+    # Convert str to bool
+    argBool = lambda s: s.lower() in ['true', 't', 'yes', '1']
+
+    parser.add_argument(
+        "--devs",
+        type     = str,
+        required = False,
+        default  = '/dev/datadev_0,/dev/datadev_1',
+        help     = "Comma separated paths to the PCIe devices",
+    )
+
+    parser.add_argument(
+        "--pgp4",
+        type     = argBool,
+        required = False,
+        default  = False,
+        help     = "True = PGP4, False = PGP2b",
+    )
+
+    parser.add_argument(
+        "--startupMode",
+        type     = argBool,
+        required = False,
+        default  = False,
+        help     = "False = LCLS-I timing mode, True = LCLS-II timing mode",
+    )
+
+    parser.add_argument(
+        "--standAloneMode",
+        type     = argBool,
+        required = False,
+        default  = False,
+        help     = "False = using fiber timing, True = locally generated timing",
+    )
+
+    parser.add_argument(
+        "--dataVc",
+        type     = int,
+        required = False,
+        default  = 1,
+        help     = "Data VC to tap on every lane",
+    )
+
+    parser.add_argument(
+        "--pollEn",
+        type     = argBool,
+        required = False,
+        default  = True,
+        help     = "Enable auto-polling",
+    )
+
+    parser.add_argument(
+        "--initRead",
+        type     = argBool,
+        required = False,
+        default  = True,
+        help     = "Enable read all variables at start",
+    )
+
+    parser.add_argument(
+        "--minimalTree",
+        type     = argBool,
+        required = False,
+        default  = False,
+        help     = "Only build the timing tree selected by --startupMode",
+    )
+
+    parser.add_argument(
+        "--fastStart",
+        type     = argBool,
+        required = False,
+        default  = False,
+        help     = "Restore from a cached snapshot when the hardware still matches it",
+    )
+
+    parser.add_argument(
+        "--diffConfig",
+        type     = argBool,
+        required = False,
+        default  = False,
+        help     = "Load the YAML through the compiled write list",
+    )
+
+    parser.add_argument(
+        "--processes",
+        type     = argBool,
+        required = False,
+        default  = True,
+        help     = "True = one process per card driven over its ZMQ server, False = all roots on threads of this process",
+    )
+
+    parser.add_argument(
+        "--transitions",
+        type     = int,
+        required = False,
+        default  = 0,
+        help     = "StartRun/StopRun pairs to time on all cards after start, then exit",
+    )
+
+    # Get the arguments
+    args = parser.parse_args()
+
+    #################################################################
+
+    with lcls2_pgp_pcie_apps.DevRootGroup(
+            devs           = args.devs.split(','),
+            pgp4           = args.pgp4,
+            startupMode    = args.startupMode,
+            standAloneMode = args.standAloneMode,
+            enLclsI        = not args.startupMode,
+            enLclsII       = args.startupMode,
+            dataVc         = args.dataVc,
+            pollEn         = args.pollEn,
+            initRead       = args.initRead,
+            minimalTree    = args.minimalTree,
+            fastStart      = args.fastStart,
+            diffConfig     = args.diffConfig,
+            processes      = args.processes,
+        ) as group:
+
+        for dev, address in group.addresses.items():
+            print(f'{dev}: ZMQ server {address}')
+        print()
+        print(group.formatTable())
+        print()
+
+        if args.transitions > 0:
+            for _ in range(args.transitions):
+                group.StartRun()
+                group.StopRun()
+            print(group.formatTable())
+
+        else:
+            # Wait to be killed via Ctrl-C
+            print('Running root servers.  Hit Ctrl-C to exit')
+            try:
+                while True:
+                    time.sleep(1)
+            except:
+                pass
+            print('Stopping root servers...')
+
+    #################################################################
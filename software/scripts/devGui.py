@@ -11,6 +11,7 @@
 
 import os
 import sys
+import time
 import argparse
 import importlib
 import rogue
@@ -59,6 +60,22 @@ if __name__ == "__main__":
         help     = "Enable LCLS-II hardware registers",
     )
 
+    parser.add_argument(
+        "--minimalTree",
+        type     = argBool,
+        required = False,
+        default  = False,
+        help     = "Only build the timing tree selected by --startupMode, ignoring --enLclsI/--enLclsII",
+    )
+
+    parser.add_argument(
+        "--numLanes",
+        type     = int,
+        required = False,
+        default  = 4,
+        help     = "Number of application lanes to build",
+    )
+
     parser.add_argument(
         "--yamlFileLclsI",
         type     = str,
@@ -107,6 +124,22 @@ if __name__ == "__main__":
         help     = "Enable auto-polling",
     )
 
+    parser.add_argument(
+        "--pollScheduler",
+        type     = argBool,
+        required = False,
+        default  = False,
+        help     = "Use the tiered poll scheduler (fast counters, link status, static build info) instead of the pyrogue poll thread",
+    )
+
+    parser.add_argument(
+        "--pollMaxRate",
+        type     = int,
+        required = False,
+        default  = 1000,
+        help     = "Poll scheduler register bus budget in transactions per second",
+    )
+
     parser.add_argument(
         "--initRead",
         type     = argBool,
@@ -147,6 +180,109 @@ if __name__ == "__main__":
         help     = "Sets the GUI type (PyDM or PyQt)",
     )
 
+    parser.add_argument(
+        "--fastStart",
+        type     = argBool,
+        required = False,
+        default  = False,
+        help     = "Skip the start-up read-backs and YAML load when a cached snapshot for this firmware build and YAML matches the hardware",
+    )
+
+    parser.add_argument(
+        "--diffConfig",
+        type     = argBool,
+        required = False,
+        default  = False,
+        help     = "Load the default YAML through the compiled write list, writing only the registers that differ from the hardware",
+    )
+
+    parser.add_argument(
+        "--zmqAddr",
+        type     = str,
+        required = False,
+        default  = '127.0.0.1',
+        help     = "ZMQ server interface, '*' = all interfaces (remote run control)",
+    )
+
+    parser.add_argument(
+        "--zmqPort",
+        type     = int,
+        required = False,
+        default  = 0,
+        help     = "ZMQ server base port, 0 = first free port from 9099",
+    )
+
+    parser.add_argument(
+        "--zmqWindow",
+        type     = float,
+        required = False,
+        default  = None,
+        help     = "Merge variable updates over this many seconds per ZMQ publish (default: publish every update cycle)",
+    )
+
+    parser.add_argument(
+        "--zmqSubtree",
+        action   = 'append',
+        default  = None,
+        help     = "Add a ZMQ server publishing only this subtree (e.g. DevPcie.Application.AppLane[0]), can be repeated",
+    )
+
+    parser.add_argument(
+        "--metricsPort",
+        type     = int,
+        required = False,
+        default  = None,
+        help     = "With --guiType None, serve Prometheus metrics on http://localhost:<port>/metrics (0 = any free port)",
+    )
+
+    parser.add_argument(
+        "--metricsFile",
+        type     = str,
+        required = False,
+        default  = None,
+        help     = "With --guiType None, append a JSON metrics snapshot to this size-rotated file every --metricsPeriod",
+    )
+
+    parser.add_argument(
+        "--metricsPeriod",
+        type     = float,
+        required = False,
+        default  = 1.0,
+        help     = "Metrics snapshot period in seconds",
+    )
+
+    parser.add_argument(
+        "--busProfile",
+        type     = str,
+        required = False,
+        default  = None,
+        help     = "Profile every register transaction and write <prefix>.txt (report) and <prefix>.folded (flame graph) at exit",
+    )
+
+    parser.add_argument(
+        "--fifoSampleRate",
+        type     = float,
+        required = False,
+        default  = None,
+        help     = "With --ddr, sample the DMA FIFO fill levels at this rate in Hz (see the DmaFifoReport command)",
+    )
+
+    parser.add_argument(
+        "--fifoDepth",
+        type     = int,
+        required = False,
+        default  = None,
+        help     = "DMA FIFO depth in frames, enables the Peak% and near-full statistics of --fifoSampleRate",
+    )
+
+    parser.add_argument(
+        "--counterEngine",
+        type     = argBool,
+        required = False,
+        default  = False,
+        help     = "Track the counters without resetting them: StartRun marks the run start instead of CountReset (see the CounterReport command)",
+    )
+
     parser.add_argument(
         "--ddr",
         action   = 'store_true',
@@ -183,19 +319,37 @@ if __name__ == "__main__":
     with lcls2_pgp_pcie_apps.DevRoot(
             dev            = args.dev,
             pollEn         = args.pollEn,
+            pollScheduler  = args.pollScheduler,
+            pollMaxRate    = args.pollMaxRate,
             initRead       = args.initRead,
             pgp4           = args.pgp4,
             dataVc         = args.dataVc,
             enLclsI        = (args.enLclsII or not args.startupMode),
             enLclsII       = (args.enLclsII or args.startupMode),
+            minimalTree    = args.minimalTree,
+            numLanes       = args.numLanes,
             yamlFileLclsI  = args.yamlFileLclsI,
             yamlFileLclsII = args.yamlFileLclsII,
             startupMode    = args.startupMode,
             standAloneMode = args.standAloneMode,
             pcieBoardType  = args.pcieBoardType,
             useDdr         = args.ddr,
+            fastStart      = args.fastStart,
+            diffConfig     = args.diffConfig,
+            zmqAddr        = args.zmqAddr,
+            zmqPort        = args.zmqPort,
+            zmqWindow      = args.zmqWindow,
+            zmqSubtrees    = args.zmqSubtree,
+            busProfile     = (args.busProfile is not None),
+            fifoSampleRate = args.fifoSampleRate,
+            fifoDepth      = args.fifoDepth,
+            counterEngine  = args.counterEngine,
         ) as root:
 
+        print(f'ZMQ server: {root.zmqServer.address}')
+        for path, server in root.zmqSubtreeServers.items():
+            print(f'ZMQ server for {path}: {server.address}')
+
         ######################
         # Development PyDM GUI
         ######################
@@ -211,6 +365,21 @@ if __name__ == "__main__":
         #################
         elif (args.guiType == 'None'):
 
+            # Headless counter export
+            exporter = None
+            if (args.metricsPort is not None) or (args.metricsFile is not None):
+                exporter = lcls2_pgp_pcie_apps.MetricsExporter(
+                    root     = root,
+                    period   = args.metricsPeriod,
+                    port     = args.metricsPort,
+                    fileName = args.metricsFile,
+                )
+                exporter._start()
+                if exporter.address is not None:
+                    print(f'Serving metrics on {exporter.address}')
+                if args.metricsFile is not None:
+                    print(f'Writing metrics to {args.metricsFile}')
+
             # Wait to be killed via Ctrl-C
             print('Running root server.  Hit Ctrl-C to exit')
             try:
@@ -219,6 +388,8 @@ if __name__ == "__main__":
             except:
                 pass
             print('Stopping root server...')
+            if exporter is not None:
+                exporter._stop()
             root.stop()
 
         ####################
@@ -227,5 +398,12 @@ if __name__ == "__main__":
         else:
             raise ValueError("Invalid GUI type (%s)" % (args.guiType) )
 
+    # Register transaction profile of the whole session
+    if args.busProfile is not None:
+        with open(f'{args.busProfile}.txt', 'w') as f:
+            f.write(root.busProfiler.report() + '\n')
+        root.busProfiler.dump(f'{args.busProfile}.folded')
+        print(f'Bus profile written to {args.busProfile}.txt and {args.busProfile}.folded')
+
 
     #################################################################
@@ -17,20 +17,29 @@ import sys
 import argparse
 import importlib
 import rogue
+import numpy as np
 import pyrogue as pr
-import l2si_core
+
+import lcls2_pgp_pcie_apps
 
 # rogue.Logging.setLevel(rogue.Logging.Warning)
 
 #################################################################
 
+# Deepest --fifoNoCopy queue per (lane, VC): every queued frame holds a DMA buffer from the driver pool
+NOCOPY_MAX_DEPTH = 32
+
 class DataDebug(rogue.interfaces.stream.Slave):
     def __init__(self, name, enPrint):
         rogue.interfaces.stream.Slave.__init__(self)
 
+        # l2si_core pulls in the whole device library, only load it when the debug consumer is used
+        l2si_core = importlib.import_module('l2si_core')
+
         self.channelData = [[] for _ in range(8)]
         self.name = name
         self.enPrint = enPrint
+        self.parseEventHeaderFrame = l2si_core.parseEventHeaderFrame
 
     def _acceptFrame(self, frame):
         channel = frame.getChannel()
@@ -38,7 +47,7 @@ class DataDebug(rogue.interfaces.stream.Slave):
         if channel == 0 or channel == 1:
             if self.enPrint:
                 print('-------------------------')
-            d = l2si_core.parseEventHeaderFrame(frame,self.enPrint)
+            d = self.parseEventHeaderFrame(frame,self.enPrint)
             if self.enPrint:
                 print(d)
                 if channel == 1:
@@ -46,32 +55,162 @@ class DataDebug(rogue.interfaces.stream.Slave):
                     print()
 
         if channel == 2:
-            frameSize = frame.getPayload()
-            ba = bytearray(frameSize)
-            frame.read(ba, 0)
+            # Only touch the payload when it is going to be printed
             if self.enPrint:
-                print(f"Raw camera data channel - {len(ba)} bytes")
+                frameSize = frame.getPayload()
+                print(f"Raw camera data channel - {frameSize} bytes")
                 print(frame.getNumpy(0, frameSize))
                 print('-------------------------')
         if self.enPrint:
             print()
 
+    def acceptBatch(self, buff, table):
+        # SuperFrameUnbatcher batch handler: headers decoded for the whole batch at once,
+        # always, like _acceptFrame parses every header frame
+        headers = lcls2_pgp_pcie_apps.decodeSuperFrameHeaders(buff, table=table)
+        if not self.enPrint:
+            return
+
+        print('-------------------------')
+        print(headers)
+
+        for i in np.flatnonzero(table['dest'] == 2):
+            data = lcls2_pgp_pcie_apps.subFrameView(buff, table, i)
+            print(f"Raw camera data channel - {data.size} bytes")
+            print(data)
+        print('-------------------------')
+        print()
+
 class myRoot(pr.Root):
     def __init__(self,
-                dev    = '/dev/datadev_0',
-                dataVc = 1,
+                dev          = '/dev/datadev_0',
+                dataVc       = 1,
+                mode         = 'debug', # debug = DataDebug per-frame consumer, stats = zero-copy StreamStats counters
+                eventBuilder = False, # Correlate the event headers and payloads by pulseId after the unbatcher
+                record       = None,  # File prefix for recording the unbatched frames of each lane
+                replay       = None,  # File prefix of a recording to replay instead of reading the DMA lanes
+                replayRate   = 'max', # 'max', 'original' or a fixed rate in Hz
+                unbatcher    = 'splitter', # splitter = rogue SplitterV1, numpy = SuperFrameUnbatcher (one callback per super-frame)
+                vcs          = None,  # VCs to open on every lane, each with its own DMA channel and queue (None = dataVc only)
+                fifoDepth    = 1000,  # Frames queued per (lane, VC) between the DMA receive thread and the consumer
+                fifoNoCopy   = False, # Queue the DMA buffers themselves instead of copies (depth capped at NOCOPY_MAX_DEPTH)
+                reduce       = None,  # FrameReducer arguments (width, rois, ...) to reduce the camera frames of each lane
+                fanout       = None,  # Shared-memory ring name prefix, publishes the unbatched frames of each lane to local readers
+                fanoutSlots  = 1024,  # Frames held per ring before the oldest is overwritten
+                fanoutSize   = 1<<20, # Largest frame (bytes) a ring slot holds
                 **kwargs):
         super().__init__(**kwargs)
 
+        if unbatcher == 'numpy' and (eventBuilder or record is not None):
+            raise ValueError('The numpy unbatcher does not produce sub-frames for --eventBuilder/--record')
+
+        if vcs is not None and replay is not None:
+            raise ValueError('Recordings only hold the data VC, --vcs can not be used with --replay')
+
         # Create arrays to be filled
         self.dmaStreams = [None for lane in range(4)]
-        self._dbg       = [DataDebug(name='DataDebug',enPrint=False) for lane in range(4)]
-        self.unbatchers = [rogue.protocols.batcher.SplitterV1() for lane in range(4)]
+        self.vcStats    = {}
+        self.vcFifos    = {}
+        self._vcDmas    = {}
+        if unbatcher == 'numpy':
+            self.unbatchers = [lcls2_pgp_pcie_apps.SuperFrameUnbatcher() for lane in range(4)]
+        else:
+            self.unbatchers = [rogue.protocols.batcher.SplitterV1() for lane in range(4)]
+
+        if mode == 'stats':
+            self._dbg = [lcls2_pgp_pcie_apps.StreamStats(name=f'Lane[{lane}]') for lane in range(4)]
+        else:
+            self._dbg = [DataDebug(name='DataDebug',enPrint=False) for lane in range(4)]
 
         # Connect the streams
         for lane in range(4):
-            self.dmaStreams[lane] = rogue.hardware.axi.AxiStreamDma(dev,(0x100*lane)+dataVc,1)
-            self.dmaStreams[lane] >> self.unbatchers[lane] >> self._dbg[lane]
+            if replay is not None:
+                reader = lcls2_pgp_pcie_apps.StreamReader(f'{replay}.lane{lane}')
+                self.dmaStreams[lane] = lcls2_pgp_pcie_apps.StreamReplay(lcls2_pgp_pcie_apps.ReaderEvents(reader),rate=replayRate)
+                self.addInterface(self.dmaStreams[lane])
+            elif vcs is not None:
+                self.dmaStreams[lane] = self._openVc(dev,lane,dataVc,fifoDepth,fifoNoCopy)
+            else:
+                self.dmaStreams[lane] = rogue.hardware.axi.AxiStreamDma(dev,(0x100*lane)+dataVc,1)
+            if unbatcher == 'numpy':
+                self.dmaStreams[lane] >> self.unbatchers[lane]
+                self.unbatchers[lane].addBatchHandler(self._dbg[lane].acceptBatch)
+            else:
+                self.dmaStreams[lane] >> self.unbatchers[lane] >> self._dbg[lane]
+
+        # Side-channel VCs: every (lane, VC) has its own DMA receive thread and
+        # queue, so a slow consumer on one VC never stalls the others
+        self.sideStats = {}
+        for vc in sorted(set(vcs or [])):
+            if vc == dataVc:
+                continue
+            for lane in range(4):
+                self.sideStats[(lane,vc)] = lcls2_pgp_pcie_apps.StreamStats(name=f'Lane[{lane}].Vc[{vc}].Consumer')
+                self._openVc(dev,lane,vc,fifoDepth,fifoNoCopy) >> self.sideStats[(lane,vc)]
+
+        # Optional pulseId event builder in parallel with the consumer
+        if eventBuilder:
+            self.eventBuilders = [lcls2_pgp_pcie_apps.PulseIdEventBuilder(name=f'EventBuilder[{lane}]',lane=lane) for lane in range(4)]
+            for lane in range(4):
+                self.unbatchers[lane] >> self.eventBuilders[lane]
+        else:
+            self.eventBuilders = []
+
+        # Optional online camera reduction in parallel with the consumer
+        if reduce is not None:
+            self.reducers = [lcls2_pgp_pcie_apps.FrameReducer(**reduce) for lane in range(4)]
+            for lane in range(4):
+                if unbatcher == 'numpy':
+                    self.unbatchers[lane].addBatchHandler(self.reducers[lane].acceptBatch)
+                else:
+                    self.unbatchers[lane] >> self.reducers[lane]
+            self.addInterface(*self.reducers)
+        else:
+            self.reducers = []
+
+        # Optional shared-memory fan-out in parallel with the consumer: each lane is
+        # received once here and any number of local FrameRingReader processes map it
+        if fanout is not None:
+            self.fanouts = [lcls2_pgp_pcie_apps.FrameRingWriter(f'{fanout}_lane{lane}',numSlots=fanoutSlots,slotSize=fanoutSize) for lane in range(4)]
+            for lane in range(4):
+                if unbatcher == 'numpy':
+                    self.unbatchers[lane].addBatchHandler(self.fanouts[lane].acceptBatch)
+                else:
+                    self.unbatchers[lane] >> self.fanouts[lane]
+            self.addInterface(*self.fanouts)
+        else:
+            self.fanouts = []
+
+        # Optional recording sink in parallel with the consumer
+        if record is not None:
+            self.recorders = [lcls2_pgp_pcie_apps.StreamRecorder(fileName=f'{record}.lane{lane}') for lane in range(4)]
+            for lane in range(4):
+                self.unbatchers[lane] >> self.recorders[lane]
+            self.addInterface(*self.recorders)
+        else:
+            self.recorders = []
+
+    def _openVc(self,dev,lane,vc,fifoDepth,fifoNoCopy):
+        # DMA channel >> per (lane, VC) receive counters, and >> a dropping
+        # queue whose own thread feeds the consumer (returned). Copy mode hands
+        # every DMA buffer straight back to the driver. Queued DMA buffers are
+        # shared by all lanes of the card, so the no-copy depth is capped.
+        if fifoNoCopy:
+            fifoDepth = min(fifoDepth,NOCOPY_MAX_DEPTH)
+        self._vcDmas[(lane,vc)] = rogue.hardware.axi.AxiStreamDma(dev,(0x100*lane)+vc,1)
+        self.vcStats[(lane,vc)] = lcls2_pgp_pcie_apps.StreamStats(name=f'Lane[{lane}].Vc[{vc}]')
+        self.vcFifos[(lane,vc)] = rogue.interfaces.stream.Fifo(fifoDepth,0,fifoNoCopy)
+
+        self._vcDmas[(lane,vc)] >> self.vcStats[(lane,vc)]
+        self._vcDmas[(lane,vc)] >> self.vcFifos[(lane,vc)]
+        return self.vcFifos[(lane,vc)]
+
+    def vcTable(self):
+        # Per (lane, VC) queue depth and drop counts
+        lines = [f'{"Lane/VC":<16} {"Queued":>8} {"Dropped":>10}']
+        for (lane,vc), fifo in sorted(self.vcFifos.items()):
+            lines.append(f'{f"Lane[{lane}].Vc[{vc}]":<16} {fifo.size():>8} {fifo.dropCnt():>10}')
+        return '\n'.join(lines)
 
 if __name__ == "__main__":
 
@@ -100,6 +239,168 @@ if __name__ == "__main__":
         help     = "VC used for the data path",
     )
 
+    parser.add_argument(
+        "--mode",
+        type     = str,
+        required = False,
+        default  = 'debug',
+        choices  = ['debug', 'stats'],
+        help     = "debug = per-frame DataDebug consumer, stats = per-lane/per-channel rate table",
+    )
+
+    parser.add_argument(
+        "--interval",
+        type     = float,
+        required = False,
+        default  = 1.0,
+        help     = "Statistics table print interval in seconds (stats mode)",
+    )
+
+    parser.add_argument(
+        "--processes",
+        type     = argBool,
+        required = False,
+        default  = False,
+        help     = "stats mode only: read each lane in its own worker process and aggregate through shared memory",
+    )
+
+    parser.add_argument(
+        "--eventBuilder",
+        type     = argBool,
+        required = False,
+        default  = False,
+        help     = "Correlate event headers and camera data by pulseId and report orphan/late counts",
+    )
+
+    parser.add_argument(
+        "--record",
+        type     = str,
+        required = False,
+        default  = None,
+        help     = "Record the unbatched frames of each lane to <record>.lane<N>.dat/.idx",
+    )
+
+    parser.add_argument(
+        "--replay",
+        type     = str,
+        required = False,
+        default  = None,
+        help     = "Replay a --record file prefix instead of reading the DMA lanes (no hardware needed)",
+    )
+
+    parser.add_argument(
+        "--replayRate",
+        type     = str,
+        required = False,
+        default  = 'max',
+        help     = "Replay rate: max, original (recorded timestamps) or a fixed rate in Hz",
+    )
+
+    parser.add_argument(
+        "--unbatcher",
+        type     = str,
+        required = False,
+        default  = 'splitter',
+        choices  = ['splitter', 'numpy'],
+        help     = "splitter = rogue SplitterV1 (one callback per sub-frame), numpy = one callback per super-frame with numpy views",
+    )
+
+    parser.add_argument(
+        "--vcs",
+        type     = str,
+        required = False,
+        default  = None,
+        help     = "Comma separated VCs to open on every lane (e.g. 1,2), each with its own receive thread, queue and counters",
+    )
+
+    parser.add_argument(
+        "--fifoDepth",
+        type     = int,
+        required = False,
+        default  = 1000,
+        help     = "Frames queued per (lane, VC) with --vcs before frames are dropped (copies, the DMA buffers are returned at once)",
+    )
+
+    parser.add_argument(
+        "--fifoNoCopy",
+        type     = argBool,
+        required = False,
+        default  = False,
+        help     = f"Queue the DMA buffers instead of copies: saves a copy per frame, but a slow consumer holds driver buffers "
+                   f"shared by every lane, so the depth is capped at {NOCOPY_MAX_DEPTH}",
+    )
+
+    parser.add_argument(
+        "--reduceWidth",
+        type     = int,
+        required = False,
+        default  = None,
+        help     = "Enable the online camera reduction, with this many pixels per image row",
+    )
+
+    parser.add_argument(
+        "--reduceDtype",
+        type     = str,
+        required = False,
+        default  = '<u2',
+        help     = "Camera pixel type for the reduction",
+    )
+
+    parser.add_argument(
+        "--reduceRoi",
+        action   = 'append',
+        default  = [],
+        help     = "Reduction ROI as row0:row1,col0:col1, can be repeated",
+    )
+
+    parser.add_argument(
+        "--reduceSaturation",
+        type     = int,
+        required = False,
+        default  = None,
+        help     = "Pixel value counted as saturated",
+    )
+
+    parser.add_argument(
+        "--reduceDecimate",
+        type     = int,
+        required = False,
+        default  = 1,
+        help     = "Only reduce every Nth camera frame",
+    )
+
+    parser.add_argument(
+        "--reduceWorkers",
+        type     = int,
+        required = False,
+        default  = 2,
+        help     = "Reduction worker processes per lane",
+    )
+
+    parser.add_argument(
+        "--fanout",
+        type     = str,
+        required = False,
+        default  = None,
+        help     = "Publish the unbatched frames of each lane to the shared-memory ring <fanout>_lane<N> for local readers",
+    )
+
+    parser.add_argument(
+        "--fanoutSlots",
+        type     = int,
+        required = False,
+        default  = 1024,
+        help     = "Frames held per --fanout ring before a lagging reader starts dropping",
+    )
+
+    parser.add_argument(
+        "--fanoutSize",
+        type     = int,
+        required = False,
+        default  = 1<<20,
+        help     = "Largest frame in bytes a --fanout ring slot holds",
+    )
+
     parser.add_argument(
         "--releaseZip",
         type     = str,
@@ -113,9 +414,77 @@ if __name__ == "__main__":
 
     #################################################################
 
-    with myRoot(dev=args.dev,dataVc=args.dataVc) as root:
+    vcs = [int(vc,0) for vc in args.vcs.split(',')] if args.vcs is not None else None
+
+    reduce = None
+    if args.reduceWidth is not None:
+        reduce = {
+            'width'         : args.reduceWidth,
+            'dtype'         : args.reduceDtype,
+            'rois'          : [[int(v) for v in roi.replace(',',':').split(':')] for roi in args.reduceRoi],
+            'saturation'    : args.reduceSaturation,
+            'decimate'      : args.reduceDecimate,
+            'numWorkers'    : args.reduceWorkers,
+            'mergeInterval' : args.interval,
+        }
+
+    if args.mode == 'stats' and args.processes:
+
+        if vcs is not None:
+            raise ValueError('--vcs is not supported with --processes')
+
+        with lcls2_pgp_pcie_apps.LaneWorkerPool(dev=args.dev,dataVc=args.dataVc) as pool:
+            reporter = lcls2_pgp_pcie_apps.StatsReporter()
+            for lane in pool.lanes:
+                reporter.addSource(f'Lane[{lane}]', lambda lane=lane: pool.snapshot(lane))
+
+            while(1):
+                time.sleep(args.interval)
+                reporter.report()
+
+                for lane, alive in pool.alive().items():
+                    if not alive:
+                        raise RuntimeError(f'LaneWorker[{lane}] exited')
+
+    with myRoot(dev=args.dev,dataVc=args.dataVc,mode=args.mode,eventBuilder=args.eventBuilder,record=args.record,replay=args.replay,replayRate=args.replayRate,unbatcher=args.unbatcher,vcs=vcs,fifoDepth=args.fifoDepth,fifoNoCopy=args.fifoNoCopy,reduce=reduce,fanout=args.fanout,fanoutSlots=args.fanoutSlots,fanoutSize=args.fanoutSize) as root:
+
+        def printReducers():
+            for lane, reducer in enumerate(root.reducers):
+                print(lcls2_pgp_pcie_apps.FrameReducer.formatSummary(f'Lane[{lane}]', reducer.counters, reducer.results()))
+            if root.reducers:
+                print()
+            if root.fanouts:
+                print(lcls2_pgp_pcie_apps.FrameRingWriter.formatTable(root.fanouts))
+                print()
+
+        if args.mode == 'stats':
+            reporter = lcls2_pgp_pcie_apps.StatsReporter()
+            for stats in root._dbg:
+                reporter.addSource(stats.name, stats.snapshot)
+            for stats in list(root.vcStats.values()) + list(root.sideStats.values()):
+                reporter.addSource(stats.name, stats.snapshot)
+
+            while(1):
+                time.sleep(args.interval)
+                reporter.report()
+                if vcs is not None:
+                    print(root.vcTable())
+                    print()
+                printReducers()
+                if root.eventBuilders:
+                    print(lcls2_pgp_pcie_apps.PulseIdEventBuilder.formatTable(root.eventBuilders))
+                    print()
+
+        elif root.eventBuilders or root.reducers or root.fanouts:
+            while(1):
+                time.sleep(args.interval)
+                if root.eventBuilders:
+                    print(lcls2_pgp_pcie_apps.PulseIdEventBuilder.formatTable(root.eventBuilders))
+                    print()
+                printReducers()
 
-        while(1):
-            time.sleep(0.001)
+        else:
+            while(1):
+                time.sleep(0.001)
 
     #################################################################
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+#-----------------------------------------------------------------------------
+# This file is part of the 'lcls2-pgp-pcie-apps'. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the 'lcls2-pgp-pcie-apps', including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+
+import setupLibPaths
+
+import time
+import argparse
+import collections
+
+import lcls2_pgp_pcie_apps
+
+#################################################################
+
+if __name__ == "__main__":
+
+    # Set the argument parser
+    parser = argparse.ArgumentParser(description='Attaches to a printEventStream.py --fanout ring and prints per-channel rates')
+
+    parser.add_argument(
+        "--ring",
+        type     = str,
+        required = True,
+        help     = "Ring name, <fanout>_lane<N>",
+    )
+
+    parser.add_argument(
+        "--interval",
+        type     = float,
+        required = False,
+        default  = 1.0,
+        help     = "Seconds between prints",
+    )
+
+    parser.add_argument(
+        "--delay",
+        type     = float,
+        required = False,
+        default  = 0.0,
+        help     = "Seconds of simulated work per frame, to watch a slow reader lag and drop",
+    )
+
+    # Get the arguments
+    args = parser.parse_args()
+
+    #################################################################
+
+    with lcls2_pgp_pcie_apps.FrameRingReader(args.ring) as reader:
+        frames  = collections.Counter()
+        nbytes  = collections.Counter()
+        torn    = 0
+        last    = time.monotonic()
+
+        while(1):
+            frame = reader.next(timeout=args.interval)
+
+            if frame is not None:
+                if args.delay:
+                    time.sleep(args.delay)
+
+                # A frame the writer overwrote while it was in use is not counted
+                if frame.valid():
+                    frames[frame.channel] += 1
+                    nbytes[frame.channel] += frame.data.size
+                else:
+                    torn += 1
+
+            now = time.monotonic()
+            if now - last >= args.interval:
+                dt = now - last
+                for ch in sorted(frames):
+                    print(f'{args.ring} Ch[{ch}]: {frames[ch]/dt:10.1f} frames/s {nbytes[ch]/dt/1e6:10.3f} MB/s')
+                print(f'{args.ring}: lag {reader.lag}, drops {reader.drops}, overwritten in use {torn}')
+                print()
+                frames.clear()
+                nbytes.clear()
+                last = now